@@ -1,20 +1,55 @@
 # backend/app/main.py
-from datetime import datetime
-
+import asyncio
 import os
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 
-from fastapi import FastAPI
+from fastapi import Body, FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any
-import json
-from pathlib import Path
-from collections import Counter, defaultdict
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from triage import background
+from triage.analytics import coalesced_analytics, coalesced_cluster_model, normalize_analytics_params
+from triage.background import start_background_workers, stop_background_workers
+from triage.encoding import encode_json, etag_matches
+from triage.evaluation import (
+    EVAL_MAX_CONCURRENCY,
+    EVAL_MODEL_CLIENT,
+    MODEL_CLIENTS,
+    EvaluationJob,
+    evaluation_jobs,
+    start_job,
+)
+from triage.extraction import extract_cached, extract_corpus
+from triage.metrics import render_metrics
+from triage.offload import Overloaded, analytics_pool, lab_flight
+from triage.pagination import (
+    NOTES_LAB_MAX_LIMIT,
+    decode_cursor,
+    encode_cursor,
+    iter_ndjson,
+    parse_fields,
+    project,
+)
+from triage.registry import DEFAULT_CORPUS, corpus_registry, current_corpus
+from triage.search import SEARCH_MAX_LIMIT, highlight_snippet
+from triage.simulation import SIMULATE_POLICIES, simulate_clinic
+from triage.sweep import compute_sweep, parse_grid
+from triage.timing import TimingMiddleware, span
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    start_background_workers()
+    try:
+        yield
+    finally:
+        stop_background_workers()
 
-import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 
-app = FastAPI(title="Clinic Analytics API")
+app = FastAPI(title="Clinic Analytics API", lifespan=lifespan)
 
 # Vite dev server is typically :5173, while other local apps may run on :3000.
 cors_origins_env = os.getenv("CORS_ORIGINS", "")
@@ -32,569 +67,487 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ============================================================
-# INPUT FILE DISCOVERY
-# ============================================================
-APP_DIR = Path(__file__).resolve().parent                  # .../triaging-simulation/backend/app
-BACKEND_DIR = APP_DIR.parent                               # .../triaging-simulation/backend
-TRIAGE_ROOT = BACKEND_DIR.parent                           # .../triaging-simulation
-WORKSPACE_ROOT = TRIAGE_ROOT.parent                        # .../case-study
 
+app.add_middleware(TimingMiddleware)
 
-def get_json_paths():
+
+def overloaded_response(e: Overloaded) -> Response:
+    return Response(
+        content=encode_json({"error": str(e)}),
+        status_code=503,
+        media_type="application/json",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+@app.get("/notes/analytics")
+async def notes_analytics(
+    request: Request,
+    n_clusters: int = 4,
+    smooth_window: int = 3,
+    alpha: float = 0.90,
+    length_mode: str = "truncate",  # truncate|pad|error
+    max_individual_curves: int = 60,
+    max_curve_points: int = 60,
+    clustering: str = "kmeans",  # kmeans|minibatch|dtw|auto
+    warm_start: bool = False,
+    bootstrap: int = 0,
+    bootstrap_recluster: bool = False,
+    bootstrap_ci: float = 0.95,
+    bootstrap_seed: int = 0,
+    response_format: str = Query("json", alias="format"),  # json|columnar
+    curve_sampling: str = "linspace",  # linspace|lttb
+    bands: bool = False,
+    corpus: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Discover batch-note JSON files from likely locations.
-    Primary location is `backend/app/mock-notes`.
-    Use `MOCK_NOTES_DIR` to override directory and
-    `MOCK_NOTES_GLOB` to override filename pattern.
+    Run analytics on discovered batch-note JSON files.
+    Query params control your interactive knobs.
+    `bootstrap=B` adds confidence intervals for every policy metric.
+    `format=columnar` returns per-cluster metrics as parallel arrays and
+    the policy frontier once, as a matrix.
+    `curve_sampling=lttb` keeps each curve's shape when downsampling (kept
+    points come with their `x` indices), and `bands=true` adds per-cluster
+    p10/p25/p50/p75/p90 bands; with `max_individual_curves=0` they replace
+    the sampled curves.
+    Responses carry an ETag; a matching `If-None-Match` returns 304.
+    Returns 503 with `Retry-After` while the analytics queue is full.
     """
-    env_dir = os.getenv("MOCK_NOTES_DIR", "").strip()
-    pattern = os.getenv("MOCK_NOTES_GLOB", "batch_notes_eval_*.json")
-
-    candidate_dirs = []
-    if env_dir:
-        candidate_dirs.append(Path(env_dir))
-    candidate_dirs.extend([
-        APP_DIR / "mock-notes",
-        BACKEND_DIR / "mock-notes",
-        TRIAGE_ROOT / "mock-notes",
-        WORKSPACE_ROOT / "mock-notes",
-        WORKSPACE_ROOT / "output",
-    ])
-
-    for directory in candidate_dirs:
-        if not directory.exists() or not directory.is_dir():
-            continue
-
-        matches = sorted(directory.glob(pattern))
-        if matches:
-            return [p.resolve() for p in matches]
-
-    searched = [str(d.resolve()) for d in candidate_dirs]
-    raise FileNotFoundError(
-        f"No JSON files found with pattern '{pattern}'. "
-        f"Searched directories: {searched}. "
-        "Set MOCK_NOTES_DIR to override."
-    )
+    try:
+        with corpus_registry.use(corpus):
+            etag, body = await coalesced_analytics(
+                n_clusters=n_clusters,
+                smooth_window=smooth_window,
+                alpha=alpha,
+                length_mode=length_mode,
+                max_individual_curves=max_individual_curves,
+                max_curve_points=max_curve_points,
+                clustering=clustering,
+                warm_start=warm_start,
+                bootstrap=bootstrap,
+                bootstrap_recluster=bootstrap_recluster,
+                bootstrap_ci=bootstrap_ci,
+                bootstrap_seed=bootstrap_seed,
+                response_format=response_format,
+                curve_sampling=curve_sampling,
+                bands=bands,
+            )
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return {"error": str(e)}
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-# ------------------------------------------------------------
-# Helpers (ported from your scripts)
-# ------------------------------------------------------------
-def moving_average(arr, window=3):
-    arr = np.asarray(arr, dtype=float)
-    if len(arr) < window or window <= 1:
-        return arr
-    kernel = np.ones(window) / window
-    return np.convolve(arr, kernel, mode="same")
-
-
-def stopping_point_fraction(cumulative, alpha=0.9):
-    cumulative = np.asarray(cumulative, dtype=float)
-    if cumulative.size == 0:
-        return 0
-    target = alpha * cumulative[-1]
-    return int(np.argmax(cumulative >= target))
-
-
-def optimal_audit_Q(D_cluster, T_max):
-    D_cluster = np.asarray(D_cluster, dtype=float)
-    D_cluster = D_cluster[~np.isnan(D_cluster)]
-    if D_cluster.size == 0:
-        return None, None, None, None
-
-    Qs = np.arange(1, T_max + 1)
-    F = np.array([(D_cluster <= Q).mean() for Q in Qs])
-    expected_delivered = Qs * F + T_max * (1 - F)
-    Q_star = int(Qs[np.argmin(expected_delivered)])
-    return Q_star, Qs, expected_delivered, F
-
-
-def expected_delivered_given_Q(D_cluster, Q, T_max):
-    D_cluster = np.asarray(D_cluster, dtype=float)
-    D_cluster = D_cluster[~np.isnan(D_cluster)]
-    if D_cluster.size == 0:
-        return float(T_max)
-    delivered = np.where(Q < D_cluster, T_max, Q)
-    return float(np.mean(delivered))
-
-
-def q_mean_policy(D_cluster, method="round", T_max=1):
-    D_cluster = np.asarray(D_cluster, dtype=float)
-    D_cluster = D_cluster[~np.isnan(D_cluster)]
-    if D_cluster.size == 0:
-        return int(T_max)
-
-    m = float(np.mean(D_cluster))
-    if method == "round":
-        q = int(np.round(m))
-    elif method == "ceil":
-        q = int(np.ceil(m))
-    elif method == "floor":
-        q = int(np.floor(m))
-    else:
-        raise ValueError("method must be one of: round, ceil, floor")
-
-    return int(np.clip(q, 1, T_max))
-
-
-def truncate_to_min_length(curves):
-    m = min(len(c) for c in curves)
-    return [c[:m] for c in curves]
-
-
-def pad_to_max_length(curves):
-    m = max(len(c) for c in curves)
-    out = []
-    for c in curves:
-        if len(c) == m:
-            out.append(c)
-        else:
-            pad = np.full((m - len(c),), np.nan, dtype=float)
-            out.append(np.concatenate([c, pad]))
-    return out
-
-
-def downsample(arr, max_points=60):
-    arr = np.asarray(arr, dtype=float)
-    if arr.size <= max_points:
-        return arr
-    idx = np.linspace(0, arr.size - 1, max_points).astype(int)
-    return arr[idx]
-
-
-def load_all_jsons():
-    json_paths = get_json_paths()
-    data = []
-    per_file_raw = {}
-    per_file_has_deltas = Counter()
-    per_file_missing_deltas = Counter()
-    per_file_lengths = defaultdict(list)
-
-    for p in json_paths:
-        if not p.exists():
-            raise FileNotFoundError(f"Missing file: {p.resolve()}")
-
-        with p.open("r", encoding="utf-8") as f:
-            chunk = json.load(f)
-
-        if not isinstance(chunk, list):
-            raise ValueError(f"{p} did not load to a list (got {type(chunk)}).")
-
-        per_file_raw[p.name] = len(chunk)
-
-        for child in chunk:
-            if isinstance(child, dict):
-                child["_source_file"] = p.name
-                gpt_deltas = child.get("gpt_deltas")
-                if gpt_deltas and isinstance(gpt_deltas, list) and len(gpt_deltas) > 0:
-                    per_file_has_deltas[p.name] += 1
-                    per_file_lengths[p.name].append(len(gpt_deltas))
-                else:
-                    per_file_missing_deltas[p.name] += 1
-
-        data.extend(chunk)
-
-    per_file = []
-    for p in json_paths:
-        name = p.name
-        lens = per_file_lengths[name]
-        per_file.append({
-            "file": name,
-            "path": str(p),
-            "total": int(per_file_raw.get(name, 0)),
-            "with_gpt_deltas": int(per_file_has_deltas.get(name, 0)),
-            "missing_or_empty_gpt_deltas": int(per_file_missing_deltas.get(name, 0)),
-            "min_len": int(min(lens)) if lens else None,
-            "max_len": int(max(lens)) if lens else None,
-        })
-
-    return data, per_file, json_paths
-
-
-def _safe_int(value, default=0):
+
+@app.get("/notes/analytics/sweep")
+async def notes_analytics_sweep(
+    n_clusters: str = "4",
+    smooth_window: str = "3",
+    alpha: str = "0.90",
+    length_mode: str = "truncate",
+    corpus: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Evaluate a parameter grid in one call. Each query param takes a
+    comma-separated list, e.g. `?n_clusters=3,4,5&alpha=0.8,0.9`.
+    Returns one table row per grid point.
+    Runs on the analytics pool; returns 503 with `Retry-After` while its
+    queue is full.
+    """
     try:
-        return int(value)
-    except Exception:
-        return default
+        grid = {
+            "n_clusters": parse_grid(n_clusters, int, 4),
+            "smooth_window": parse_grid(smooth_window, int, 3),
+            "alpha": parse_grid(alpha, float, 0.90),
+            "length_mode": parse_grid(length_mode, str, "truncate"),
+        }
+        with corpus_registry.use(corpus):
+            return await analytics_pool.run(compute_sweep, current_corpus().name, grid)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return {"error": str(e)}
 
 
-def _parse_created_at(generator_json_path: str) -> str:
+@app.post("/notes/analytics/predict")
+async def notes_analytics_predict(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     """
-    Parse `output/notes_YYYYMMDD_HHMMSS.json` into `YYYY-MM-DD`.
+    Assign a new child to a cluster and its audit policy using the model
+    fitted for the current corpus version.
+    Body: { gpt_deltas[], n_clusters?, smooth_window?, alpha?, length_mode?, clustering?, corpus? }
+    A model not fitted yet is fitted on the analytics pool; returns 503 with
+    `Retry-After` while its queue is full.
     """
-    name = Path(str(generator_json_path)).name
-    if not name.startswith("notes_"):
-        return ""
     try:
-        stem = Path(name).stem  # notes_YYYYMMDD_HHMMSS
-        date_token = stem.split("_")[1]
-        dt = datetime.strptime(date_token, "%Y%m%d")
-        return dt.strftime("%Y-%m-%d")
-    except Exception:
-        return ""
+        gpt_deltas = payload.get("gpt_deltas")
+        if not isinstance(gpt_deltas, list) or not gpt_deltas:
+            raise ValueError("gpt_deltas must be a non-empty list of numbers")
+
+        params = dict(normalize_analytics_params(**{
+            k: payload[k]
+            for k in ("n_clusters", "smooth_window", "alpha", "length_mode", "clustering")
+            if k in payload
+        }))
+        with corpus_registry.use(payload.get("corpus")):
+            model = await coalesced_cluster_model(**params)
 
+        return {
+            "config": model.params,
+            "prediction": model.predict(gpt_deltas),
+        }
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return {"error": str(e)}
 
-def _make_snippet(note_text: str, max_chars: int = 150) -> str:
-    flat = " ".join(str(note_text).split())
-    if len(flat) <= max_chars:
-        return flat
-    return flat[: max_chars - 1] + "…"
+
+@app.post("/simulate")
+async def simulate(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """
+    Monte Carlo clinic capacity simulation under the per-cluster audit
+    policies of the analytics model.
+    Body: { weeks?, replications?, arrivals_per_week?, clinicians?,
+            slots_per_clinician?, initial_waitlist?, policies?[qstar|qmean|none],
+            Q_overrides?{cluster: Q}, seed?,
+            n_clusters?, smooth_window?, alpha?, length_mode?, clustering?, corpus? }
+    Returns per-week waitlist and utilization distributions (mean, p10,
+    p50, p90 across replications), time-to-service and totals per policy.
+    Returns 503 with `Retry-After` while the model must be fitted and the
+    analytics queue is full.
+    """
+    try:
+        params = dict(normalize_analytics_params(**{
+            k: payload[k]
+            for k in ("n_clusters", "smooth_window", "alpha", "length_mode", "clustering")
+            if k in payload
+        }))
+        with span("model"), corpus_registry.use(payload.get("corpus")):
+            model = await coalesced_cluster_model(**params)
+        policies = payload.get("policies", list(SIMULATE_POLICIES))
+        if isinstance(policies, str):
+            policies = [p.strip() for p in policies.split(",") if p.strip()]
+        overrides = payload.get("Q_overrides") or {}
+        if not isinstance(overrides, dict) or any(not 0 <= int(c) < len(model.valid) for c in overrides):
+            raise ValueError("Q_overrides must map cluster ids to audit sessions")
+        with span("simulate"):
+            result = await asyncio.to_thread(
+                simulate_clinic,
+                model,
+                weeks=int(payload.get("weeks", 52)),
+                replications=int(payload.get("replications", 500)),
+                arrivals_per_week=float(payload.get("arrivals_per_week", 5.0)),
+                clinicians=int(payload.get("clinicians", 4)),
+                slots_per_clinician=int(payload.get("slots_per_clinician", 20)),
+                initial_waitlist=int(payload.get("initial_waitlist", 0)),
+                policies=list(policies),
+                overrides=overrides,
+                seed=int(payload.get("seed", 0)),
+            )
+        with span("serialize"):
+            body = encode_json(result)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        return {"error": str(e)}
+    return Response(content=body, media_type="application/json")
 
 
-def load_unionized_notes():
+@app.get("/notes/lab")
+def notes_lab(
+    request: Request,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    response_format: str = Query("json", alias="format"),  # json|ndjson
+    corpus: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Loads all discovered batch-note JSON files, extracts all generator notes, unions/deduplicates them,
-    and returns rows tailored for frontend display.
+    Returns flattened, unionized notes from discovered batch-note JSON files.
+    `limit`/`cursor` page through the (client_id, note_number) order,
+    `fields` is a comma-separated projection (e.g. drop `note` for list
+    views), and `format=ndjson` (or `Accept: application/x-ndjson`) streams
+    one note per line.
     """
-    # Keep one note per (client, note_number) across files.
-    # If the same slot appears in multiple batch files, later files win.
-    notes_by_key = {}
-    duplicates_removed = 0
-    total_before_union = 0
-
-    json_paths = get_json_paths()
-
-    for p in json_paths:
-        if not p.exists():
-            raise FileNotFoundError(f"Missing file: {p.resolve()}")
-
-        with p.open("r", encoding="utf-8") as f:
-            chunk = json.load(f)
-
-        if not isinstance(chunk, list):
-            raise ValueError(f"{p} did not load to a list (got {type(chunk)}).")
-
-        for child in chunk:
-            if not isinstance(child, dict):
-                continue
-
-            child_index = _safe_int(child.get("child_index"), 0)
-            client_num = child_index + 1
-            client_id = f"C-{client_num:04d}"
-            archetype = child.get("archetype")
-            gpt_deltas = child.get("gpt_deltas")
-            has_eval = isinstance(gpt_deltas, list) and len(gpt_deltas) > 0
-
-            gen = child.get("generator_result") or {}
-            gen_data = gen.get("data") if isinstance(gen, dict) else None
-            if not isinstance(gen_data, dict):
-                continue
-
-            trajectory_type = gen_data.get("trajectory_type")
-            notes = gen_data.get("notes")
-            if not isinstance(notes, list):
-                continue
-
-            created_at = _parse_created_at(gen.get("json", ""))
-            clinician = f"SLP-{(client_num % 12) + 1:02d}"
-            site = "Cambridge"
-            status = "evaluated" if has_eval else "extracted"
-
-            for idx, note_obj in enumerate(notes):
-                if not isinstance(note_obj, dict):
-                    continue
-
-                note_text = str(note_obj.get("note_text") or "").strip()
-                if not note_text:
-                    continue
-
-                note_number = _safe_int(note_obj.get("note_number"), idx + 1)
-                total_before_union += 1
-
-                # Union key: same client + note number.
-                # Note text can vary across reruns; we keep the newest discovered file's text.
-                union_key = (client_id, note_number)
-                if union_key in notes_by_key:
-                    duplicates_removed += 1
-
-                tags = [t for t in [archetype, trajectory_type] if t]
-                note_id = f"{client_id}-N{note_number:02d}"
-
-                notes_by_key[union_key] = {
-                    "note_id": note_id,
-                    "client_id": client_id,
-                    "created_at": created_at or "unknown",
-                    "clinician": clinician,
-                    "site": site,
-                    "status": status,
-                    "tags": tags,
-                    "snippet": _make_snippet(note_text, max_chars=150),
-                    "note": note_text,
-                    "child_index": child_index,
-                    "note_number": note_number,
-                    "archetype": archetype,
-                    "trajectory_type": trajectory_type,
-                    "source_file": p.name,
-                }
-
-    union_notes = list(notes_by_key.values())
-    union_notes.sort(key=lambda n: (n["client_id"], n["note_number"]))
-    unique_sites = sorted({n.get("site", "") for n in union_notes if n.get("site")})
-
-    return union_notes, {
-        "source_files": [str(p) for p in json_paths],
-        "total_notes_before_union": int(total_before_union),
-        "total_notes_after_union": int(len(union_notes)),
-        "duplicates_removed": int(duplicates_removed),
-        "site_options": unique_sites,
+    try:
+        wanted = parse_fields(fields)
+        after = decode_cursor(cursor)
+        if limit is not None:
+            if limit <= 0:
+                raise ValueError("limit must be a positive integer")
+            limit = min(int(limit), NOTES_LAB_MAX_LIMIT)
+
+        def load_page():
+            with span("ingest"):
+                notes = current_corpus().sync()
+            with span("page"):
+                return notes.page(after=after, limit=limit)
+
+        with corpus_registry.use(corpus) as selected:
+            rows, meta, last_key = lab_flight.do(("page", selected.name, after, limit), load_page)
+        next_cursor = encode_cursor(last_key)
+    except Exception as e:
+        return {"error": str(e)}
+
+    ndjson = response_format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+    if ndjson:
+        return StreamingResponse(
+            iter_ndjson(rows, meta, wanted, next_cursor), media_type="application/x-ndjson"
+        )
+
+    body = {
+        "notes": project(rows, wanted),
+        "meta": meta,
     }
+    if limit is not None or after is not None:
+        body["next_cursor"] = next_cursor
+    return body
 
 
-def run_analytics(
-    n_clusters=4,
-    smooth_window=3,
-    alpha=0.90,
-    length_mode="truncate",     # truncate|pad|error
-    max_individual_curves=60,
-    max_curve_points=60,
-):
-    data, per_file, json_paths = load_all_jsons()
-
-    curves = []   # cumulative curves in delta-space (length M)
-    tstars = []   # session-space demand t* (1..T_max)
-    meta = []
-    for child in data:
-        if not isinstance(child, dict):
-            continue
-        gpt_deltas = child.get("gpt_deltas")
-        if not gpt_deltas:
-            continue
-
-        smoothed = moving_average(gpt_deltas, window=smooth_window)
-        cumulative = np.cumsum(smoothed)
-
-        # t* in session space: delta index -> session index via +2
-        t_star_session = stopping_point_fraction(cumulative, alpha=alpha) + 2
-
-        curves.append(cumulative.astype(float))
-        tstars.append(float(t_star_session))
-        meta.append({
-            "child_index": child.get("child_index"),
-            "archetype": child.get("archetype"),
-            "source_file": child.get("_source_file"),
-        })
-
-    if len(curves) < n_clusters:
-        raise ValueError(f"Not enough usable trajectories ({len(curves)}) for n_clusters={n_clusters}")
-
-    lengths = [len(c) for c in curves]
-    uniq = sorted(set(lengths))
-    if len(uniq) != 1:
-        if length_mode == "error":
-            raise ValueError(f"Length mismatch: {uniq[:20]} (min={min(lengths)}, max={max(lengths)})")
-        elif length_mode == "truncate":
-            curves = truncate_to_min_length(curves)
-        elif length_mode == "pad":
-            curves = pad_to_max_length(curves)
-        else:
-            raise ValueError(f"Unknown length_mode: {length_mode}")
-
-    X = np.vstack(curves)
-
-    # If padded, handle NaNs
-    if np.isnan(X).any():
-        col_means = np.nanmean(X, axis=0)
-        inds = np.where(np.isnan(X))
-        X[inds] = np.take(col_means, inds[1])
-
-    M = X.shape[1]
-    T_max = M + 1
-
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0, n_init="auto")
-    labels = kmeans.fit_predict(X_scaled)
-
-    cluster_counts = Counter(labels)
-
-    # mean curves
-    mean_curves = []
-    for c in range(n_clusters):
-        mean_curve = X[labels == c].mean(axis=0)
-        mean_curves.append(downsample(mean_curve, max_curve_points).tolist())
-
-    # sample individual curves (light payload)
-    idxs = list(range(len(labels)))
-    if len(idxs) > max_individual_curves:
-        idxs = np.random.RandomState(0).choice(idxs, size=max_individual_curves, replace=False).tolist()
-
-    individual_curves = []
-    for i in idxs:
-        individual_curves.append({
-            "label": int(labels[i]),
-            "curve": downsample(X[i], max_curve_points).tolist(),
-            "source_file": meta[i].get("source_file"),
-            "archetype": meta[i].get("archetype"),
-        })
-
-    # Q* policy per cluster
-    tstars_np = np.asarray(tstars, float)
-
-    cluster_Qstar = {}
-    cluster_Edel = {}
-    cluster_Esaved = {}
-    cluster_Qmean = {}
-    cluster_Edel_mean = {}
-    cluster_Esaved_mean = {}
-    cluster_p_pass_opt = {}
-    cluster_p_pass_mean = {}
-    cluster_policy_frontier = {}
-    hist_tstar = {}
-    qstar_curves = {}
-
-    t_min = int(np.nanmin(tstars_np))
-    t_max = int(np.nanmax(tstars_np))
-
-    for c in range(n_clusters):
-        Dc = tstars_np[labels == c]
-        Q_star, Qs, E_delivered, F = optimal_audit_Q(Dc, T_max=T_max)
-        if Q_star is None:
-            continue
-
-        Q_mean = q_mean_policy(Dc, method="round", T_max=T_max)
-        E_del_opt = expected_delivered_given_Q(Dc, Q_star, T_max)
-        E_del_mean = expected_delivered_given_Q(Dc, Q_mean, T_max)
-        p_pass_opt = float((Dc <= Q_star).mean())
-        p_pass_mean = float((Dc <= Q_mean).mean())
-
-        cluster_Qstar[c] = int(Q_star)
-        cluster_Edel[c] = E_del_opt
-        cluster_Esaved[c] = float(T_max - E_del_opt)
-        cluster_Qmean[c] = int(Q_mean)
-        cluster_Edel_mean[c] = E_del_mean
-        cluster_Esaved_mean[c] = float(T_max - E_del_mean)
-        cluster_p_pass_opt[c] = p_pass_opt
-        cluster_p_pass_mean[c] = p_pass_mean
-
-        cluster_policy_frontier[c] = [
-            {"Q": int(q), "expected_delivered": float(ed)}
-            for q, ed in zip(Qs.tolist(), E_delivered.tolist())
-        ]
+@app.get("/notes/lab/{client_id}")
+def notes_lab_client(client_id: str, fields: Optional[str] = None, corpus: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns one client's unionized notes (e.g. `C-0001`) in note order.
+    """
+    try:
+        wanted = parse_fields(fields)
+        with corpus_registry.use(corpus) as selected:
+            rows = selected.sync().client_notes(client_id)
+        if rows is None:
+            return {"error": f"Unknown client_id: {client_id}"}
+        return {
+            "client_id": client_id,
+            "notes": project(rows, wanted),
+        }
+    except Exception as e:
+        return {"error": str(e)}
 
-        # histogram counts for t*
-        vals = Dc.astype(int).tolist()
-        counts = Counter(vals)
-        hist_tstar[c] = [{"t": t, "count": counts.get(t, 0)} for t in range(t_min, t_max + 1)]
 
-         # Store the whole curve for plotting (downsample optional; Q is small so keep full)
-        qstar_curves[c] = [
-            {"Q": int(q), "E_delivered": float(ed)}
-            for q, ed in zip(Qs.tolist(), E_delivered.tolist())
-        ]
+@app.post("/notes/evaluate")
+async def notes_evaluate(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """
+    Start a batch evaluation job.
+    Body: { prompt, note_ids[], model, temperature, concurrency, client?, corpus? }
+    -> { job_id }
+    A completed job is written as a new batch file in `EVAL_OUTPUT_DIR`.
+    """
+    try:
+        prompt = str(payload.get("prompt") or "").strip()
+        note_ids = payload.get("note_ids")
+        if not prompt:
+            raise ValueError("prompt is required")
+        if not isinstance(note_ids, list) or not note_ids:
+            raise ValueError("note_ids must be a non-empty list")
+        client_name = str(payload.get("client") or EVAL_MODEL_CLIENT)
+        if client_name not in MODEL_CLIENTS:
+            raise ValueError(f"Unknown model client: {client_name} (available: {sorted(MODEL_CLIENTS)})")
+        model = str(payload.get("model") or "stub")
+        temperature = float(payload.get("temperature") or 0.0)
+        concurrency = max(1, min(int(payload.get("concurrency") or 4), EVAL_MAX_CONCURRENCY))
+
+        corpus = corpus_registry.get(payload.get("corpus"))
+        index = await asyncio.to_thread(corpus.sync)
+        notes, errors = {}, []
+        for note_id in dict.fromkeys(str(n) for n in note_ids):
+            row = index.note(note_id)
+            if row is None:
+                errors.append({"note_id": note_id, "error": f"Unknown note_id: {note_id}"})
+            else:
+                notes[note_id] = row
+        if not notes:
+            raise ValueError("None of the note_ids exist in the current corpus")
+    except Exception as e:
+        return {"error": str(e)}
 
-    # overall expected impact
-    total_children = int(len(labels))
-    total_original = float(total_children * T_max)
-
-    expected_total_delivered = 0.0
-    expected_total_delivered_mean = 0.0
-    for c in range(n_clusters):
-        n_c = cluster_counts[c]
-        expected_total_delivered += n_c * cluster_Edel.get(c, float(T_max))
-        expected_total_delivered_mean += n_c * cluster_Edel_mean.get(c, float(T_max))
-
-    expected_total_saved = total_original - expected_total_delivered
-    expected_total_saved_mean = total_original - expected_total_delivered_mean
-
-    archetypes_overall = Counter([m.get("archetype") for m in meta if m.get("archetype") is not None])
-    archetypes_by_cluster = {}
-    for c in range(n_clusters):
-        archs = [
-            meta[i].get("archetype")
-            for i, lbl in enumerate(labels)
-            if lbl == c and meta[i].get("archetype") is not None
-        ]
-        archetypes_by_cluster[c] = dict(Counter(archs))
+    job = EvaluationJob(uuid.uuid4().hex, prompt, notes, model, temperature, concurrency, client_name, corpus)
+    job.errors.extend(errors)
+    job.failed = len(errors)
+    job.total += len(errors)
+    start_job(job)
+    return {"job_id": job.job_id}
 
-    return {
-        "config": {
-            "n_clusters": int(n_clusters),
-            "smooth_window": int(smooth_window),
-            "alpha": float(alpha),
-            "length_mode": str(length_mode),
-            "T_max_sessions": int(T_max),
-            "M_deltas": int(M),
-        },
-        "inputs": {
-            "json_paths": [str(p) for p in json_paths],
-        },
-        "per_file": per_file,
-        "clusters": {
-            "counts": {str(k): int(v) for k, v in cluster_counts.items()},
-            "mean_curves": mean_curves,
-            "individual_curves": individual_curves,
-            "hist_tstar": {str(k): v for k, v in hist_tstar.items()},
-            "policy_frontier": {str(k): v for k, v in cluster_policy_frontier.items()},
-            "Qstar": {str(k): v for k, v in cluster_Qstar.items()},
-            "E_delivered": {str(k): v for k, v in cluster_Edel.items()},
-            "E_saved": {str(k): v for k, v in cluster_Esaved.items()},
-            "Qmean": {str(k): v for k, v in cluster_Qmean.items()},
-            "E_delivered_mean": {str(k): v for k, v in cluster_Edel_mean.items()},
-            "E_saved_mean": {str(k): v for k, v in cluster_Esaved_mean.items()},
-            "p_pass_opt": {str(k): v for k, v in cluster_p_pass_opt.items()},
-            "p_pass_mean": {str(k): v for k, v in cluster_p_pass_mean.items()},
-            "archetypes_overall": dict(archetypes_overall),
-            "archetypes_by_cluster": {str(k): v for k, v in archetypes_by_cluster.items()},
-            "Qstar_curve": {str(k): v for k, v in qstar_curves.items()},
-        },
-        "overall": {
-            "total_children": total_children,
-            "total_original_sessions": total_original,
-            "expected_total_delivered": expected_total_delivered,
-            "expected_total_saved": expected_total_saved,
-            "expected_percent_saved": (expected_total_saved / total_original) if total_original > 0 else 0.0,
-            "expected_total_delivered_baseline": expected_total_delivered_mean,
-            "expected_total_saved_baseline": expected_total_saved_mean,
-            "expected_percent_saved_baseline": (expected_total_saved_mean / total_original) if total_original > 0 else 0.0,
-            "delta_saved_vs_baseline": expected_total_saved - expected_total_saved_mean,
-            "savings_improvement_vs_baseline": (
-                (expected_total_saved - expected_total_saved_mean) / expected_total_saved_mean
-            ) if expected_total_saved_mean > 0 else 0.0,
-        },
-        "notes": {
-            "tstar_definition": "first session where cumulative >= alpha * final cumulative (delta-space then mapped to session index via +2)",
-            "audit_rule": "If audit Q < demand D then deliver T_max; else stop at Q",
-        },
-    }
 
+@app.get("/notes/evaluate/{job_id}")
+def notes_evaluate_status(job_id: str, include_results: bool = True) -> Dict[str, Any]:
+    """
+    Progress and results of a batch evaluation job.
+    -> { status, progress, results[], errors[] }
+    """
+    job = evaluation_jobs.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job_id: {job_id}"}
+    return job.snapshot(include_results=include_results)
 
-@app.get("/notes/analytics")
-def notes_analytics(
-    n_clusters: int = 4,
-    smooth_window: int = 3,
-    alpha: float = 0.90,
-    length_mode: str = "truncate",  # truncate|pad|error
-    max_individual_curves: int = 60,
-    max_curve_points: int = 60,
-) -> Dict[str, Any]:
+
+@app.post("/notes/extract")
+def notes_extract(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     """
-    Run analytics on discovered batch-note JSON files.
-    Query params control your interactive knobs.
+    Rule-based extraction for one note.
+    Body: { note_id?, note_text?, corpus? } -> { note_id, extracted_json, spans[] }
+    `note_text` wins when given; otherwise the note is looked up by id.
     """
     try:
-        return run_analytics(
-            n_clusters=n_clusters,
-            smooth_window=smooth_window,
-            alpha=alpha,
-            length_mode=length_mode,
-            max_individual_curves=max_individual_curves,
-            max_curve_points=max_curve_points,
-        )
+        note_id = payload.get("note_id")
+        note_text = payload.get("note_text")
+        if note_text is None:
+            if not note_id:
+                raise ValueError("note_id or note_text is required")
+            with corpus_registry.use(payload.get("corpus")) as selected:
+                row = selected.sync().note(str(note_id))
+            if row is None:
+                raise ValueError(f"Unknown note_id: {note_id}")
+            note_text = row["note"]
+        return {"note_id": note_id, **extract_cached(str(note_text))}
     except Exception as e:
         return {"error": str(e)}
 
 
-@app.get("/notes/lab")
-def notes_lab() -> Dict[str, Any]:
+@app.post("/notes/extract/batch")
+def notes_extract_batch(payload: Dict[str, Any] = Body(default={})) -> Dict[str, Any]:
     """
-    Returns flattened, unionized notes from discovered batch-note JSON files.
+    Extraction across the unionized corpus.
+    Body: { note_ids?[], include_spans?, corpus? } -> { stats, results[], errors[] }
     """
     try:
-        notes, meta = load_unionized_notes()
-        return {
-            "notes": notes,
-            "meta": meta,
+        note_ids = payload.get("note_ids")
+        if note_ids is not None and not isinstance(note_ids, list):
+            raise ValueError("note_ids must be a list")
+        include_spans = bool(payload.get("include_spans", True))
+        with corpus_registry.use(payload.get("corpus")):
+            by_id, unknown, stats = extract_corpus(
+                None if note_ids is None else [str(n) for n in note_ids]
+            )
+        results = [
+            {"note_id": nid, "extracted_json": res["extracted_json"], **({"spans": res["spans"]} if include_spans else {})}
+            for nid, res in by_id.items()
+        ]
+        errors = [{"note_id": n, "error": f"Unknown note_id: {n}"} for n in unknown]
+        return {"stats": stats, "results": results, "errors": errors}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.get("/notes/search")
+def notes_search(
+    q: str = Query(..., min_length=1),
+    archetype: Optional[str] = None,
+    trajectory_type: Optional[str] = None,
+    clinician: Optional[str] = None,
+    status: Optional[str] = None,
+    match: str = "any",
+    limit: int = 20,
+    offset: int = 0,
+    corpus: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    BM25-ranked full-text search over unionized note texts.
+    """
+    try:
+        match = match.strip().lower()
+        if match not in ("any", "all"):
+            raise ValueError("match must be 'any' or 'all'")
+        limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+        offset = max(0, int(offset))
+        filters = {
+            field: value
+            for field, value in (
+                ("archetype", archetype),
+                ("trajectory_type", trajectory_type),
+                ("clinician", clinician),
+                ("status", status),
+            )
+            if value
         }
+        with corpus_registry.use(corpus) as selected:
+            index = selected.search_index
+            with span("index_refresh"):
+                index.refresh()
+            with span("query"):
+                total, hits = index.search(q, filters, limit=limit, offset=offset, match=match)
+        results = []
+        with span("highlight"):
+            for row, score in hits:
+                snippet, highlights = highlight_snippet(row["note"], q)
+                results.append({
+                    **{k: v for k, v in row.items() if k != "note"},
+                    "score": round(score, 6),
+                    "snippet": snippet,
+                    "highlights": highlights,
+                })
+        return {"query": q, "total": total, "limit": limit, "offset": offset, "results": results}
     except Exception as e:
         return {"error": str(e)}
+
+
+@app.get("/corpora")
+def corpora() -> Dict[str, Any]:
+    """
+    Registered corpora with their memory use against this process's share
+    of the budget (`total_budget_bytes` split over `processes`).
+    """
+    stats = corpus_registry.stats()
+    return {
+        "default": DEFAULT_CORPUS,
+        "budget_bytes": corpus_registry.budget_bytes,
+        "total_budget_bytes": corpus_registry.total_budget_bytes,
+        "processes": corpus_registry.processes,
+        "corpora": [
+            {
+                "name": c.name,
+                "dir": c.directory if c.directory is not None else os.getenv("MOCK_NOTES_DIR", "").strip() or None,
+                "glob": c.pattern if c.pattern is not None else os.getenv("MOCK_NOTES_GLOB", "batch_notes_eval_*.json"),
+                "loaded": c.incremental.version > 0,
+                **stats[c.name],
+            }
+            for c in corpus_registry.corpora()
+        ],
+    }
+
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 200 once startup warm-up has finished (immediately when
+    `WARMUP_ON_STARTUP` is off), 503 while it is still running.
+    """
+    if background.warm_up is None:
+        return {"ready": True, "warmup": "disabled"}
+    status = background.warm_up.status()
+    if not status["ready"]:
+        return Response(content=encode_json(status), status_code=503, media_type="application/json")
+    return status
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    """
+    Prometheus metrics: request and stage histograms, cache hit ratios,
+    corpus sizes and evaluation jobs.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# Keep last among GET /notes/* routes: the path parameter matches any segment.
+@app.get("/notes/{note_id}")
+def notes_get(note_id: str, corpus: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Returns a single unionized note (e.g. `C-0001-N03`) with its full text.
+    """
+    try:
+        with corpus_registry.use(corpus) as selected:
+            row = selected.sync().note(note_id)
+        if row is None:
+            return {"error": f"Unknown note_id: {note_id}"}
+        return {"note": row}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+if __name__ == "__main__":
+    # python main.py compile-sidecars [DIR]
+    from triage.cli import main as cli_main
+
+    sys.exit(cli_main())
@@ -0,0 +1 @@
+"""Analytics, ingest and note-processing internals behind `main.py`'s routes."""
@@ -0,0 +1,6 @@
+# backend/app/triage/__main__.py
+import sys
+
+from .cli import main
+
+sys.exit(main())
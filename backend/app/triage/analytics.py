@@ -0,0 +1,553 @@
+# backend/app/triage/analytics.py
+import asyncio
+from collections import Counter
+
+import numpy as np
+
+from .batches import corpus_fingerprint
+from .bootstrap import bootstrap_intervals
+from .caches import analytics_cache
+from .clustering import CLUSTERING_BACKENDS, fit_dtw_clusters, resolve_clustering
+from .encoding import encode_json, make_etag
+from .features import (
+    BAND_PERCENTILES,
+    CURVE_SAMPLERS,
+    align_curves,
+    cluster_percentile_bands,
+    evaluate_cluster_policies,
+    sample_bands,
+    sample_curves,
+)
+from .models import ClusterModel, model_store
+from .offload import analytics_flight, analytics_pool, merge_stage_timings
+from .registry import corpus_registry, current_corpus, get_json_paths
+from .timing import RequestTiming, StageClock, request_timing, span
+
+
+def cluster_model_params(n_clusters, smooth_window, alpha, length_mode, clustering):
+    return {
+        "n_clusters": int(n_clusters),
+        "smooth_window": int(smooth_window),
+        "alpha": float(alpha),
+        "length_mode": str(length_mode),
+        "clustering": str(clustering),
+    }
+
+
+def cluster_model_key(params):
+    """
+    (model params, corpus fingerprint) under which `run_analytics(**params)`
+    stores its cluster model for the current corpus.
+    """
+    corpus = current_corpus()
+    json_paths = get_json_paths(corpus)
+    fingerprint = corpus_fingerprint(json_paths)
+    notes = corpus.incremental
+    notes.sync(json_paths)
+    n_rows = sum(f["with_gpt_deltas"] for f in notes.per_file())
+    clustering = resolve_clustering(params["clustering"], n_rows)
+    model_params = cluster_model_params(
+        params["n_clusters"], params["smooth_window"], params["alpha"], params["length_mode"], clustering
+    )
+    return model_params, fingerprint
+
+
+def warm_start_centroids(model_params, scaler, M):
+    """
+    Previous corpus version's centroids for this configuration, mapped into
+    the current scaler's space; None if there is none or the width changed.
+    """
+    previous = model_store.latest(model_params)
+    if previous is None or previous.M != M:
+        return None
+    return scaler.transform(previous.raw_centroids())
+
+
+def run_analytics(
+    n_clusters=4,
+    smooth_window=3,
+    alpha=0.90,
+    length_mode="truncate",     # truncate|pad|error
+    max_individual_curves=60,
+    max_curve_points=60,
+    clustering="kmeans",        # kmeans|minibatch|dtw|auto
+    warm_start=False,
+    bootstrap=0,
+    bootstrap_recluster=False,
+    bootstrap_ci=0.95,
+    bootstrap_seed=0,
+    response_format="json",     # json|columnar
+    curve_sampling="linspace",  # linspace|lttb
+    bands=False,
+):
+    if response_format not in ("json", "columnar"):
+        raise ValueError("format must be 'json' or 'columnar'")
+    if curve_sampling not in CURVE_SAMPLERS:
+        raise ValueError(f"curve_sampling must be one of {', '.join(CURVE_SAMPLERS)}")
+    columnar = response_format == "columnar"
+    clock = StageClock()
+    corpus = current_corpus()
+    json_paths = get_json_paths(corpus)
+    fingerprint = corpus_fingerprint(json_paths)
+    clock.lap("discover")
+    notes = corpus.incremental
+    notes.sync(json_paths)
+    per_file = notes.per_file()
+    clock.lap("ingest")
+    curves, lengths, tstars, meta = notes.features(smooth_window, alpha)
+    clock.lap("smooth")
+
+    if len(lengths) < n_clusters:
+        raise ValueError(f"Not enough usable trajectories ({len(lengths)}) for n_clusters={n_clusters}")
+
+    X = align_curves(curves, lengths, length_mode)
+    clock.lap("align")
+
+    M = X.shape[1]
+    T_max = M + 1
+
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    clock.lap("scale")
+
+    clustering = resolve_clustering(clustering, len(X_scaled))
+    model_params = cluster_model_params(n_clusters, smooth_window, alpha, length_mode, clustering)
+    init = warm_start_centroids(model_params, scaler, M) if warm_start and clustering != "dtw" else None
+    dtw_info = None
+    if clustering == "dtw":
+        labels, centroids, dtw_info = fit_dtw_clusters(
+            curves, lengths, n_clusters, X_scaled, cache_key=(corpus.name, fingerprint, int(smooth_window))
+        )
+    else:
+        labels, centroids = CLUSTERING_BACKENDS[clustering](X_scaled, n_clusters, init)
+    clock.lap("cluster")
+
+    cluster_counts = Counter(labels)
+
+    # sample individual curves (light payload)
+    idxs = list(range(len(labels)))
+    if len(idxs) > max_individual_curves:
+        idxs = np.random.RandomState(0).choice(idxs, size=max_individual_curves, replace=False).tolist()
+
+    # All curves are sampled as matrices; x is None unless curve_sampling="lttb".
+    mean_x, mean_Y = sample_curves(
+        np.stack([X[labels == c].mean(axis=0) for c in range(n_clusters)]), max_curve_points, curve_sampling
+    )
+    curve_x, curve_Y = sample_curves(X[idxs], max_curve_points, curve_sampling)
+    band_x = band_Y = None
+    if bands:
+        band_x, band_Y = sample_bands(cluster_percentile_bands(X, labels, n_clusters), max_curve_points, curve_sampling)
+
+    if columnar:
+        mean_curves = mean_Y
+        individual_curves = {
+            "label": np.asarray(labels)[idxs],
+            "curve": curve_Y,
+            "source_file": [meta[i].get("source_file") for i in idxs],
+            "archetype": [meta[i].get("archetype") for i in idxs],
+        }
+        if curve_x is not None:
+            individual_curves["x"] = curve_x
+    else:
+        mean_curves = mean_Y.tolist()
+        individual_curves = []
+        for j, i in enumerate(idxs):
+            individual_curves.append({
+                "label": int(labels[i]),
+                "curve": curve_Y[j].tolist(),
+                "source_file": meta[i].get("source_file"),
+                "archetype": meta[i].get("archetype"),
+            })
+            if curve_x is not None:
+                individual_curves[-1]["x"] = curve_x[j].tolist()
+
+    clock.lap("curves")
+
+    # Q* policy per cluster
+    tstars_np = np.asarray(tstars, float)
+
+    cluster_Qstar = {}
+    cluster_Edel = {}
+    cluster_Esaved = {}
+    cluster_Qmean = {}
+    cluster_Edel_mean = {}
+    cluster_Esaved_mean = {}
+    cluster_p_pass_opt = {}
+    cluster_p_pass_mean = {}
+    cluster_policy_frontier = {}
+    hist_tstar = {}
+    qstar_curves = {}
+
+    policies = evaluate_cluster_policies(tstars_np, labels, n_clusters, T_max)
+    clock.lap("policies")
+    model_store.put(ClusterModel(
+        model_params,
+        fingerprint,
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+        centroids=centroids,
+        col_means=X.mean(axis=0),
+        Qstar=policies["Qstar"],
+        Qmean=policies["Qmean"],
+        E_delivered=policies["E_delivered"],
+        valid=policies["valid"],
+        sizes=np.bincount(labels, minlength=n_clusters),
+        F=policies["F"],
+    ))
+    clock.lap("model_store")
+    Qs = policies["Qs"].tolist()
+    hist_ts = policies["hist_t"].tolist()
+
+    for c in range(0 if columnar else n_clusters):
+        if not policies["valid"][c]:
+            continue
+
+        E_del_opt = float(policies["E_delivered"][c])
+        E_del_mean = float(policies["E_delivered_mean"][c])
+
+        cluster_Qstar[c] = int(policies["Qstar"][c])
+        cluster_Edel[c] = E_del_opt
+        cluster_Esaved[c] = float(T_max - E_del_opt)
+        cluster_Qmean[c] = int(policies["Qmean"][c])
+        cluster_Edel_mean[c] = E_del_mean
+        cluster_Esaved_mean[c] = float(T_max - E_del_mean)
+        cluster_p_pass_opt[c] = float(policies["p_pass_opt"][c])
+        cluster_p_pass_mean[c] = float(policies["p_pass_mean"][c])
+
+        E_delivered = policies["frontier"][c].tolist()
+        cluster_policy_frontier[c] = [
+            {"Q": int(q), "expected_delivered": float(ed)}
+            for q, ed in zip(Qs, E_delivered)
+        ]
+
+        # histogram counts for t*
+        hist_tstar[c] = [
+            {"t": t, "count": int(count)}
+            for t, count in zip(hist_ts, policies["hist"][c].tolist())
+        ]
+
+        # Store the whole curve for plotting (downsample optional; Q is small so keep full)
+        qstar_curves[c] = [
+            {"Q": int(q), "E_delivered": float(ed)}
+            for q, ed in zip(Qs, E_delivered)
+        ]
+
+    # overall expected impact
+    total_children = int(len(labels))
+    total_original = float(total_children * T_max)
+
+    expected_total_delivered = 0.0
+    expected_total_delivered_mean = 0.0
+    for c in range(n_clusters):
+        # E_delivered is T_max for clusters without a valid policy.
+        n_c = cluster_counts[c]
+        expected_total_delivered += n_c * float(policies["E_delivered"][c])
+        expected_total_delivered_mean += n_c * float(policies["E_delivered_mean"][c])
+
+    expected_total_saved = total_original - expected_total_delivered
+    expected_total_saved_mean = total_original - expected_total_delivered_mean
+
+    archetypes_overall = Counter([m.get("archetype") for m in meta if m.get("archetype") is not None])
+    archetypes_by_cluster = {}
+    for c in range(n_clusters):
+        archs = [
+            meta[i].get("archetype")
+            for i, lbl in enumerate(labels)
+            if lbl == c and meta[i].get("archetype") is not None
+        ]
+        archetypes_by_cluster[c] = dict(Counter(archs))
+    clock.lap("summarize")
+
+    bootstrap_block = None
+    if bootstrap:
+        bootstrap_block = bootstrap_intervals(
+            tstars_np, labels, n_clusters, T_max, bootstrap,
+            level=bootstrap_ci,
+            seed=bootstrap_seed,
+            recluster=bootstrap_recluster,
+            X_scaled=X_scaled,
+            centroids=centroids,
+            clustering=clustering,
+        )
+        clock.lap("bootstrap")
+
+    if columnar:
+        clusters = columnar_clusters(
+            policies, labels, n_clusters, T_max, mean_curves, individual_curves,
+            archetypes_overall, archetypes_by_cluster,
+        )
+    else:
+        clusters = {
+            "counts": {str(k): int(v) for k, v in cluster_counts.items()},
+            "mean_curves": mean_curves,
+            "individual_curves": individual_curves,
+            "hist_tstar": {str(k): v for k, v in hist_tstar.items()},
+            "policy_frontier": {str(k): v for k, v in cluster_policy_frontier.items()},
+            "Qstar": {str(k): v for k, v in cluster_Qstar.items()},
+            "E_delivered": {str(k): v for k, v in cluster_Edel.items()},
+            "E_saved": {str(k): v for k, v in cluster_Esaved.items()},
+            "Qmean": {str(k): v for k, v in cluster_Qmean.items()},
+            "E_delivered_mean": {str(k): v for k, v in cluster_Edel_mean.items()},
+            "E_saved_mean": {str(k): v for k, v in cluster_Esaved_mean.items()},
+            "p_pass_opt": {str(k): v for k, v in cluster_p_pass_opt.items()},
+            "p_pass_mean": {str(k): v for k, v in cluster_p_pass_mean.items()},
+            "archetypes_overall": dict(archetypes_overall),
+            "archetypes_by_cluster": {str(k): v for k, v in archetypes_by_cluster.items()},
+            "Qstar_curve": {str(k): v for k, v in qstar_curves.items()},
+        }
+        if band_Y is not None:
+            clusters["bands"] = {
+                "percentiles": list(BAND_PERCENTILES),
+                "by_cluster": {
+                    str(c): {
+                        **({"x": band_x[c].tolist()} if band_x is not None else {}),
+                        **{f"p{p}": band_Y[c, j].tolist() for j, p in enumerate(BAND_PERCENTILES)},
+                    }
+                    for c in range(n_clusters)
+                },
+            }
+    if mean_x is not None:
+        clusters["mean_curves_x"] = mean_x if columnar else mean_x.tolist()
+    if columnar and band_Y is not None:
+        clusters["bands"] = {"percentiles": np.asarray(BAND_PERCENTILES), "values": band_Y}
+        if band_x is not None:
+            clusters["bands"]["x"] = band_x
+
+    result = {
+        "config": {
+            "n_clusters": int(n_clusters),
+            "smooth_window": int(smooth_window),
+            "alpha": float(alpha),
+            "length_mode": str(length_mode),
+            "clustering": clustering,
+            "warm_start": bool(init is not None),
+            "curve_sampling": curve_sampling,
+            **({"dtw": dtw_info} if dtw_info is not None else {}),
+            "T_max_sessions": int(T_max),
+            "M_deltas": int(M),
+        },
+        "inputs": {
+            "json_paths": [str(p) for p in json_paths],
+        },
+        "per_file": per_file,
+        "clusters": clusters,
+        "overall": {
+            "total_children": total_children,
+            "total_original_sessions": total_original,
+            "expected_total_delivered": expected_total_delivered,
+            "expected_total_saved": expected_total_saved,
+            "expected_percent_saved": (expected_total_saved / total_original) if total_original > 0 else 0.0,
+            "expected_total_delivered_baseline": expected_total_delivered_mean,
+            "expected_total_saved_baseline": expected_total_saved_mean,
+            "expected_percent_saved_baseline": (expected_total_saved_mean / total_original) if total_original > 0 else 0.0,
+            "delta_saved_vs_baseline": expected_total_saved - expected_total_saved_mean,
+            "savings_improvement_vs_baseline": (
+                (expected_total_saved - expected_total_saved_mean) / expected_total_saved_mean
+            ) if expected_total_saved_mean > 0 else 0.0,
+        },
+        "notes": {
+            "tstar_definition": "first session where cumulative >= alpha * final cumulative (delta-space then mapped to session index via +2)",
+            "audit_rule": "If audit Q < demand D then deliver T_max; else stop at Q",
+        },
+    }
+    if columnar:
+        result["format"] = "columnar"
+    if bootstrap_block is not None:
+        result["bootstrap"] = bootstrap_block
+    return result
+
+
+def columnar_clusters(policies, labels, n_clusters, T_max, mean_curves, individual_curves,
+                      archetypes_overall, archetypes_by_cluster):
+    """
+    `clusters` block for `format=columnar`: one array per metric, indexed by
+    cluster id, and one `frontier` matrix over the shared `Q` axis in place
+    of `policy_frontier` / `Qstar_curve`. Entries where `valid` is false have
+    no policy and are omitted by the default format. Values stay NumPy
+    arrays; `encode_json` writes them without `.tolist()`.
+    """
+    E_del = policies["E_delivered"]
+    E_del_mean = policies["E_delivered_mean"]
+    return {
+        "counts": np.bincount(labels, minlength=n_clusters),
+        "valid": policies["valid"],
+        "mean_curves": mean_curves,
+        "individual_curves": individual_curves,
+        "Q": policies["Qs"],
+        "frontier": policies["frontier"],
+        "hist_t": policies["hist_t"],
+        "hist_tstar": policies["hist"],
+        "Qstar": policies["Qstar"],
+        "E_delivered": E_del,
+        "E_saved": T_max - E_del,
+        "Qmean": policies["Qmean"],
+        "E_delivered_mean": E_del_mean,
+        "E_saved_mean": T_max - E_del_mean,
+        "p_pass_opt": policies["p_pass_opt"],
+        "p_pass_mean": policies["p_pass_mean"],
+        "archetypes_overall": dict(archetypes_overall),
+        "archetypes_by_cluster": {str(k): v for k, v in archetypes_by_cluster.items()},
+    }
+
+
+def normalize_analytics_params(
+    n_clusters=4,
+    smooth_window=3,
+    alpha=0.90,
+    length_mode="truncate",
+    max_individual_curves=60,
+    max_curve_points=60,
+    clustering="kmeans",
+    warm_start=False,
+    bootstrap=0,
+    bootstrap_recluster=False,
+    bootstrap_ci=0.95,
+    bootstrap_seed=0,
+    response_format="json",
+    curve_sampling="linspace",
+    bands=False,
+):
+    return (
+        ("n_clusters", int(n_clusters)),
+        ("smooth_window", int(smooth_window)),
+        ("alpha", float(alpha)),
+        ("length_mode", str(length_mode).strip().lower()),
+        ("max_individual_curves", int(max_individual_curves)),
+        ("max_curve_points", int(max_curve_points)),
+        ("clustering", str(clustering).strip().lower()),
+        ("warm_start", bool(warm_start)),
+        ("bootstrap", int(bootstrap)),
+        ("bootstrap_recluster", bool(bootstrap_recluster)),
+        ("bootstrap_ci", float(bootstrap_ci)),
+        ("bootstrap_seed", int(bootstrap_seed)),
+        ("response_format", str(response_format).strip().lower()),
+        ("curve_sampling", str(curve_sampling).strip().lower()),
+        ("bands", bool(bands)),
+    )
+
+
+def cached_analytics(**params):
+    """
+    Return (etag, encoded body) for `run_analytics(**params)`, computing it
+    only when this parameter set has not been seen for the current corpus.
+    """
+    key_params = normalize_analytics_params(**params)
+    name = current_corpus().name
+    with span("fingerprint"):
+        fingerprint = corpus_fingerprint(get_json_paths())
+    key = (name, key_params, fingerprint)
+
+    with span("cache_lookup"):
+        entry = analytics_cache.get(key)
+    if entry is not None:
+        return entry
+
+    # Entries for older versions of this corpus can never be hit again.
+    analytics_cache.discard_if(lambda k: k[0] == name and k[2] != fingerprint)
+
+    result = run_analytics(**dict(key_params))
+    with span("serialize"):
+        body = encode_json(result)
+    entry = (make_etag(key_params, fingerprint), body)
+    analytics_cache.put(key, entry, size=len(body))
+    return entry
+
+
+def compute_analytics_body(corpus_name, key_params):
+    """
+    Pool entry point: the encoded analytics body for one corpus, the stage
+    timings measured here (for the caller to merge into its own request
+    timing) and the cluster model the computation fitted.
+    """
+    timing = RequestTiming()
+    token = request_timing.set(timing)
+    try:
+        with corpus_registry.use(corpus_name):
+            params = dict(key_params)
+            result = run_analytics(**params)
+            model = model_store.get(*cluster_model_key(params))
+        with span("serialize"):
+            body = encode_json(result)
+    finally:
+        request_timing.reset(token)
+    return body, list(timing.stages.items()), model
+
+
+def warm_offload_worker():
+    """
+    Pool warm-up task: import scikit-learn and parse the corpus in this worker.
+    """
+    import sklearn.cluster  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+
+    current_corpus().sync()
+
+
+async def compute_analytics(key_params, fingerprint, reuse_cached=True):
+    """
+    Compute analytics for the current corpus on `analytics_pool`, coalesced
+    per key, and cache the body. A model fitted in a worker process is added
+    to this process's model store too. With `reuse_cached`, a body cached
+    since the caller's lookup is returned without computing.
+    """
+    name = current_corpus().name
+    key = (name, key_params, fingerprint)
+
+    async def compute():
+        # A call that finished since our lookup may have filled the cache.
+        entry = analytics_cache.peek(key) if reuse_cached else None
+        if entry is not None:
+            return entry
+        analytics_cache.discard_if(lambda k: k[0] == name and k[2] != fingerprint)
+        body, stages, model = await analytics_pool.run(compute_analytics_body, name, key_params)
+        merge_stage_timings(stages, observe=analytics_pool.workers > 0)
+        if model is not None and analytics_pool.workers > 0:
+            model_store.put(model, persist=False)   # the worker already saved it
+        entry = (make_etag(key_params, fingerprint), body)
+        analytics_cache.put(key, entry, size=len(body))
+        return entry
+
+    return await analytics_flight.do_async(key, compute)
+
+
+async def coalesced_analytics(**params):
+    """
+    Async `cached_analytics`: cache misses are coalesced per key and computed
+    on `analytics_pool`. Raises `Overloaded` when the pool queue is full.
+    """
+    key_params = normalize_analytics_params(**params)
+    name = current_corpus().name
+
+    def lookup():
+        with span("fingerprint"):
+            fingerprint = corpus_fingerprint(get_json_paths())
+        with span("cache_lookup"):
+            return fingerprint, analytics_cache.get((name, key_params, fingerprint))
+
+    fingerprint, entry = await asyncio.to_thread(lookup)
+    if entry is not None:
+        return entry
+    return await compute_analytics(key_params, fingerprint)
+
+
+async def coalesced_cluster_model(**params):
+    """
+    The cluster model for analytics `params` on the current corpus. A model
+    that is not in the store is fitted by an analytics computation for
+    those params (see `compute_analytics`), so it can raise `Overloaded`.
+    """
+    def lookup():
+        model_params, fingerprint = cluster_model_key(params)
+        return model_params, fingerprint, model_store.get(model_params, fingerprint)
+
+    model_params, fingerprint, model = await asyncio.to_thread(lookup)
+    if model is None:
+        # First request for this configuration on this corpus version; the
+        # analytics body may be cached while the model was evicted.
+        await compute_analytics(normalize_analytics_params(**params), fingerprint, reuse_cached=False)
+        model = model_store.get(model_params, fingerprint)
+    if model is None:
+        raise RuntimeError("No cluster model available for this configuration.")
+    return model
@@ -0,0 +1,94 @@
+# backend/app/triage/background.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .analytics import cached_analytics, warm_offload_worker
+from .corpus import MOCK_NOTES_WATCH_SECONDS
+from .offload import analytics_pool, shutdown_cpu_pool
+from .registry import CorpusWatcher, corpus_registry, current_corpus
+from .timing import record_stage
+
+
+corpus_watcher = None
+
+
+# ============================================================
+# BACKGROUND WORKERS
+# ============================================================
+# With `WARMUP_ON_STARTUP`, a background thread pays the first-request costs
+# right after boot: it imports scikit-learn, parses the default corpus, computes the
+# default analytics result into `analytics_cache`, builds the search index
+# and starts the analytics worker processes. `GET /ready` returns 503 until
+# it has finished. A failed step is reported there but does not block
+# readiness, since requests would hit the same error anyway.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+class WarmUp(threading.Thread):
+    def __init__(self):
+        super().__init__(name="warm-up", daemon=True)
+        self.steps = OrderedDict()  # step -> {"seconds": ..., "error"?: ...}
+        self.current = None
+        self.finished = threading.Event()
+
+    def plan(self):
+        def imports():
+            import sklearn.cluster  # noqa: F401
+            import sklearn.preprocessing  # noqa: F401
+
+        return (
+            ("imports", imports),
+            ("corpus", lambda: current_corpus().sync()),
+            ("analytics", cached_analytics),
+            ("search_index", lambda: current_corpus().search_index.refresh()),
+            ("analytics_workers", lambda: analytics_pool.warm(warm_offload_worker)),
+        )
+
+    def run(self):
+        try:
+            with corpus_registry.use():
+                for name, step in self.plan():
+                    self.current = name
+                    start = time.perf_counter()
+                    error = None
+                    try:
+                        step()
+                    except Exception as e:
+                        error = str(e)
+                    elapsed = time.perf_counter() - start
+                    record_stage(f"warmup_{name}", elapsed)
+                    self.steps[name] = {"seconds": round(elapsed, 4), **({"error": error} if error else {})}
+        finally:
+            self.current = None
+            self.finished.set()
+
+    def status(self):
+        return {
+            "ready": self.finished.is_set(),
+            "current_step": self.current,
+            "steps": dict(self.steps),
+        }
+
+
+warm_up = None
+
+
+def start_background_workers():
+    global corpus_watcher, warm_up
+    if MOCK_NOTES_WATCH_SECONDS > 0 and corpus_watcher is None:
+        corpus_watcher = CorpusWatcher(corpus_registry, MOCK_NOTES_WATCH_SECONDS)
+        corpus_watcher.start()
+    if WARMUP_ON_STARTUP and warm_up is None:
+        warm_up = WarmUp()
+        warm_up.start()
+
+
+def stop_background_workers():
+    global corpus_watcher
+    if corpus_watcher is not None:
+        corpus_watcher.stop()
+        corpus_watcher = None
+    shutdown_cpu_pool()
+    analytics_pool.shutdown()
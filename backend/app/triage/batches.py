@@ -0,0 +1,472 @@
+# backend/app/triage/batches.py
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from .features import pack_ragged
+
+# ============================================================
+# PARSED CORPUS CACHE
+# ============================================================
+# Parsed batch files are kept in-process so repeated analytics / notes-lab
+# requests don't re-run `json.load` over the whole corpus. Entries are keyed
+# by path and validated against (size, mtime_ns). The budget,
+# `CORPUS_CACHE_MAX_MB` (0 disables), is measured in estimated in-memory bytes
+# of the parsed files (`parsed_nbytes`), about twice their JSON size.
+CORPUS_CACHE_MAX_BYTES = int(float(os.getenv("CORPUS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+
+def file_fingerprint(p: Path):
+    st = p.stat()
+    return (str(p), int(st.st_size), int(st.st_mtime_ns))
+
+
+def parsed_nbytes(obj):
+    """
+    Estimated memory held by a parsed JSON value: its containers, strings
+    and numbers. Dict keys are not counted; the decoder shares them between
+    objects.
+    """
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.values())
+        elif isinstance(o, list):
+            stack.extend(o)
+    return total
+
+
+def corpus_fingerprint(json_paths):
+    """
+    Identifies the current set of batch files and their on-disk versions.
+    """
+    return tuple(file_fingerprint(Path(p)) for p in json_paths)
+
+
+class CorpusCache:
+    """
+    LRU cache of parsed batch files.
+    A file is reparsed only when its (size, mtime_ns) changes; files that
+    disappear from disk are evicted on the next lookup.
+    """
+
+    def __init__(self, max_bytes=CORPUS_CACHE_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()  # path -> (fingerprint, chunk, parsed bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        _fp, _chunk, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def _evict_missing(self):
+        for key in [k for k in self._entries if not Path(k).exists()]:
+            self._drop(key)
+
+    def _evict_to_budget(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+    def load(self, p: Path):
+        """
+        Return the parsed top-level list for `p`, reusing the cached copy
+        when the file has not changed.
+        """
+        if not p.exists():
+            raise FileNotFoundError(f"Missing file: {p.resolve()}")
+        fp = file_fingerprint(p)
+        key = fp[0]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        with p.open("r", encoding="utf-8") as f:
+            chunk = json.load(f)
+
+        if not isinstance(chunk, list):
+            raise ValueError(f"{p} did not load to a list (got {type(chunk)}).")
+        nbytes = parsed_nbytes(chunk)
+
+        with self._lock:
+            self.misses += 1
+            if key in self._entries:
+                self._drop(key)
+            if nbytes <= self.max_bytes:
+                self._entries[key] = (fp, chunk, nbytes)
+                self._bytes += nbytes
+                self._evict_to_budget()
+        return chunk
+
+    def load_many(self, json_paths):
+        with self._lock:
+            self._evict_missing()
+        return [(p, self.load(p)) for p in json_paths]
+
+    def bytes_for(self, paths):
+        with self._lock:
+            return sum(self._entries[k][2] for k in map(str, paths) if k in self._entries)
+
+    def discard(self, paths):
+        with self._lock:
+            for key in [k for k in map(str, paths) if k in self._entries]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "bytes": int(self._bytes),
+                "max_bytes": int(self.max_bytes),
+                "hits": int(self.hits),
+                "misses": int(self.misses),
+            }
+
+
+corpus_cache = CorpusCache()
+
+# ============================================================
+# STREAMING BATCH READER
+# ============================================================
+# `iter_batch_children` yields the top-level children of a batch file one at
+# a time, so peak memory is bounded by the largest child rather than the
+# file. Keys in `skip_keys` (e.g. `generator_result` for analytics) are
+# scanned past without being decoded. Batch files of at least
+# `JSON_STREAMING_MIN_MB` are ingested this way instead of via `json.load`.
+JSON_STREAMING_MIN_BYTES = int(float(os.getenv("JSON_STREAMING_MIN_MB", "64")) * 1024 * 1024)
+STREAM_READ_CHARS = 1 << 20
+ANALYTICS_SKIP_KEYS = frozenset({"generator_result"})
+
+_WS = re.compile(r"[ \t\n\r]*")
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_SCALAR_END = re.compile(r"[,\]} \t\n\r]")
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_LEADING_TYPES = {"{": dict, "[": list, '"': str, "t": bool, "f": bool, "n": type(None)}
+
+
+class _StreamBuffer:
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, keep_from=None):
+        """
+        Read more text, dropping everything before `keep_from` (default: pos).
+        Returns False at EOF.
+        """
+        if self.eof:
+            return False
+        keep_from = self.pos if keep_from is None else keep_from
+        more = self.f.read(max(STREAM_READ_CHARS, len(self.buf) - keep_from))
+        self.buf = self.buf[keep_from:] + more
+        self.pos -= keep_from
+        if not more:
+            self.eof = True
+        return bool(more)
+
+    def peek(self):
+        """
+        Next non-whitespace character (not consumed), or "" at EOF.
+        """
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        ch = self.peek()
+        if not ch or ch not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return ch
+
+    def decode(self, decoder):
+        """
+        Decode one complete JSON value at pos, reading more until it fits.
+        """
+        if self.peek() not in "{[\"":
+            # A bare number/literal may continue past the buffer edge ("-0." of
+            # "-0.0025"), so make sure its delimiter has been read.
+            while _SCALAR_END.search(self.buf, self.pos) is None and self.fill():
+                pass
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def skip(self, decoder):
+        """
+        Advance past one JSON value without building it.
+        """
+        ch = self.peek()
+        if ch not in "{[\"":
+            self.decode(decoder)
+            return
+        # Values already in the buffer are fastest to decode and drop; only
+        # ones crossing the buffer edge are scanned incrementally.
+        try:
+            self.pos = decoder.raw_decode(self.buf, self.pos)[1]
+            return
+        except json.JSONDecodeError:
+            pass
+        depth = 0
+        while True:
+            m = _STRUCTURAL.search(self.buf, self.pos)
+            if m is None:
+                self.pos = len(self.buf)
+                if not self.fill():
+                    raise json.JSONDecodeError("Unterminated value", self.buf, self.pos)
+                continue
+            if m.group() == '"':
+                sm = _STRING.match(self.buf, m.start())
+                if sm is None:
+                    self.pos = m.start()
+                    if not self.fill():
+                        raise json.JSONDecodeError("Unterminated string", self.buf, self.pos)
+                    continue
+                self.pos = sm.end()
+                if depth == 0:
+                    return
+                continue
+            depth += 1 if m.group() in "[{" else -1
+            self.pos = m.end()
+            if depth == 0:
+                return
+
+
+def _decode_object(stream, decoder, skip_keys):
+    stream.expect("{")
+    obj = {}
+    if stream.peek() == "}":
+        stream.pos += 1
+        return obj
+    while True:
+        if stream.peek() != '"':
+            raise json.JSONDecodeError("Expecting property name", stream.buf, stream.pos)
+        key = stream.decode(decoder)
+        stream.expect(":")
+        if key in skip_keys:
+            stream.skip(decoder)
+        else:
+            obj[key] = stream.decode(decoder)
+        if stream.expect(",}") == "}":
+            return obj
+
+
+def iter_batch_children(p: Path, skip_keys=()):
+    """
+    Yield the elements of the top-level JSON list in `p` one at a time.
+    Dict children omit any key in `skip_keys`.
+    """
+    p = Path(p)
+    if not p.exists():
+        raise FileNotFoundError(f"Missing file: {p.resolve()}")
+    decoder = json.JSONDecoder()
+    skip_keys = frozenset(skip_keys)
+
+    with p.open("r", encoding="utf-8") as f:
+        stream = _StreamBuffer(f)
+        first = stream.peek()
+        if first != "[":
+            # Not a list: report the top-level type the way json.load would.
+            kind = _LEADING_TYPES.get(first)
+            if kind is None:
+                kind = type(json.loads(stream.buf[stream.pos:] + f.read()))
+            raise ValueError(f"{p} did not load to a list (got {kind}).")
+        stream.pos += 1
+        if stream.peek() == "]":
+            return
+        while True:
+            if skip_keys and stream.peek() == "{":
+                yield _decode_object(stream, decoder, skip_keys)
+            else:
+                yield stream.decode(decoder)
+            if stream.expect(",]") == "]":
+                return
+
+
+def is_large_batch(p: Path) -> bool:
+    return Path(p).stat().st_size >= JSON_STREAMING_MIN_BYTES
+
+
+def safe_int(value, default=0):
+    try:
+        return int(value)
+    except Exception:
+        return default
+
+
+def is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def parse_created_at(generator_json_path: str) -> str:
+    """
+    Parse `output/notes_YYYYMMDD_HHMMSS.json` into `YYYY-MM-DD`.
+    """
+    name = Path(str(generator_json_path)).name
+    if not name.startswith("notes_"):
+        return ""
+    try:
+        stem = Path(name).stem  # notes_YYYYMMDD_HHMMSS
+        date_token = stem.split("_")[1]
+        dt = datetime.strptime(date_token, "%Y%m%d")
+        return dt.strftime("%Y-%m-%d")
+    except Exception:
+        return ""
+
+
+def make_snippet(note_text: str, max_chars: int = 150) -> str:
+    note_text = str(note_text)
+    # Flattening a prefix yields a prefix of the flattened text, so long notes
+    # only need their head split.
+    head = " ".join(note_text[: 4 * max_chars].split())
+    if len(head) > max_chars:
+        return head[: max_chars - 1] + "…"
+    flat = " ".join(note_text.split())
+    if len(flat) <= max_chars:
+        return flat
+    return flat[: max_chars - 1] + "…"
+
+
+def note_rows_from_chunk(p: Path, chunk):
+    """
+    Flatten one parsed batch file into frontend note rows keyed by
+    (client_id, note_number). Within a file, later notes win.
+    Returns (rows_by_key, total_notes_seen).
+    """
+    rows = {}
+    total_before_union = 0
+
+    for child in chunk:
+        if not isinstance(child, dict):
+            continue
+
+        child_index = safe_int(child.get("child_index"), 0)
+        client_num = child_index + 1
+        client_id = f"C-{client_num:04d}"
+        archetype = child.get("archetype")
+        gpt_deltas = child.get("gpt_deltas")
+        has_eval = isinstance(gpt_deltas, list) and len(gpt_deltas) > 0
+
+        gen = child.get("generator_result") or {}
+        gen_data = gen.get("data") if isinstance(gen, dict) else None
+        if not isinstance(gen_data, dict):
+            continue
+
+        trajectory_type = gen_data.get("trajectory_type")
+        notes = gen_data.get("notes")
+        if not isinstance(notes, list):
+            continue
+
+        created_at = parse_created_at(gen.get("json", ""))
+        clinician = f"SLP-{(client_num % 12) + 1:02d}"
+        site = "Cambridge"
+        status = "evaluated" if has_eval else "extracted"
+
+        for idx, note_obj in enumerate(notes):
+            if not isinstance(note_obj, dict):
+                continue
+
+            note_text = str(note_obj.get("note_text") or "").strip()
+            if not note_text:
+                continue
+
+            note_number = safe_int(note_obj.get("note_number"), idx + 1)
+            total_before_union += 1
+
+            # Union key: same client + note number.
+            # Note text can vary across reruns; we keep the newest discovered file's text.
+            union_key = (client_id, note_number)
+
+            tags = [t for t in [archetype, trajectory_type] if t]
+            note_id = f"{client_id}-N{note_number:02d}"
+
+            rows[union_key] = {
+                "note_id": note_id,
+                "client_id": client_id,
+                "created_at": created_at or "unknown",
+                "clinician": clinician,
+                "site": site,
+                "status": status,
+                "tags": tags,
+                "snippet": make_snippet(note_text, max_chars=150),
+                "note": note_text,
+                "child_index": child_index,
+                "note_number": note_number,
+                "archetype": archetype,
+                "trajectory_type": trajectory_type,
+                "source_file": p.name,
+            }
+
+    return rows, total_before_union
+
+
+def delta_block_from_chunk(p: Path, chunk):
+    """
+    Pack the `gpt_deltas` of every usable child in one batch file (a parsed
+    list or a stream of children) into a padded matrix, plus the per-file
+    summary reported by analytics.
+    Returns ((deltas, lengths, meta), summary).
+    """
+    deltas = []
+    meta = []
+    total = 0
+    missing = 0
+    lens = []
+
+    for child in chunk:
+        total += 1
+        if not isinstance(child, dict):
+            continue
+        gpt_deltas = child.get("gpt_deltas")
+        if gpt_deltas and isinstance(gpt_deltas, list) and len(gpt_deltas) > 0:
+            lens.append(len(gpt_deltas))
+        else:
+            missing += 1
+        if gpt_deltas:
+            deltas.append(gpt_deltas)
+            meta.append({
+                "child_index": child.get("child_index"),
+                "archetype": child.get("archetype"),
+                "source_file": p.name,
+            })
+
+    summary = {
+        "file": p.name,
+        "path": str(p),
+        "total": int(total),
+        "with_gpt_deltas": int(len(lens)),
+        "missing_or_empty_gpt_deltas": int(missing),
+        "min_len": int(min(lens)) if lens else None,
+        "max_len": int(max(lens)) if lens else None,
+    }
+    return (*pack_ragged(deltas), meta), summary
@@ -0,0 +1,174 @@
+# backend/app/triage/bootstrap.py
+import os
+
+import numpy as np
+
+from . import offload
+from .clustering import CLUSTERING_BACKENDS
+from .features import evaluate_cluster_policies
+
+# ============================================================
+# BOOTSTRAP CONFIDENCE INTERVALS
+# ============================================================
+# `bootstrap=B` resamples children within their clusters (or, with
+# `bootstrap_recluster`, from the whole corpus followed by a KMeans refit
+# seeded with the fitted centroids, which keeps cluster ids aligned). Every
+# replicate is scored in one `evaluate_cluster_policies` call by treating
+# (replicate, cluster) pairs as B * k groups over a (B x n) index matrix.
+# Replicates are processed in chunks of about `BOOTSTRAP_CHUNK_DRAWS` draws.
+# Chunks run on the CPU pool (`CPU_WORKERS`) once B * n reaches
+# `BOOTSTRAP_POOL_MIN_DRAWS`. The chunk layout depends only on (B, n), so a
+# given seed gives the same intervals with any worker count.
+BOOTSTRAP_MAX = int(os.getenv("BOOTSTRAP_MAX", "10000"))
+BOOTSTRAP_CHUNK_DRAWS = int(os.getenv("BOOTSTRAP_CHUNK_DRAWS", "2000000"))
+BOOTSTRAP_POOL_MIN_DRAWS = int(os.getenv("BOOTSTRAP_POOL_MIN_DRAWS", "4000000"))
+
+BOOTSTRAP_CLUSTER_METRICS = (
+    "Qstar", "E_delivered", "E_saved", "Qmean", "E_delivered_mean", "E_saved_mean",
+    "p_pass_opt", "p_pass_mean",
+)
+BOOTSTRAP_OVERALL_METRICS = (
+    "expected_total_delivered", "expected_total_saved", "expected_percent_saved",
+    "expected_total_delivered_baseline", "expected_total_saved_baseline",
+    "expected_percent_saved_baseline", "delta_saved_vs_baseline", "savings_improvement_vs_baseline",
+)
+
+
+def bootstrap_chunk(tstars, labels, n_clusters, T_max, n_reps, seed_seq,
+                    X_scaled=None, centroids=None, clustering="kmeans"):
+    """
+    Metrics for `n_reps` bootstrap replicates: per-cluster arrays of shape
+    (n_reps, n_clusters) and overall arrays of shape (n_reps,). Invalid
+    clusters are NaN, matching their omission from `run_analytics`.
+    """
+    rng = np.random.default_rng(seed_seq)
+    tstars = np.asarray(tstars, dtype=float)
+    labels = np.asarray(labels, dtype=np.int64)
+    n, k = labels.size, int(n_clusters)
+
+    if X_scaled is None:
+        # Within-cluster resampling: column j draws from the members of
+        # child j's cluster, so cluster sizes are fixed.
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        counts = np.bincount(labels, minlength=k)
+        starts = np.cumsum(counts) - counts
+        draws = (rng.random((n_reps, n)) * counts[sorted_labels]).astype(np.int64)
+        D = tstars[order][starts[sorted_labels] + draws]
+        rep_labels = np.broadcast_to(sorted_labels, (n_reps, n))
+    else:
+        idx = rng.integers(0, n, size=(n_reps, n))
+        D = tstars[idx]
+        backend = CLUSTERING_BACKENDS[clustering]
+        rep_labels = np.stack([
+            np.asarray(backend(X_scaled[row], k, centroids)[0], dtype=np.int64) for row in idx
+        ])
+
+    groups = (np.arange(n_reps)[:, None] * k + rep_labels).ravel()
+    policies = evaluate_cluster_policies(D.ravel(), groups, n_reps * k, T_max)
+    n_all = np.bincount(groups, minlength=n_reps * k).reshape(n_reps, k)
+    valid = policies["valid"].reshape(n_reps, k)
+
+    def per_cluster(name):
+        return policies[name].reshape(n_reps, k).astype(float)
+
+    E_del = per_cluster("E_delivered")
+    E_del_mean = per_cluster("E_delivered_mean")
+    clusters = {
+        "Qstar": per_cluster("Qstar"),
+        "E_delivered": E_del,
+        "E_saved": T_max - E_del,
+        "Qmean": per_cluster("Qmean"),
+        "E_delivered_mean": E_del_mean,
+        "E_saved_mean": T_max - E_del_mean,
+        "p_pass_opt": per_cluster("p_pass_opt"),
+        "p_pass_mean": per_cluster("p_pass_mean"),
+    }
+    total_original = float(n * T_max)
+    delivered = (n_all * E_del).sum(axis=1)
+    delivered_mean = (n_all * E_del_mean).sum(axis=1)
+    saved = total_original - delivered
+    saved_mean = total_original - delivered_mean
+    with np.errstate(divide="ignore", invalid="ignore"):
+        improvement = np.where(saved_mean > 0, (saved - saved_mean) / saved_mean, 0.0)
+    overall = {
+        "expected_total_delivered": delivered,
+        "expected_total_saved": saved,
+        "expected_percent_saved": saved / total_original if total_original > 0 else np.zeros(n_reps),
+        "expected_total_delivered_baseline": delivered_mean,
+        "expected_total_saved_baseline": saved_mean,
+        "expected_percent_saved_baseline": (
+            saved_mean / total_original if total_original > 0 else np.zeros(n_reps)
+        ),
+        "delta_saved_vs_baseline": saved - saved_mean,
+        "savings_improvement_vs_baseline": improvement,
+    }
+    for values in clusters.values():
+        values[~valid] = np.nan
+    return clusters, overall
+
+
+def _interval(samples, level):
+    """
+    Percentile interval, mean and standard error of finite bootstrap samples.
+    """
+    finite = samples[np.isfinite(samples)]
+    if finite.size == 0:
+        return None
+    lo, hi = np.percentile(finite, [50 * (1 - level), 50 * (1 + level)])
+    return {
+        "mean": float(finite.mean()),
+        "se": float(finite.std(ddof=1)) if finite.size > 1 else 0.0,
+        "lo": float(lo),
+        "hi": float(hi),
+        "n": int(finite.size),
+    }
+
+
+def bootstrap_intervals(tstars, labels, n_clusters, T_max, B, level=0.95, seed=0,
+                        recluster=False, X_scaled=None, centroids=None, clustering="kmeans"):
+    """
+    Confidence intervals for every per-cluster and overall policy metric of
+    `run_analytics` from `B` bootstrap replicates.
+    """
+    B = int(B)
+    if not 1 <= B <= BOOTSTRAP_MAX:
+        raise ValueError(f"bootstrap must be between 1 and {BOOTSTRAP_MAX}")
+    if not 0 < level < 1:
+        raise ValueError("bootstrap_ci must be in (0, 1)")
+    if recluster and clustering not in CLUSTERING_BACKENDS:
+        raise ValueError(f"bootstrap_recluster is not supported with clustering={clustering}")
+    n = len(labels)
+    reps_per_chunk = max(1, BOOTSTRAP_CHUNK_DRAWS // max(n, 1))
+    sizes = [min(reps_per_chunk, B - i) for i in range(0, B, reps_per_chunk)]
+    seeds = np.random.SeedSequence(int(seed)).spawn(len(sizes))
+    extra = (X_scaled, centroids, clustering) if recluster else ()
+    jobs = [(tstars, labels, n_clusters, T_max, size, s, *extra) for size, s in zip(sizes, seeds)]
+
+    if len(jobs) > 1 and offload.CPU_WORKERS > 1 and B * n >= BOOTSTRAP_POOL_MIN_DRAWS:
+        pool = offload.get_cpu_pool()
+        chunks = [f.result() for f in [pool.submit(bootstrap_chunk, *job) for job in jobs]]
+    else:
+        chunks = [bootstrap_chunk(*job) for job in jobs]
+
+    clusters = {
+        name: np.concatenate([c[0][name] for c in chunks]) for name in BOOTSTRAP_CLUSTER_METRICS
+    }
+    overall = {
+        name: np.concatenate([c[1][name] for c in chunks]) for name in BOOTSTRAP_OVERALL_METRICS
+    }
+    return {
+        "B": B,
+        "ci": float(level),
+        "seed": int(seed),
+        "recluster": bool(recluster),
+        "clusters": {
+            name: {
+                str(c): interval
+                for c in range(int(n_clusters))
+                if (interval := _interval(values[:, c], level)) is not None
+            }
+            for name, values in clusters.items()
+        },
+        "overall": {name: _interval(values, level) for name, values in overall.items()},
+    }
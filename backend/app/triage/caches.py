@@ -0,0 +1,93 @@
+# backend/app/triage/caches.py
+import os
+import threading
+from collections import OrderedDict
+
+
+DTW_CACHE_MAX_ENTRIES = int(os.getenv("DTW_CACHE_MAX_ENTRIES", "8"))
+DTW_CACHE_MAX_BYTES = int(float(os.getenv("DTW_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+
+# ============================================================
+# ANALYTICS RESULT CACHE
+# ============================================================
+# Results are memoized per (corpus name, normalized params, corpus
+# fingerprint) as the encoded JSON body. A changed batch file changes the
+# fingerprint, so stale entries are never served and age out of the LRU. Bounded by
+# `ANALYTICS_CACHE_MAX_ENTRIES` and `ANALYTICS_CACHE_MAX_MB`.
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "64"))
+ANALYTICS_CACHE_MAX_BYTES = int(float(os.getenv("ANALYTICS_CACHE_MAX_MB", "128")) * 1024 * 1024)
+
+
+class BoundedLRU:
+    """
+    Thread-safe LRU bounded by entry count and by the summed `size` of entries.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key):
+        """
+        `get` without touching recency or hit statistics.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, value, size=0):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes or self.max_entries <= 0:
+                return
+            self._entries[key] = (value, int(size))
+            self._bytes += int(size)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def discard_if(self, predicate):
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def bytes_where(self, predicate):
+        with self._lock:
+            return sum(size for key, (_, size) in self._entries.items() if predicate(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": int(self._bytes),
+                "max_entries": int(self.max_entries),
+                "max_bytes": int(self.max_bytes),
+                "hits": int(self.hits),
+                "misses": int(self.misses),
+            }
+
+
+analytics_cache = BoundedLRU(ANALYTICS_CACHE_MAX_ENTRIES, ANALYTICS_CACHE_MAX_BYTES)
+dtw_cache = BoundedLRU(DTW_CACHE_MAX_ENTRIES, DTW_CACHE_MAX_BYTES)
@@ -0,0 +1,64 @@
+# backend/app/triage/cli.py
+import argparse
+import logging
+
+from .registry import Corpus, corpus_registry, get_json_paths
+from .sidecars import SidecarUnsupported, compile_sidecar
+
+# ============================================================
+# COMMAND LINE
+# ============================================================
+#   python -m triage compile-sidecars [DIR] [--corpus NAME] [--glob PATTERN]
+#   python main.py compile-sidecars [DIR]          (same entry point)
+#
+# Offline maintenance that the API never does on a request path. Sidecars
+# are written next to the batch files; run this after a new batch lands.
+logger = logging.getLogger("triage")
+
+
+def compile_sidecars(args):
+    if args.dir:
+        corpus = Corpus("cli", args.dir, args.glob)
+    else:
+        corpus = corpus_registry.get(args.corpus)
+    try:
+        json_paths = get_json_paths(corpus)
+    except FileNotFoundError as e:
+        if args.dir:
+            logger.error("no files matching %s in %s", args.glob, args.dir)
+        else:
+            logger.error("%s", e)
+        return 1
+
+    compiled = skipped = 0
+    for json_path in json_paths:
+        try:
+            logger.info("compiled %s", compile_sidecar(json_path))
+            compiled += 1
+        except SidecarUnsupported as e:
+            logger.warning("skipped %s: %s", json_path.name, e)
+            skipped += 1
+    logger.info("%d sidecar(s) compiled, %d skipped", compiled, skipped)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m triage", description="Offline maintenance for the notes API.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log debug output")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sidecars = commands.add_parser("compile-sidecars", help="write columnar sidecars for a corpus's batch files")
+    sidecars.add_argument("dir", nargs="?", help="batch-note directory (default: the corpus's own discovery)")
+    sidecars.add_argument("--corpus", default=None, help="registered corpus name when DIR is omitted")
+    sidecars.add_argument("--glob", default="batch_notes_eval_*.json", help="batch file pattern inside DIR")
+    sidecars.set_defaults(handler=compile_sidecars)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    try:
+        return args.handler(args)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,286 @@
+# backend/app/triage/clustering.py
+import os
+
+import numpy as np
+
+from .caches import dtw_cache
+from .timing import span
+
+# scikit-learn is imported inside the functions that fit models: it is most
+# of this package's import time, and most requests never need it.
+
+# ============================================================
+# CLUSTERING BACKENDS
+# ============================================================
+# Backends take (X_scaled, n_clusters, init_centroids) and return
+# (labels, centroids). `kmeans` is the full Lloyd fit; `minibatch` scales to
+# large corpora; `auto` picks minibatch from `CLUSTERING_MINIBATCH_MIN_ROWS`
+# rows. With `warm_start`, a fit is seeded from the centroids of the same
+# configuration on the previous corpus version, which keeps labels stable
+# across nightly batches.
+CLUSTERING_MINIBATCH_MIN_ROWS = int(os.getenv("CLUSTERING_MINIBATCH_MIN_ROWS", "50000"))
+CLUSTERING_BATCH_SIZE = int(os.getenv("CLUSTERING_BATCH_SIZE", "4096"))
+
+
+def fit_kmeans(X_scaled, n_clusters, init=None):
+    from sklearn.cluster import KMeans
+
+    if init is not None:
+        kmeans = KMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=0)
+    else:
+        kmeans = KMeans(n_clusters=n_clusters, random_state=0, n_init="auto")
+    labels = kmeans.fit_predict(X_scaled)
+    return labels, kmeans.cluster_centers_
+
+
+def fit_minibatch_kmeans(X_scaled, n_clusters, init=None):
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init=init if init is not None else "k-means++",
+        n_init=1 if init is not None else "auto",
+        batch_size=CLUSTERING_BATCH_SIZE,
+        random_state=0,
+    )
+    labels = kmeans.fit_predict(X_scaled)
+    return labels, kmeans.cluster_centers_
+
+
+CLUSTERING_BACKENDS = {
+    "kmeans": fit_kmeans,
+    "minibatch": fit_minibatch_kmeans,
+}
+
+
+# ------------------------------------------------------------
+# DTW clustering of ragged curves
+# ------------------------------------------------------------
+# `clustering=dtw` clusters the unaligned cumulative curves by dynamic time
+# warping. An 8-session and a 20-session child are then compared without
+# truncation or imputation; `length_mode` only shapes the aligned matrix
+# used for plots, T_max and the stored model. Warping stays inside a band
+# of `DTW_WINDOW` on the normalized time axis. The band is widened when
+# needed, so every pair of lengths has a path.
+#
+# k-medoids runs on a pairwise DTW matrix over at most `DTW_SAMPLE_SIZE`
+# children (CLARA-style). The matrix is cached per corpus version and
+# smooth_window, so every n_clusters reuses it. All children are then
+# assigned to their nearest medoid. Medoids are visited in LB_Keogh order,
+# and a medoid is skipped once its lower bound is no better than the best
+# DTW distance found so far.
+DTW_WINDOW = float(os.getenv("DTW_WINDOW", "0.2"))
+DTW_SAMPLE_SIZE = int(os.getenv("DTW_SAMPLE_SIZE", "1000"))
+DTW_CHUNK_PAIRS = int(os.getenv("DTW_CHUNK_PAIRS", "65536"))
+DTW_MAX_ITER = 50
+
+
+def dtw_band(m, n, window=DTW_WINDOW):
+    """
+    Inclusive column bounds (lo, hi) per row of the warping band between
+    series of lengths m (rows) and n (columns): |i/(m-1) - j/(n-1)| <= rho,
+    with rho at least one step of the shorter series. Symmetric in (m, n).
+    """
+    if m == 1 or n == 1:
+        return np.zeros(m, dtype=np.int64), np.full(m, n - 1, dtype=np.int64)
+    rho = max(float(window), 1.0 / (min(m, n) - 1))
+    u = np.arange(m) / (m - 1)
+    lo = np.clip(np.ceil((u - rho) * (n - 1) - 1e-9), 0, n - 1).astype(np.int64)
+    hi = np.clip(np.floor((u + rho) * (n - 1) + 1e-9), 0, n - 1).astype(np.int64)
+    return lo, hi
+
+
+def dtw_batch(A, B, window=DTW_WINDOW):
+    """
+    Banded DTW distance (root of the summed squared differences along the
+    best path) between A[p] and B[p]: (P, m) and (P, n) arrays, either of
+    which may have a single row to broadcast. Each DP row is one vectorized
+    min-plus scan: D[i, j] = S[j] + min over k <= j of (a[k] - S[k]), with S
+    the running cost of row i and a[k] the cost of entering (i, k) from
+    row i - 1.
+    """
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    m, n = A.shape[1], B.shape[1]
+    P = max(A.shape[0], B.shape[0])
+    lo, hi = dtw_band(m, n, window)
+    # Columns outside a row's band stay inf, so only the band slice is computed.
+    prev = np.full((P, n), np.inf)
+    prev_diag = np.full((P, n), np.inf)
+    prev_diag[:, 0] = 0.0  # virtual D[-1, -1]
+    for i in range(m):
+        a, b = lo[i], hi[i] + 1
+        cost = (A[:, i:i + 1] - B[:, a:b]) ** 2
+        running = np.cumsum(cost, axis=1)
+        enter = cost + np.minimum(prev[:, a:b], prev_diag[:, a:b])
+        cur = np.full((P, n), np.inf)
+        cur[:, a:b] = running + np.minimum.accumulate(enter - running, axis=1)
+        prev = cur
+        prev_diag = np.full((P, n), np.inf)
+        prev_diag[:, 1:] = cur[:, :-1]
+    return np.sqrt(prev[:, -1])
+
+
+def _length_groups(lengths):
+    return {int(L): np.flatnonzero(lengths == L) for L in np.unique(lengths)}
+
+
+def dtw_pairwise(curves, lengths, window=DTW_WINDOW):
+    """
+    Symmetric pairwise DTW matrix of NaN-padded curves. Pairs are batched
+    per (length, length) group, with the shorter series on the DP rows.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(lengths)
+    D = np.zeros((n, n))
+    groups = sorted(_length_groups(lengths).items())
+    for a, (La, ia) in enumerate(groups):
+        for Lb, ib in groups[a:]:
+            if La == Lb:
+                p, q = np.triu_indices(len(ia), k=1)
+                p, q = ia[p], ia[q]
+            else:
+                p = np.repeat(ia, len(ib))
+                q = np.tile(ib, len(ia))
+            for s in range(0, len(p), DTW_CHUNK_PAIRS):
+                ps, qs = p[s:s + DTW_CHUNK_PAIRS], q[s:s + DTW_CHUNK_PAIRS]
+                d = dtw_batch(curves[ps, :La], curves[qs, :Lb], window)
+                D[ps, qs] = d
+                D[qs, ps] = d
+    return D
+
+
+def lb_keogh(curves, lengths, medoid_curves, window=DTW_WINDOW):
+    """
+    (n, k) LB_Keogh lower bounds of the banded DTW distance between every
+    curve and every medoid: each point is at least as far from its match
+    as from the medoid's min/max envelope over that point's band.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    lb = np.empty((len(lengths), len(medoid_curves)))
+    for L, rows in _length_groups(lengths).items():
+        Q = curves[rows, :L]
+        for c, medoid in enumerate(medoid_curves):
+            lo, hi = dtw_band(L, len(medoid), window)
+            upper = np.array([medoid[a:b + 1].max() for a, b in zip(lo, hi)])
+            lower = np.array([medoid[a:b + 1].min() for a, b in zip(lo, hi)])
+            gap = np.maximum(Q - upper, 0.0) + np.maximum(lower - Q, 0.0)
+            lb[rows, c] = np.sqrt((gap ** 2).sum(axis=1))
+    return lb
+
+
+def dtw_assign(curves, lengths, medoid_curves, window=DTW_WINDOW):
+    """
+    Nearest medoid by banded DTW with LB_Keogh pruning. Returns (labels,
+    distances, number of DTW evaluations).
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n, k = len(lengths), len(medoid_curves)
+    lb = lb_keogh(curves, lengths, medoid_curves, window)
+    order = np.argsort(lb, axis=1, kind="stable")
+    best = np.full(n, np.inf)
+    labels = np.zeros(n, dtype=np.int64)
+    evaluated = 0
+    rows = np.arange(n)
+    for rank in range(k):
+        cand = order[:, rank]
+        todo = np.flatnonzero(lb[rows, cand] < best)
+        if todo.size == 0:
+            break
+        evaluated += todo.size
+        for L, members in _length_groups(lengths[todo]).items():
+            members = todo[members]
+            for c in np.unique(cand[members]):
+                idx = members[cand[members] == c]
+                d = dtw_batch(curves[idx, :L], medoid_curves[c][None, :], window)
+                better = d < best[idx]
+                best[idx[better]] = d[better]
+                labels[idx[better]] = c
+    return labels, best, evaluated
+
+
+def k_medoids(D, k, seed=0):
+    """
+    Alternating k-medoids on a distance matrix with k-medoids++ seeding.
+    Returns medoid row indices.
+    """
+    n = len(D)
+    rng = np.random.default_rng(seed)
+    medoids = [int(rng.integers(n))]
+    closest = D[medoids[0]].copy()
+    for _ in range(1, k):
+        weights = closest ** 2
+        total = weights.sum()
+        pick = int(rng.choice(n, p=weights / total)) if total > 0 else int(rng.integers(n))
+        medoids.append(pick)
+        closest = np.minimum(closest, D[pick])
+    medoids = np.array(medoids)
+    for _ in range(DTW_MAX_ITER):
+        labels = np.argmin(D[:, medoids], axis=1)
+        updated = medoids.copy()
+        for c in range(k):
+            members = np.flatnonzero(labels == c)
+            if members.size:
+                updated[c] = members[np.argmin(D[np.ix_(members, members)].sum(axis=1))]
+        if np.array_equal(updated, medoids):
+            break
+        medoids = updated
+    return medoids
+
+
+def fit_dtw_clusters(curves, lengths, n_clusters, X_scaled, cache_key=None, window=DTW_WINDOW):
+    """
+    DTW k-medoids labels for NaN-padded curves. Returns (labels, centroids,
+    info); centroids are the cluster means of `X_scaled`, so the stored
+    model can still place new children by Euclidean distance.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n = len(lengths)
+    if n > DTW_SAMPLE_SIZE:
+        sample = np.sort(np.random.default_rng(0).choice(n, DTW_SAMPLE_SIZE, replace=False))
+    else:
+        sample = np.arange(n)
+
+    key = None if cache_key is None else (cache_key, float(window), len(sample))
+    D = dtw_cache.get(key) if key is not None else None
+    cached = D is not None
+    if D is None:
+        with span("dtw_pairwise"):
+            D = dtw_pairwise(curves[sample], lengths[sample], window)
+        if key is not None:
+            dtw_cache.put(key, D, size=D.nbytes)
+
+    medoids = sample[k_medoids(D, n_clusters)]
+    medoid_curves = [curves[m, :lengths[m]] for m in medoids]
+    with span("dtw_assign"):
+        labels, _, evaluated = dtw_assign(curves, lengths, medoid_curves, window)
+
+    centroids = np.stack([
+        X_scaled[labels == c].mean(axis=0) if np.any(labels == c) else X_scaled[medoids[c]]
+        for c in range(n_clusters)
+    ])
+    info = {
+        "window": float(window),
+        "sample_size": int(len(sample)),
+        "pairwise_cached": cached,
+        "medoids": medoids.tolist(),
+        "dtw_evaluations": int(evaluated),
+        "pruned_fraction": float(1.0 - evaluated / max(n * n_clusters, 1)),
+    }
+    return labels, centroids, info
+
+
+def resolve_clustering(clustering, n_rows):
+    clustering = str(clustering).strip().lower()
+    if clustering == "auto":
+        return "minibatch" if n_rows >= CLUSTERING_MINIBATCH_MIN_ROWS else "kmeans"
+    if clustering not in CLUSTERING_BACKENDS and clustering != "dtw":
+        raise ValueError(
+            f"Unknown clustering backend: {clustering} (use one of {sorted(CLUSTERING_BACKENDS)}, dtw or auto)"
+        )
+    return clustering
+
+
+def fit_cluster_labels(X_scaled, n_clusters, clustering="kmeans"):
+    backend = CLUSTERING_BACKENDS[resolve_clustering(clustering, len(X_scaled))]
+    return backend(X_scaled, n_clusters)[0]
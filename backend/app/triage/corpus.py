@@ -0,0 +1,276 @@
+# backend/app/triage/corpus.py
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .batches import (
+    ANALYTICS_SKIP_KEYS,
+    corpus_cache,
+    delta_block_from_chunk,
+    file_fingerprint,
+    is_large_batch,
+    iter_batch_children,
+    note_rows_from_chunk,
+    parsed_nbytes,
+)
+from .features import trajectory_features
+from .sidecars import delta_block_from_columns, load_batch_columns, note_rows_from_columns
+from .timing import span
+
+# ============================================================
+# INCREMENTAL INGEST
+# ============================================================
+# The union index and per-file trajectory features persist across requests.
+# `sync` stats the discovered files and only re-derives files whose
+# fingerprint changed, so a nightly batch costs work proportional to its own
+# size. Set `MOCK_NOTES_WATCH_SECONDS` to also poll the directory in the
+# background.
+MOCK_NOTES_WATCH_SECONDS = float(os.getenv("MOCK_NOTES_WATCH_SECONDS", "0") or 0)
+FEATURE_PARAMS_PER_FILE = 8
+
+
+class IncrementalCorpus:
+    """
+    Persistent `(client_id, note_number)` union and trajectory features.
+    Later files (in discovery order) win each union slot.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._order = []            # path strs in discovery order
+        self._rank = {}             # path str -> position in _order
+        self._fingerprints = {}     # path str -> file fingerprint
+        self._rows_by_file = {}     # path str -> {union_key: row}
+        self._row_bytes = {}        # path str -> `parsed_nbytes` of its rows
+        self._before_by_file = {}   # path str -> notes seen before union
+        self._deltas_by_file = {}   # path str -> ((deltas, lengths, meta), summary)
+        self._features = {}         # path str -> OrderedDict[(window, alpha)] -> block
+        self._key_files = {}        # union_key -> set of path strs containing it
+        self.notes_by_key = {}
+        self._sorted_keys = []
+        self._rows = None
+        self._meta = None
+        self._by_client = {}        # client_id -> rows sorted by note_number
+        self._by_note_id = {}       # note_id -> row
+        self.version = 0
+        self.resident_bytes = 0     # see `_measure`; read without the lock
+
+    def _ingest(self, p: Path):
+        cols, chunk = load_batch_columns(p)
+        if cols is not None:
+            rows, before = note_rows_from_columns(p, cols)
+            return rows, before, delta_block_from_columns(p, cols)
+        if chunk is None and is_large_batch(p):
+            rows, before = note_rows_from_chunk(p, iter_batch_children(p))
+            block = delta_block_from_chunk(p, iter_batch_children(p, ANALYTICS_SKIP_KEYS))
+            return rows, before, block
+        if chunk is None:
+            chunk = corpus_cache.load(p)
+        rows, before = note_rows_from_chunk(p, chunk)
+        return rows, before, delta_block_from_chunk(p, chunk)
+
+    def _resolve(self, key):
+        files = self._key_files.get(key)
+        if not files:
+            self._key_files.pop(key, None)
+            self.notes_by_key.pop(key, None)
+            return
+        owner = max(files, key=self._rank.__getitem__)
+        self.notes_by_key[key] = self._rows_by_file[owner][key]
+
+    def sync(self, json_paths):
+        """
+        Apply new, changed and removed batch files. Returns True when the
+        union or feature inputs changed.
+        """
+        paths = [Path(p) for p in json_paths]
+        for p in paths:
+            if not p.exists():
+                raise FileNotFoundError(f"Missing file: {p.resolve()}")
+        fps = {str(p): file_fingerprint(p) for p in paths}
+        new_order = [str(p) for p in paths]
+
+        with self._lock:
+            changed = [p for p in paths if self._fingerprints.get(str(p)) != fps[str(p)]]
+            removed = [k for k in self._order if k not in fps]
+            if not changed and not removed and new_order == self._order:
+                return False
+
+            # Parse first so a bad file leaves the index untouched.
+            with span("parse"):
+                ingested = {str(p): self._ingest(p) for p in changed}
+
+            affected = set()
+            for key in removed + list(ingested):
+                old_rows = self._rows_by_file.pop(key, {})
+                for union_key in old_rows:
+                    self._key_files[union_key].discard(key)
+                affected.update(old_rows)
+                self._before_by_file.pop(key, None)
+                self._row_bytes.pop(key, None)
+                self._deltas_by_file.pop(key, None)
+                self._features.pop(key, None)
+                self._fingerprints.pop(key, None)
+
+            self._order = new_order
+            self._rank = {k: i for i, k in enumerate(new_order)}
+
+            for key, (rows, before, deltas) in ingested.items():
+                self._rows_by_file[key] = rows
+                self._row_bytes[key] = parsed_nbytes(rows)
+                self._before_by_file[key] = before
+                self._deltas_by_file[key] = deltas
+                self._fingerprints[key] = fps[key]
+                for union_key in rows:
+                    self._key_files.setdefault(union_key, set()).add(key)
+                affected.update(rows)
+
+            had = set(self.notes_by_key)
+            for union_key in affected:
+                self._resolve(union_key)
+
+            added = [k for k in affected if k in self.notes_by_key and k not in had]
+            dropped = [k for k in affected if k in had and k not in self.notes_by_key]
+            if len(added) + len(dropped) > len(self._sorted_keys) // 8:
+                self._sorted_keys = sorted(self.notes_by_key)
+            else:
+                for union_key in dropped:
+                    del self._sorted_keys[bisect.bisect_left(self._sorted_keys, union_key)]
+                for union_key in added:
+                    bisect.insort(self._sorted_keys, union_key)
+
+            self._rows = None
+            self.version += 1
+            self._measure()
+            return True
+
+    def _measure(self):
+        # Note rows at their estimated in-memory size, as in `CorpusCache`;
+        # NumPy blocks at their real size.
+        total = sum(self._row_bytes.values())
+        for (deltas, lengths, _meta), _summary in self._deltas_by_file.values():
+            total += deltas.nbytes + lengths.nbytes
+        for per_params in self._features.values():
+            for block in per_params.values():
+                total += sum(a.nbytes for a in block[:3])
+        self.resident_bytes = int(total)
+
+    def files(self):
+        # `_order` is replaced, never mutated, so this needs no lock.
+        return list(self._order)
+
+    def stats(self):
+        """
+        Sizes as of the last sync; never triggers ingest itself.
+        """
+        with self._lock:
+            return {
+                "files": len(self._order),
+                "notes": len(self.notes_by_key),
+                "notes_before_union": sum(self._before_by_file.values()),
+                "children": sum(len(block[0][1]) for block in self._deltas_by_file.values()),
+                "version": self.version,
+            }
+
+    def _materialize(self):
+        if self._rows is None:
+            self._rows = [self.notes_by_key[k] for k in self._sorted_keys]
+            total_before = sum(self._before_by_file.get(k, 0) for k in self._order)
+            self._meta = {
+                "source_files": list(self._order),
+                "total_notes_before_union": int(total_before),
+                "total_notes_after_union": int(len(self._rows)),
+                "duplicates_removed": int(total_before - len(self._rows)),
+                "site_options": sorted({n.get("site", "") for n in self._rows if n.get("site")}),
+            }
+            self._by_client = {}
+            self._by_note_id = {}
+            for row in self._rows:
+                self._by_client.setdefault(row["client_id"], []).append(row)
+                self._by_note_id[row["note_id"]] = row
+
+    def union(self):
+        """
+        Return (sorted union rows, union meta) for the last synced files.
+        """
+        with self._lock:
+            self._materialize()
+            return list(self._rows), dict(self._meta)
+
+    def page(self, after=None, limit=None):
+        """
+        Keyset page of the sorted union: up to `limit` rows whose
+        (client_id, note_number) sorts after `after`. Returns
+        (rows, union meta, last key or None when the union is exhausted).
+        """
+        with self._lock:
+            self._materialize()
+            start = bisect.bisect_right(self._sorted_keys, tuple(after)) if after else 0
+            end = len(self._rows) if limit is None else min(start + int(limit), len(self._rows))
+            last_key = self._sorted_keys[end - 1] if end < len(self._rows) and end > start else None
+            return self._rows[start:end], dict(self._meta), last_key
+
+    def client_notes(self, client_id):
+        """
+        One client's rows in note order, or None for an unknown client.
+        """
+        with self._lock:
+            self._materialize()
+            rows = self._by_client.get(client_id)
+            return list(rows) if rows is not None else None
+
+    def note(self, note_id):
+        with self._lock:
+            self._materialize()
+            return self._by_note_id.get(note_id)
+
+    def per_file(self):
+        with self._lock:
+            return [dict(self._deltas_by_file[k][1]) for k in self._order]
+
+    def features(self, smooth_window, alpha):
+        """
+        Cumulative curves (NaN past each child's length), lengths, session-space
+        t* and child meta for every usable child, in discovery order. Each
+        file's block is computed once per (smooth_window, alpha) and reused
+        until the file changes.
+        """
+        params = (int(smooth_window), float(alpha))
+        blocks = []
+        computed = False
+        with self._lock:
+            for key in self._order:
+                per_params = self._features.setdefault(key, OrderedDict())
+                block = per_params.get(params)
+                if block is None:
+                    (deltas, lengths, meta), _ = self._deltas_by_file[key]
+                    block = (*trajectory_features(deltas, lengths, *params), lengths, meta)
+                    per_params[params] = block
+                    while len(per_params) > FEATURE_PARAMS_PER_FILE:
+                        per_params.popitem(last=False)
+                    computed = True
+                else:
+                    per_params.move_to_end(params)
+                blocks.append(block)
+            if computed:
+                self._measure()
+
+        n = sum(len(b[2]) for b in blocks)
+        width = max((b[0].shape[1] for b in blocks), default=0)
+        curves = np.full((n, width), np.nan, dtype=float)
+        lengths = np.zeros(n, dtype=np.int64)
+        tstars = np.zeros(n, dtype=float)
+        meta = []
+        row = 0
+        for block_curves, block_tstars, block_lengths, block_meta in blocks:
+            end = row + len(block_lengths)
+            curves[row:end, :block_curves.shape[1]] = block_curves
+            lengths[row:end] = block_lengths
+            tstars[row:end] = block_tstars
+            meta.extend(block_meta)
+            row = end
+        return curves, lengths, tstars, meta
@@ -0,0 +1,50 @@
+# backend/app/triage/encoding.py
+import hashlib
+import json
+
+import numpy as np
+from fastapi import Request
+
+try:
+    import orjson  # optional: NumPy-aware, much faster JSON encoding
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(payload) -> bytes:
+    """
+    Compact UTF-8 JSON that also accepts NumPy arrays and scalars. orjson
+    (when installed) writes contiguous arrays natively; otherwise they go
+    through `.tolist()`. Non-finite floats become null with orjson and raise
+    with the stdlib encoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=_ORJSON_OPTIONS)
+    # Same settings as Starlette's JSONResponse, without whitespace.
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+        default=_json_default,
+    ).encode("utf-8")
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    # If-None-Match uses weak comparison.
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
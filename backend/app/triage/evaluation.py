@@ -0,0 +1,340 @@
+# backend/app/triage/evaluation.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from .batches import (
+    ANALYTICS_SKIP_KEYS,
+    corpus_cache,
+    is_large_batch,
+    is_number,
+    iter_batch_children,
+    make_snippet,
+    safe_int,
+)
+from .encoding import encode_json
+from .registry import STATE_DIR, get_json_paths
+
+# ============================================================
+# BATCH EVALUATION JOBS
+# ============================================================
+# `POST /notes/evaluate` runs a prompt over a set of notes as a background
+# asyncio job. Model calls go through a pluggable client, bounded per job by
+# `concurrency` and across jobs by `EVAL_GLOBAL_CONCURRENCY`. Each result is
+# appended to `EVAL_STATE_DIR/jobs/<job_id>.ndjson` as it finishes, and a
+# completed job is written as a new `batch_notes_eval_<stamp>.json` in
+# `EVAL_OUTPUT_DIR`. Existing batch files are never modified. The output
+# directory is kept apart from the source corpus, so re-evaluated notes do
+# not add duplicate trajectories to it; register the directory in `CORPORA`
+# to browse and analyse evaluations as a corpus of their own.
+EVAL_MODEL_CLIENT = os.getenv("EVAL_MODEL_CLIENT", "stub")
+EVAL_MAX_CONCURRENCY = int(os.getenv("EVAL_MAX_CONCURRENCY", "32"))
+EVAL_GLOBAL_CONCURRENCY = int(os.getenv("EVAL_GLOBAL_CONCURRENCY", "64"))
+EVAL_MAX_JOBS = int(os.getenv("EVAL_MAX_JOBS", "100"))
+EVAL_STUB_LATENCY_MS = float(os.getenv("EVAL_STUB_LATENCY_MS", "0") or 0)
+EVAL_STATE_DIR = Path(os.getenv("EVAL_STATE_DIR", "").strip() or STATE_DIR / "evaluations")
+EVAL_OUTPUT_DIR = Path(os.getenv("EVAL_OUTPUT_DIR", "").strip() or EVAL_STATE_DIR / "batches")
+
+
+class StubModelClient:
+    """
+    Deterministic offline client for load tests: the output is a hash of
+    (prompt, note, model, temperature) shaped like the Notes Lab schema,
+    plus an integer progress `delta` used to build `gpt_deltas`.
+    """
+
+    PHASES = ("Assessment", "Early Tx", "Generalization", "Unknown")
+    SIGNALS = ("none", "watch", "ready")
+
+    def __init__(self, latency_ms=EVAL_STUB_LATENCY_MS):
+        self.latency_ms = float(latency_ms)
+
+    async def complete(self, prompt, note_text, model, temperature):
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        seed = hashlib.sha256(
+            f"{model}\x00{temperature}\x00{prompt}\x00{note_text}".encode("utf-8")
+        ).digest()
+        return json.dumps({
+            "phase": self.PHASES[seed[0] % len(self.PHASES)],
+            "targets": [],
+            "cueing": [],
+            "recommended_intensity": 1 + seed[1] % 3,
+            "discharge_signal": self.SIGNALS[seed[2] % len(self.SIGNALS)],
+            "attendance_flags": [],
+            "progress_summary": make_snippet(note_text, max_chars=60),
+            "delta": seed[3] % 4,
+        })
+
+
+MODEL_CLIENTS = {
+    "stub": StubModelClient(),
+}
+
+
+def register_model_client(name, client):
+    """
+    Make `client` (anything with `async complete(prompt, note_text, model,
+    temperature) -> str`) selectable by name for evaluation jobs.
+    """
+    MODEL_CLIENTS[str(name)] = client
+
+
+class EvaluationJob:
+    def __init__(self, job_id, prompt, notes, model, temperature, concurrency, client_name, corpus):
+        self.job_id = job_id
+        self.corpus = corpus
+        self.prompt = prompt
+        self.notes = notes
+        self.model = model
+        self.temperature = temperature
+        self.concurrency = concurrency
+        self.client_name = client_name
+        self.total = len(notes)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.results = []
+        self.errors = []
+        self.output_file = None
+        self.task = None
+
+    def snapshot(self, include_results=True):
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        body = {
+            "job_id": self.job_id,
+            "corpus": self.corpus.name,
+            "status": self.status,
+            "model": self.model,
+            "temperature": self.temperature,
+            "concurrency": self.concurrency,
+            "progress": {
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "elapsed_s": round(elapsed, 3),
+                "notes_per_s": round(self.done / elapsed, 3) if elapsed > 0 else 0.0,
+            },
+            "output_file": self.output_file,
+            "errors": list(self.errors),
+        }
+        if include_results:
+            body["results"] = list(self.results)
+        return body
+
+
+evaluation_jobs = OrderedDict()   # job_id -> EvaluationJob
+_eval_global_semaphore = None
+
+
+def _global_eval_semaphore():
+    global _eval_global_semaphore
+    if _eval_global_semaphore is None:
+        _eval_global_semaphore = asyncio.Semaphore(EVAL_GLOBAL_CONCURRENCY)
+    return _eval_global_semaphore
+
+
+def _append_ndjson(path: Path, record):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("ab") as f:
+        f.write(encode_json(record) + b"\n")
+
+
+def _generator_json_for(created_at):
+    # Inverse of `parse_created_at`, so re-evaluated notes keep their date.
+    try:
+        return f"output/notes_{datetime.strptime(created_at, '%Y-%m-%d'):%Y%m%d}_000000.json"
+    except (TypeError, ValueError):
+        return ""
+
+
+def _result_deltas(results):
+    """
+    `gpt_deltas` from one child's results in note order (the `delta` of
+    notes 2..n), or None unless every delta is numeric.
+    """
+    deltas = [r["output"].get("delta") if isinstance(r["output"], dict) else None for r in results[1:]]
+    return deltas if deltas and all(is_number(d) for d in deltas) else None
+
+
+def _source_trajectories(job):
+    """
+    `trajectory_vector` of every source child the job's notes came from,
+    keyed by (file name, child_index). Later children win within a file, as
+    in `note_rows_from_chunk`.
+    """
+    wanted = defaultdict(set)
+    for row in job.notes.values():
+        wanted[row["source_file"]].add(row["child_index"])
+    paths = {p.name: p for p in get_json_paths(job.corpus)}
+
+    truth = {}
+    for name, child_indexes in wanted.items():
+        p = paths.get(name)
+        if p is None:
+            continue
+        chunk = iter_batch_children(p, ANALYTICS_SKIP_KEYS) if is_large_batch(p) else corpus_cache.load(p)
+        for child in chunk:
+            if isinstance(child, dict) and safe_int(child.get("child_index"), 0) in child_indexes:
+                truth[(name, safe_int(child.get("child_index"), 0))] = child.get("trajectory_vector")
+    return truth
+
+
+def build_evaluated_batch(job):
+    """
+    Group a job's results by client into children shaped like the existing
+    batch files. `gpt_deltas` (and the error columns derived from them) are
+    only emitted when the job covered every known note of the client with a
+    numeric delta.
+    """
+    by_client = defaultdict(list)
+    for result in job.results:
+        by_client[result["client_id"]].append(result)
+    notes = job.corpus.sync()
+    truths = _source_trajectories(job)
+    stamp = {
+        "job_id": job.job_id,
+        "model": job.model,
+        "temperature": job.temperature,
+        "prompt_sha256": hashlib.sha256(job.prompt.encode("utf-8")).hexdigest(),
+    }
+
+    children = []
+    for client_id in sorted(by_client):
+        results = sorted(by_client[client_id], key=lambda r: r["note_number"])
+        rows = [job.notes[r["note_id"]] for r in results]
+        first = rows[0]
+        known = notes.client_notes(client_id) or []
+        child = {
+            "child_index": first["child_index"],
+            "archetype": first["archetype"],
+            "n_notes": len(rows),
+            "generator_result": {
+                "status": "ok",
+                "data": {
+                    "trajectory_type": first["trajectory_type"],
+                    "notes": [{"note_number": r["note_number"], "note_text": r["note"]} for r in rows],
+                },
+                "json": _generator_json_for(first["created_at"]),
+            },
+            "evaluation": {
+                **stamp,
+                "outputs": [
+                    {k: r[k] for k in ("note_id", "note_number", "output", "valid_json")}
+                    for r in results
+                ],
+            },
+        }
+        truth = truths.get((first["source_file"], first["child_index"]))
+        if isinstance(truth, list):
+            child["trajectory_vector"] = truth
+        deltas = _result_deltas(results)
+        if deltas is not None and len(results) == len(known):
+            child["gpt_deltas"] = deltas
+            if isinstance(truth, list) and len(truth) == len(deltas) and all(is_number(t) for t in truth):
+                child["diff_per_step"] = [abs(d - t) for d, t in zip(deltas, truth)]
+                child["mae"] = sum(child["diff_per_step"]) / len(deltas)
+        children.append(child)
+    return children
+
+
+def write_batch_file(directory: Path, children, job_id):
+    """
+    Atomically write a new `batch_notes_eval_YYYYMMDD_HHMMSS.json`. An
+    existing file is never replaced: the name gets the job id instead.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    tmp = directory / f".batch_notes_eval_{stamp}_{job_id}.tmp"
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(children, f, ensure_ascii=False)
+    try:
+        for name in (f"batch_notes_eval_{stamp}.json", f"batch_notes_eval_{stamp}_{job_id[:8]}.json"):
+            target = directory / name
+            try:
+                os.link(tmp, target)   # unlike os.replace, fails if `target` exists
+                return target
+            except FileExistsError:
+                continue
+        raise FileExistsError(f"{target} already exists")
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+async def run_evaluation_job(job, directory: Path = EVAL_STATE_DIR, output_dir: Path = EVAL_OUTPUT_DIR):
+    client = MODEL_CLIENTS[job.client_name]
+    local = asyncio.Semaphore(job.concurrency)
+    shared = _global_eval_semaphore()
+    stream_path = directory / "jobs" / f"{job.job_id}.ndjson"
+    job.status = "running"
+
+    async def evaluate(row):
+        async with local, shared:
+            job.in_flight += 1
+            started = time.perf_counter()
+            try:
+                raw = await client.complete(job.prompt, row["note"], job.model, job.temperature)
+                try:
+                    output, valid_json = json.loads(raw), True
+                except (TypeError, ValueError):
+                    output, valid_json = raw, False
+                record = {
+                    "note_id": row["note_id"],
+                    "client_id": row["client_id"],
+                    "note_number": row["note_number"],
+                    "output": output,
+                    "valid_json": valid_json,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+                }
+                job.results.append(record)
+                job.done += 1
+            except Exception as e:
+                record = {"note_id": row["note_id"], "error": str(e)}
+                job.errors.append(record)
+                job.failed += 1
+            finally:
+                job.in_flight -= 1
+        try:
+            await asyncio.to_thread(_append_ndjson, stream_path, record)
+        except OSError:
+            pass
+
+    try:
+        await asyncio.gather(*(evaluate(row) for row in job.notes.values()))
+        if job.results:
+            children = await asyncio.to_thread(build_evaluated_batch, job)
+            target = await asyncio.to_thread(write_batch_file, output_dir, children, job.job_id)
+            job.output_file = str(target)
+        job.status = "completed"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        job.errors.append({"error": str(e)})
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+
+
+def start_job(job):
+    """
+    Register `job` and run it in the background. Beyond `EVAL_MAX_JOBS`, the
+    oldest finished jobs are forgotten; queued and running jobs are kept.
+    """
+    evaluation_jobs[job.job_id] = job
+    excess = len(evaluation_jobs) - EVAL_MAX_JOBS
+    if excess > 0:
+        finished = [k for k, j in evaluation_jobs.items() if j.status not in ("queued", "running")]
+        for job_id in finished[:excess]:
+            evaluation_jobs.pop(job_id)
+    job.task = asyncio.create_task(run_evaluation_job(job))
+    return job
@@ -0,0 +1,262 @@
+# backend/app/triage/extraction.py
+import hashlib
+import os
+import re
+import sys
+from typing import Any, Dict
+
+from . import offload
+from .caches import BoundedLRU
+from .registry import load_unionized_notes
+from .search import PHONEME_ITEM_RE, PHONEME_RE
+
+# ============================================================
+# STRUCTURED EXTRACTION
+# ============================================================
+# Rule-based extraction for the recurring parts of a session note. All
+# patterns are compiled once at import. Every extracted item carries its
+# character span in the original text. Results are cached by the SHA-256 of
+# the note text, so re-extracting an unchanged corpus does no work. Large
+# batches of cache misses are split across the CPU pool (`CPU_WORKERS`).
+EXTRACT_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACT_CACHE_MAX_ENTRIES", "200000"))
+EXTRACT_POOL_MIN_NOTES = int(os.getenv("EXTRACT_POOL_MIN_NOTES", "2000"))
+EXTRACT_CHUNK_NOTES = int(os.getenv("EXTRACT_CHUNK_NOTES", "500"))
+
+SECTION_LABELS = {
+    "parent": "parent_report",
+    "caregiver": "parent_report",
+    "behaviour": "behaviour_engagement",
+    "behavior": "behaviour_engagement",
+    "engagement": "behaviour_engagement",
+    "therapy": "goals",
+    "goal": "goals",
+    "goals": "goals",
+    "plan": "plan",
+}
+# Header wording varies across batches ("Parent report:", "Plan / recommendations:",
+# "Goals / session focus:"); the leading keyword decides the section.
+_SECTION_RE = re.compile(
+    r"^[ \t]*((?:Parent|Caregiver|Behaviou?r|Engagement|(?:Therapy[ \t]+)?Goals?|Plan)\b[^\n:]{0,60})"
+    r":[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_SESSION_RE = re.compile(r"^[ \t]*Session[ \t]+(\d+)\b", re.IGNORECASE | re.MULTILINE)
+# "Goal 2: ...", "2. ...", "2) ..."
+_GOAL_RE = re.compile(
+    r"^[ \t]*(?:Goal[ \t]+(\d+)[ \t]*[:.)\-–][ \t]*|(\d+)[.)][ \t]+)(.*\S)[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+_BULLET_RE = re.compile(r"^[ \t]*[-•*][ \t]*(.*\S)[ \t]*$", re.MULTILINE)
+_ACCURACY_RE = re.compile(
+    r"\b(?:(?P<pct>\d{1,3})[ \t]*%[ \t]*(?:accuracy|accurate|correct)"
+    r"|(?P<pre>high|low|emerging|improved|improving|increasing|inconsistent|moderate|variable|stable|consistent)"
+    r"[ \t]+accuracy"
+    r"|accuracy[ \t]+(?:was|is|remained|remains|showed|continues[ \t]+to[ \t]+be)[ \t]+"
+    r"(?:\w+[ \t]+){0,2}?(?P<post>high|low|emerging|inconsistent|moderate|variable|stable|improving|increasing))\b",
+    re.IGNORECASE,
+)
+_CUEING_RE = re.compile(
+    r"\b(maximal|maximum|moderate|minimal|light|explicit)[ \t]+(?:[a-z]+[ \t]+(?:and[ \t]+)?){0,2}?"
+    r"(cues?|cueing|support|reminders?|modeling)\b",
+    re.IGNORECASE,
+)
+_DISCHARGE_RE = re.compile(
+    r"\b(?P<ready>discharg(?:e|ed|ing)|graduat(?:e|ed|ion)|age[- ]appropriate|"
+    r"no[ \t]+longer[ \t]+(?:requires?|needs?)[ \t]+(?:speech[ \t]+)?therapy)"
+    r"|(?P<watch>maintenance|monitor(?:ing)?[ \t]+only|reduc(?:e|ed|ing)[ \t]+(?:session[ \t]+)?frequency|"
+    r"consult(?:ation)?[ \t]+(?:model|basis))\b",
+    re.IGNORECASE,
+)
+_ATTENDANCE_RE = re.compile(
+    r"\b(missed|cancel(?:l?ed)?|no[- ]show|absent|rescheduled|late[ \t]+arrival)\b",
+    re.IGNORECASE,
+)
+
+# Cheap substring gates: skip a pattern when none of its keywords occur.
+_ACCURACY_HINTS = ("accura", "%")
+_DISCHARGE_HINTS = (
+    "dischar", "graduat", "appropriate", "no longer", "maintenance", "monitor", "reduc", "consult",
+)
+_ATTENDANCE_HINTS = ("missed", "cancel", "no-show", "no show", "absent", "reschedul", "late arrival")
+
+_ACCURACY_LEVELS = {
+    "high": "high", "consistent": "high", "stable": "stable",
+    "improved": "improving", "improving": "improving", "increasing": "improving",
+    "moderate": "moderate", "variable": "inconsistent", "inconsistent": "inconsistent",
+    "emerging": "emerging", "low": "low",
+}
+_CUEING_LEVELS = {
+    "maximal": "maximal", "maximum": "maximal", "moderate": "moderate",
+    "minimal": "minimal", "light": "minimal", "explicit": "moderate",
+}
+
+
+def _span(label, start, end, text, **extra):
+    span = {"label": label, "start": int(start), "end": int(end), "text": text[start:end]}
+    span.update(extra)
+    return span
+
+
+def _gated(pattern, hints, text, lowered):
+    if any(h in lowered for h in hints):
+        return pattern.finditer(text)
+    return ()
+
+
+def _bullets(text, start, end):
+    return [m.group(1) for m in _BULLET_RE.finditer(text, start, end)]
+
+
+def extract_note(note_text: str) -> Dict[str, Any]:
+    """
+    Extract { extracted_json, spans[] } from one note. Span offsets index
+    into `note_text` as given.
+    """
+    text = str(note_text or "")
+    lowered = text.lower()
+    spans = []
+
+    session = None
+    m = _SESSION_RE.search(text)
+    if m:
+        session = int(m.group(1))
+        spans.append(_span("session", m.start(1), m.end(1), text))
+
+    # Sections run from the end of their header to the start of the next one.
+    headers = list(_SECTION_RE.finditer(text))
+    sections = {}
+    for i, h in enumerate(headers):
+        key = SECTION_LABELS[re.match(r"[a-z]+", h.group(1).strip().lower()).group(0)]
+        body_end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+        sections.setdefault(key, (h.end(), body_end))
+        spans.append(_span(f"section:{key}", h.start(), body_end, text))
+
+    goals = []
+    goal_start, goal_end = sections.get("goals", (0, len(text)))
+    goal_matches = list(_GOAL_RE.finditer(text, goal_start, goal_end))
+    for i, g in enumerate(goal_matches):
+        body_end = goal_matches[i + 1].start() if i + 1 < len(goal_matches) else goal_end
+        body = text[g.start():body_end]
+        number = int(g.group(1) or g.group(2))
+        goals.append({
+            "number": number,
+            "title": g.group(3),
+            "targets": list(dict.fromkeys(
+                p for m in PHONEME_RE.finditer(body) for p in PHONEME_ITEM_RE.findall(m.group(1))
+            )),
+            "observations": _bullets(text, g.end(), body_end),
+            "start": g.start(),
+            "end": body_end,
+        })
+        spans.append(_span("goal", g.start(), body_end, text, number=number))
+
+    targets = []
+    for m in PHONEME_RE.finditer(text):
+        for p in PHONEME_ITEM_RE.finditer(m.group(1)):
+            targets.append(p.group(0))
+        spans.append(_span("phoneme", m.start(), m.end(), text))
+
+    accuracy = []
+    for m in _gated(_ACCURACY_RE, _ACCURACY_HINTS, text, lowered):
+        if m.group("pct") is not None:
+            level, percent = None, min(int(m.group("pct")), 100)
+        else:
+            level, percent = _ACCURACY_LEVELS[(m.group("pre") or m.group("post")).lower()], None
+        accuracy.append({"level": level, "percent": percent, "start": m.start(), "end": m.end()})
+        spans.append(_span("accuracy", m.start(), m.end(), text, level=level, percent=percent))
+
+    cueing = []
+    for m in _CUEING_RE.finditer(text):
+        level = _CUEING_LEVELS[m.group(1).lower()]
+        cueing.append(level)
+        spans.append(_span("cueing", m.start(), m.end(), text, level=level))
+
+    discharge_signal = "none"
+    for m in _gated(_DISCHARGE_RE, _DISCHARGE_HINTS, text, lowered):
+        kind = "ready" if m.group("ready") else "watch"
+        if kind == "ready" or discharge_signal == "none":
+            discharge_signal = kind
+        spans.append(_span("discharge", m.start(), m.end(), text, signal=kind))
+
+    attendance_flags = []
+    for m in _gated(_ATTENDANCE_RE, _ATTENDANCE_HINTS, text, lowered):
+        attendance_flags.append(m.group(1).lower())
+        spans.append(_span("attendance", m.start(), m.end(), text))
+
+    plan = sections.get("plan")
+    extracted = {
+        "session": session,
+        "parent_report": _bullets(text, *sections["parent_report"]) if "parent_report" in sections else [],
+        "behaviour_engagement": (
+            _bullets(text, *sections["behaviour_engagement"]) if "behaviour_engagement" in sections else []
+        ),
+        "goals": goals,
+        "targets": list(dict.fromkeys(targets)),
+        "accuracy": accuracy,
+        "cueing": list(dict.fromkeys(cueing)),
+        "discharge_signal": discharge_signal,
+        "attendance_flags": list(dict.fromkeys(attendance_flags)),
+        "plan": _bullets(text, *plan) if plan else [],
+    }
+    spans.sort(key=lambda s: (s["start"], -s["end"]))
+    return {"extracted_json": extracted, "spans": spans}
+
+
+def extract_many(texts):
+    # Pool entry point: one pickled round-trip per chunk instead of per note.
+    return [extract_note(t) for t in texts]
+
+
+extraction_cache = BoundedLRU(EXTRACT_CACHE_MAX_ENTRIES, sys.maxsize)
+
+
+def _content_key(note_text):
+    return hashlib.sha256(str(note_text or "").encode("utf-8")).digest()
+
+
+def extract_cached(note_text):
+    key = _content_key(note_text)
+    result = extraction_cache.get(key)
+    if result is None:
+        result = extract_note(note_text)
+        extraction_cache.put(key, result)
+    return result
+
+
+def extract_corpus(note_ids=None):
+    """
+    Extract every note of the union (or just `note_ids`). Only texts whose
+    content hash is not cached are extracted, on the CPU pool once there
+    are at least `EXTRACT_POOL_MIN_NOTES` of them.
+    Returns (results by note_id, unknown note_ids, stats).
+    """
+    rows, _meta = load_unionized_notes()
+    unknown = []
+    if note_ids is not None:
+        wanted = set(note_ids)
+        rows = [r for r in rows if r["note_id"] in wanted]
+        found = {r["note_id"] for r in rows}
+        unknown = [n for n in dict.fromkeys(note_ids) if n not in found]
+
+    keys = [_content_key(r["note"]) for r in rows]
+    results = [extraction_cache.get(k) for k in keys]
+    pending = {}
+    for i, (k, res) in enumerate(zip(keys, results)):
+        if res is None:
+            pending.setdefault(k, []).append(i)
+
+    todo = list(pending)
+    texts = [rows[pending[k][0]]["note"] for k in todo]
+    if len(texts) >= EXTRACT_POOL_MIN_NOTES and offload.CPU_WORKERS > 1:
+        pool = offload.get_cpu_pool()
+        chunks = [texts[i:i + EXTRACT_CHUNK_NOTES] for i in range(0, len(texts), EXTRACT_CHUNK_NOTES)]
+        computed = [res for chunk in pool.map(extract_many, chunks) for res in chunk]
+    else:
+        computed = extract_many(texts)
+    for k, res in zip(todo, computed):
+        extraction_cache.put(k, res)
+        for i in pending[k]:
+            results[i] = res
+
+    stats = {"notes": len(rows), "extracted": len(todo), "cached": len(rows) - sum(len(v) for v in pending.values())}
+    return {r["note_id"]: res for r, res in zip(rows, results)}, unknown, stats
@@ -0,0 +1,361 @@
+# backend/app/triage/features.py
+import numpy as np
+
+# ------------------------------------------------------------
+# Helpers (ported from your scripts)
+# ------------------------------------------------------------
+def moving_average(arr, window=3):
+    arr = np.asarray(arr, dtype=float)
+    if len(arr) < window or window <= 1:
+        return arr
+    kernel = np.ones(window) / window
+    return np.convolve(arr, kernel, mode="same")
+
+
+def stopping_point_fraction(cumulative, alpha=0.9):
+    cumulative = np.asarray(cumulative, dtype=float)
+    if cumulative.size == 0:
+        return 0
+    target = alpha * cumulative[-1]
+    return int(np.argmax(cumulative >= target))
+
+
+def optimal_audit_Q(D_cluster, T_max):
+    D_cluster = np.asarray(D_cluster, dtype=float)
+    D_cluster = D_cluster[~np.isnan(D_cluster)]
+    if D_cluster.size == 0:
+        return None, None, None, None
+
+    # ECDF over the whole Q grid from one sort instead of one scan per Q.
+    Qs = np.arange(1, T_max + 1)
+    F = np.searchsorted(np.sort(D_cluster), Qs, side="right") / D_cluster.size
+    expected_delivered = Qs * F + T_max * (1 - F)
+    Q_star = int(Qs[np.argmin(expected_delivered)])
+    return Q_star, Qs, expected_delivered, F
+
+
+def expected_delivered_given_Q(D_cluster, Q, T_max):
+    D_cluster = np.asarray(D_cluster, dtype=float)
+    D_cluster = D_cluster[~np.isnan(D_cluster)]
+    if D_cluster.size == 0:
+        return float(T_max)
+    delivered = np.where(Q < D_cluster, T_max, Q)
+    return float(np.mean(delivered))
+
+
+def q_mean_policy(D_cluster, method="round", T_max=1):
+    D_cluster = np.asarray(D_cluster, dtype=float)
+    D_cluster = D_cluster[~np.isnan(D_cluster)]
+    if D_cluster.size == 0:
+        return int(T_max)
+
+    m = float(np.mean(D_cluster))
+    if method == "round":
+        q = int(np.round(m))
+    elif method == "ceil":
+        q = int(np.ceil(m))
+    elif method == "floor":
+        q = int(np.floor(m))
+    else:
+        raise ValueError("method must be one of: round, ceil, floor")
+
+    return int(np.clip(q, 1, T_max))
+
+
+def _rounded_policy(m, method):
+    if method == "round":
+        return np.round(m)
+    if method == "ceil":
+        return np.ceil(m)
+    if method == "floor":
+        return np.floor(m)
+    raise ValueError("method must be one of: round, ceil, floor")
+
+
+def evaluate_cluster_policies(tstars, labels, n_clusters, T_max, mean_method="round"):
+    """
+    Batched equivalent of running `optimal_audit_Q`, `q_mean_policy`,
+    `expected_delivered_given_Q`, the pass rates and the t* histogram for
+    every cluster. All clusters share one bincount over (label, ceil(t*)),
+    so the cost is O(n + n_clusters * T_max) regardless of cluster count.
+
+    Returns a dict of arrays indexed by cluster; `valid[c]` is False for
+    clusters with no finite t* (the per-cluster functions return None there).
+    """
+    D = np.asarray(tstars, dtype=float)
+    labels = np.asarray(labels, dtype=np.int64)
+    k = int(n_clusters)
+    T_max = int(T_max)
+    Qs = np.arange(1, T_max + 1)
+
+    n_all = np.bincount(labels, minlength=k)[:k]
+    finite = ~np.isnan(D)
+    Df = D[finite]
+    Lf = labels[finite]
+    n = np.bincount(Lf, minlength=k)[:k]
+    valid = n > 0
+    safe_n = np.where(valid, n, 1)
+
+    # D <= Q  <=>  ceil(D) <= Q for integer Q. Bin 0 collects anything below
+    # 1 and bin T_max + 1 anything above T_max.
+    width = T_max + 2
+    bins = np.clip(np.ceil(Df), 0, T_max + 1).astype(np.int64)
+    le_counts = np.cumsum(
+        np.bincount(Lf * width + bins, minlength=k * width).reshape(k, width), axis=1
+    )[:, 1:T_max + 1]                                      # (k, T_max): #{D <= Q}
+
+    F = le_counts / safe_n[:, None]
+    frontier = Qs * F + T_max * (1 - F)
+    Qstar = Qs[np.argmin(frontier, axis=1)]
+
+    means = np.bincount(Lf, weights=Df, minlength=k)[:k] / safe_n
+    Qmean = np.clip(_rounded_policy(means, mean_method), 1, T_max).astype(np.int64)
+    Qmean = np.where(valid, Qmean, T_max)
+
+    rows = np.arange(k)
+    le_opt = le_counts[rows, Qstar - 1]
+    le_mean = le_counts[rows, Qmean - 1]
+    E_del_opt = (Qstar * le_opt + T_max * (n - le_opt)) / safe_n
+    E_del_mean = (Qmean * le_mean + T_max * (n - le_mean)) / safe_n
+    safe_all = np.where(n_all > 0, n_all, 1)
+
+    if Df.size:
+        t_min = int(np.min(Df))
+        t_max = int(np.max(Df))
+        span = t_max - t_min + 1
+        hist = np.bincount(
+            Lf * span + (Df.astype(np.int64) - t_min), minlength=k * span
+        ).reshape(k, span)
+    else:
+        t_min, t_max = 0, -1
+        hist = np.zeros((k, 0), dtype=np.int64)
+
+    return {
+        "valid": valid,
+        "n": n,
+        "Qs": Qs,
+        "F": F,
+        "frontier": frontier,
+        "Qstar": Qstar,
+        "E_delivered": np.where(valid, E_del_opt, float(T_max)),
+        "Qmean": Qmean,
+        "E_delivered_mean": np.where(valid, E_del_mean, float(T_max)),
+        "p_pass_opt": le_opt / safe_all,
+        "p_pass_mean": le_mean / safe_all,
+        "hist_t": np.arange(t_min, t_max + 1),
+        "hist": hist,
+    }
+
+
+def truncate_to_min_length(curves):
+    m = min(len(c) for c in curves)
+    return [c[:m] for c in curves]
+
+
+def pad_to_max_length(curves):
+    m = max(len(c) for c in curves)
+    out = []
+    for c in curves:
+        if len(c) == m:
+            out.append(c)
+        else:
+            pad = np.full((m - len(c),), np.nan, dtype=float)
+            out.append(np.concatenate([c, pad]))
+    return out
+
+
+def downsample(arr, max_points=60):
+    # Along the last axis, so a (rows, points) matrix is downsampled per row.
+    arr = np.asarray(arr, dtype=float)
+    if arr.shape[-1] <= max_points:
+        return arr
+    idx = np.linspace(0, arr.shape[-1] - 1, max_points).astype(int)
+    return arr[..., idx]
+
+
+CURVE_SAMPLERS = ("linspace", "lttb")
+BAND_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def lttb_indices(Y, max_points):
+    """
+    Largest-Triangle-Three-Buckets over every row of `Y` (x = column index),
+    vectorized across rows: one NumPy step per bucket. Returns a
+    (rows, max_points) matrix of increasing column indices; the first and
+    last columns are always kept.
+    """
+    Y = np.asarray(Y, dtype=float)
+    n_rows, m = Y.shape
+    if max_points >= m:
+        return np.broadcast_to(np.arange(m), (n_rows, m)).copy()
+    if max_points < 3:
+        return np.broadcast_to(np.linspace(0, m - 1, max_points).astype(np.int64), (n_rows, max_points)).copy()
+
+    # Interior points split into max_points - 2 buckets; bucket b is [edges[b], edges[b+1]).
+    # Integer division: a float ratio can floor an exact edge one short.
+    edges = np.arange(max_points - 1, dtype=np.int64) * (m - 2) // (max_points - 2) + 1
+    csum = np.concatenate([np.zeros((n_rows, 1)), np.cumsum(Y, axis=1)], axis=1)
+    rows = np.arange(n_rows)
+
+    out = np.empty((n_rows, max_points), dtype=np.int64)
+    out[:, 0] = 0
+    out[:, -1] = m - 1
+    a = np.zeros(n_rows, dtype=np.int64)
+    ay = Y[:, 0]
+    for b in range(max_points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Average of the next bucket; the last bucket looks at the final point.
+        nlo, nhi = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (m - 1, m)
+        avg_x = (nlo + nhi - 1) / 2.0
+        avg_y = (csum[:, nhi] - csum[:, nlo]) / (nhi - nlo)
+        xs = np.arange(lo, hi)
+        area = np.abs(
+            (a - avg_x)[:, None] * (Y[:, lo:hi] - ay[:, None])
+            - (a[:, None] - xs[None, :]) * (avg_y - ay)[:, None]
+        )
+        a = lo + area.argmax(axis=1)
+        ay = Y[rows, a]
+        out[:, b + 1] = a
+    return out
+
+
+def sample_curves(Y, max_points, sampler="linspace"):
+    """
+    Downsample each row of `Y` to at most `max_points` points. Returns
+    (x, values): x is None for "linspace" (evenly spaced, as `downsample`)
+    and the per-row kept column indices for "lttb".
+    """
+    Y = np.asarray(Y, dtype=float)
+    if sampler == "lttb":
+        x = lttb_indices(Y, max_points)
+        return x, np.take_along_axis(Y, x, axis=1)
+    return None, downsample(Y, max_points)
+
+
+def cluster_percentile_bands(X, labels, n_clusters, percentiles=BAND_PERCENTILES):
+    """
+    Per-cluster, per-column percentiles of `X` as a (k, len(percentiles), M)
+    array. Rows are grouped by one stable sort, so each row is read once.
+    Empty clusters are NaN.
+    """
+    X = np.asarray(X, dtype=float)
+    labels = np.asarray(labels, dtype=np.int64)
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=n_clusters)
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+    grouped = X[order]
+    out = np.full((n_clusters, len(percentiles), X.shape[1]), np.nan)
+    for c in range(n_clusters):
+        if counts[c]:
+            out[c] = np.percentile(grouped[bounds[c]:bounds[c + 1]], percentiles, axis=0)
+    return out
+
+
+def sample_bands(bands, max_points, sampler="linspace"):
+    """
+    Downsample (k, p, M) bands. With "lttb", each cluster's indices are
+    chosen on its median row and shared by all its percentiles, so the band
+    edges stay aligned.
+    """
+    if sampler == "lttb":
+        mid = bands[:, bands.shape[1] // 2, :]
+        x = lttb_indices(np.nan_to_num(mid), max_points)
+        return x, np.take_along_axis(bands, x[:, None, :], axis=2)
+    return None, downsample(bands, max_points)
+
+
+# ------------------------------------------------------------
+# Batched ragged-array feature stage
+# ------------------------------------------------------------
+def pack_ragged(seqs):
+    """
+    Pack variable-length numeric sequences into a zero-padded (n, max_len)
+    float matrix plus a length vector.
+    """
+    lengths = np.fromiter((len(s) for s in seqs), dtype=np.int64, count=len(seqs))
+    width = int(lengths.max()) if lengths.size else 0
+    out = np.zeros((lengths.size, width), dtype=float)
+    if lengths.size:
+        flat = np.fromiter(
+            (float(v) for s in seqs for v in s), dtype=float, count=int(lengths.sum())
+        )
+        out[np.arange(width) < lengths[:, None]] = flat
+    return out, lengths
+
+
+def trajectory_features(deltas, lengths, smooth_window=3, alpha=0.9):
+    """
+    Whole-matrix equivalent of `moving_average` -> `np.cumsum` ->
+    `stopping_point_fraction` per child. `deltas` is zero-padded past each
+    row's length. Returns (cumulative curves with NaN past each length,
+    session-space t*).
+    """
+    deltas = np.asarray(deltas, dtype=float)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n, width = deltas.shape
+    valid = np.arange(width) < lengths[:, None]
+    window = int(smooth_window)
+
+    smoothed = deltas
+    if window > 1 and width >= window:
+        # Centered window [i - w//2, i + (w-1)//2] with zeros outside the
+        # row. Products are accumulated left to right, as np.convolve does,
+        # so ties at the alpha threshold resolve the same way as
+        # `moving_average`.
+        left = window // 2
+        padded = np.zeros((n, width + window - 1), dtype=float)
+        padded[:, left:left + width] = deltas
+        weighted = padded * (1.0 / window)
+        sums = weighted[:, 0:width].copy()
+        for j in range(1, window):
+            sums += weighted[:, j:j + width]
+        smoothed = np.where(lengths[:, None] >= window, sums, deltas)
+        smoothed = np.where(valid, smoothed, 0.0)
+
+    cumulative = np.cumsum(smoothed, axis=1)
+    cumulative[~valid] = np.nan
+    return cumulative, stopping_points(cumulative, lengths, alpha)
+
+
+def stopping_points(cumulative, lengths, alpha=0.9):
+    """
+    Session-space t* for every row of NaN-padded cumulative curves.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    n, width = cumulative.shape
+    if n == 0 or width == 0:
+        return np.full(n, 2.0)
+    valid = np.arange(width) < lengths[:, None]
+    final = cumulative[np.arange(n), np.maximum(lengths - 1, 0)]
+    reached = (cumulative >= alpha * final[:, None]) & valid
+
+    # t* in session space: delta index -> session index via +2
+    return np.argmax(reached, axis=1).astype(float) + 2
+
+
+def align_curves(curves, lengths, length_mode="truncate"):
+    """
+    Bring NaN-padded cumulative curves to a common length: `truncate` to the
+    shortest, `pad` to the longest (NaNs mean-imputed per column), or `error`.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    lo, hi = int(lengths.min()), int(lengths.max())
+    if lo != hi:
+        if length_mode == "error":
+            uniq = np.unique(lengths).tolist()
+            raise ValueError(f"Length mismatch: {uniq[:20]} (min={lo}, max={hi})")
+        elif length_mode == "truncate":
+            X = curves[:, :lo].copy()
+        elif length_mode == "pad":
+            X = curves[:, :hi].copy()
+        else:
+            raise ValueError(f"Unknown length_mode: {length_mode}")
+    else:
+        X = curves[:, :hi].copy()
+
+    # If padded, handle NaNs
+    if np.isnan(X).any():
+        col_means = np.nanmean(X, axis=0)
+        inds = np.where(np.isnan(X))
+        X[inds] = np.take(col_means, inds[1])
+    return X
@@ -0,0 +1,91 @@
+# backend/app/triage/metrics.py
+from collections import Counter, defaultdict
+
+from .batches import corpus_cache
+from .caches import analytics_cache, dtw_cache
+from .evaluation import evaluation_jobs
+from .extraction import extraction_cache
+from .models import model_store
+from .offload import analytics_flight, analytics_pool, lab_flight
+from .registry import corpus_registry
+from .timing import metric_lines, request_seconds, stage_seconds
+
+
+def render_metrics():
+    """
+    Prometheus text exposition of request/stage histograms, cache
+    statistics and corpus sizes.
+    """
+    lines = request_seconds.render() + stage_seconds.render()
+
+    caches = {
+        "corpus": corpus_cache.stats(),
+        "analytics": analytics_cache.stats(),
+        "dtw": dtw_cache.stats(),
+        "extraction": extraction_cache.stats(),
+        "models": model_store.stats(),
+    }
+    cache_samples = {"hits": [], "misses": [], "ratio": [], "entries": [], "bytes": []}
+    for cache, s in caches.items():
+        labels = {"cache": cache}
+        lookups = s["hits"] + s["misses"]
+        cache_samples["hits"].append((labels, s["hits"]))
+        cache_samples["misses"].append((labels, s["misses"]))
+        cache_samples["ratio"].append((labels, f"{s['hits'] / lookups:.6f}" if lookups else "0"))
+        cache_samples["entries"].append((labels, s.get("entries", s.get("files", 0))))
+        cache_samples["bytes"].append((labels, s["bytes"]))
+    lines += metric_lines("triage_cache_hits_total", "Cache hits.", "counter", cache_samples["hits"])
+    lines += metric_lines("triage_cache_misses_total", "Cache misses.", "counter", cache_samples["misses"])
+    lines += metric_lines("triage_cache_hit_ratio", "Cache hit ratio since start.", "gauge", cache_samples["ratio"])
+    lines += metric_lines("triage_cache_entries", "Cache entries.", "gauge", cache_samples["entries"])
+    lines += metric_lines("triage_cache_bytes", "Cache size in bytes.", "gauge", cache_samples["bytes"])
+
+    # Sizes of each corpus as last synced; /metrics never triggers ingest itself.
+    corpus_samples = defaultdict(list)
+    for corpus in corpus_registry.corpora():
+        values = corpus.incremental.stats()
+        values["search_docs"] = corpus.search_index.stats()["docs"]
+        values["resident_bytes"] = corpus.resident_bytes()
+        values["releases"] = corpus.released
+        for key, value in values.items():
+            corpus_samples[key].append(({"corpus": corpus.name}, value))
+    corpus_metrics = [
+        ("triage_corpus_files", "Batch files in the synced corpus.", "gauge", "files"),
+        ("triage_corpus_notes", "Notes after the (client, note_number) union.", "gauge", "notes"),
+        ("triage_corpus_notes_before_union", "Notes across all files before the union.", "gauge", "notes_before_union"),
+        ("triage_corpus_children", "Children with usable gpt_deltas.", "gauge", "children"),
+        ("triage_corpus_version", "Incremental corpus version.", "gauge", "version"),
+        ("triage_search_index_docs", "Notes in the full-text index.", "gauge", "search_docs"),
+        ("triage_corpus_resident_bytes", "Bytes a corpus holds against the memory budget.", "gauge", "resident_bytes"),
+        ("triage_corpus_releases_total", "Times a corpus was released to fit the memory budget.", "counter", "releases"),
+    ]
+    for name, help_text, metric_type, key in corpus_metrics:
+        lines += metric_lines(name, help_text, metric_type, corpus_samples[key])
+    lines += metric_lines(
+        "triage_corpus_memory_budget_bytes", "This process's share of the corpus memory budget (0: unlimited).", "gauge",
+        [({}, corpus_registry.budget_bytes)],
+    )
+
+    lines += metric_lines(
+        "triage_coalesced_requests_total", "Requests that shared an in-flight computation.", "counter",
+        [({"flight": f.name}, f.shared) for f in (analytics_flight, lab_flight)],
+    )
+    lines += metric_lines(
+        "triage_analytics_queue_depth", "Analytics computations queued or running.", "gauge",
+        [({}, analytics_pool.pending)],
+    )
+    lines += metric_lines(
+        "triage_analytics_rejected_total", "Analytics requests rejected with 503.", "counter",
+        [({}, analytics_pool.rejected)],
+    )
+    lines += metric_lines(
+        "triage_analytics_pool_restarts_total", "Analytics worker pools replaced after a worker died.", "counter",
+        [({}, analytics_pool.restarts)],
+    )
+
+    job_counts = Counter(job.status for job in list(evaluation_jobs.values()))
+    lines += metric_lines(
+        "triage_eval_jobs", "Evaluation jobs by status.", "gauge",
+        [({"status": s}, n) for s, n in sorted(job_counts.items())],
+    )
+    return "\n".join(lines) + "\n"
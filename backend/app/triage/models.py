@@ -0,0 +1,211 @@
+# backend/app/triage/models.py
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .caches import BoundedLRU
+from .encoding import make_etag
+from .features import pack_ragged, trajectory_features
+from .registry import STATE_DIR, current_corpus
+
+# ============================================================
+# MODEL STORE
+# ============================================================
+# Fitted cluster models are kept in an LRU. With `MODEL_STORE_PERSIST=1`
+# they are also written under `MODEL_STORE_DIR`, one directory per (corpus,
+# model params) holding its newest `MODEL_STORE_KEEP` corpus versions, so
+# restarted workers can predict without refitting. Persistence is opt-in
+# because fits happen on GET requests. When it is on, `warm_start` seeds from
+# the newest persisted version, so every analytics worker warm-starts from
+# the same fit whichever process made it.
+MODEL_STORE_MAX_ENTRIES = int(os.getenv("MODEL_STORE_MAX_ENTRIES", "32"))
+MODEL_STORE_PERSIST = os.getenv("MODEL_STORE_PERSIST", "0").strip().lower() in ("1", "true", "yes", "on")
+MODEL_STORE_DIR = Path(os.getenv("MODEL_STORE_DIR", "").strip() or STATE_DIR / "models")
+MODEL_STORE_KEEP = max(1, int(os.getenv("MODEL_STORE_KEEP", "3")))
+
+
+class ClusterModel:
+    """
+    Fitted scaler, centroids and per-cluster policies for one analytics
+    configuration on one corpus version. Enough to place a new child
+    without refitting.
+    """
+
+    ARRAYS = (
+        "scaler_mean", "scaler_scale", "centroids", "col_means", "Qstar", "Qmean", "E_delivered", "valid",
+        "sizes", "F",
+    )
+
+    def __init__(self, params, fingerprint, **arrays):
+        self.params = dict(params)
+        self.fingerprint = fingerprint
+        for name in self.ARRAYS:
+            setattr(self, name, np.asarray(arrays[name]))
+
+    @property
+    def M(self):
+        return int(self.centroids.shape[1])
+
+    @property
+    def T_max(self):
+        return self.M + 1
+
+    def raw_centroids(self):
+        return self.centroids * self.scaler_scale + self.scaler_mean
+
+    def predict(self, gpt_deltas):
+        """
+        Cluster, t* and the cluster's audit policy for one child's deltas.
+        Curves longer than the model are truncated; shorter ones are filled
+        from the training column means, as `pad` mode does.
+        """
+        deltas, lengths = pack_ragged([gpt_deltas])
+        if lengths[0] == 0:
+            raise ValueError("gpt_deltas must be a non-empty list of numbers")
+        curves, tstars = trajectory_features(
+            deltas, lengths, self.params["smooth_window"], self.params["alpha"]
+        )
+        x = np.array(self.col_means, dtype=float)
+        n = min(int(lengths[0]), self.M)
+        x[:n] = curves[0, :n]
+        z = (x - self.scaler_mean) / self.scaler_scale
+        distances = np.linalg.norm(self.centroids - z, axis=1)
+        c = int(np.argmin(distances))
+        return {
+            "cluster": c,
+            "t_star": float(tstars[0]),
+            "Qstar": int(self.Qstar[c]) if self.valid[c] else None,
+            "Qmean": int(self.Qmean[c]) if self.valid[c] else None,
+            "E_delivered": float(self.E_delivered[c]),
+            "E_saved": float(self.T_max - self.E_delivered[c]),
+            "distances": distances.tolist(),
+            "T_max_sessions": self.T_max,
+        }
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            meta=np.array(json.dumps({"params": self.params, "fingerprint": self.fingerprint})),
+            **{name: getattr(self, name) for name in self.ARRAYS},
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            fingerprint = tuple(tuple(fp) for fp in meta["fingerprint"])
+            return cls(meta["params"], fingerprint, **{name: z[name] for name in cls.ARRAYS})
+
+
+class ModelStore:
+    """
+    Cluster models keyed by (model params, corpus fingerprint), kept in an
+    LRU and, when persistence is on, written to `MODEL_STORE_DIR`.
+    """
+
+    def __init__(self, max_entries=MODEL_STORE_MAX_ENTRIES, directory=None, keep=MODEL_STORE_KEEP):
+        self._models = BoundedLRU(max_entries, sys.maxsize)
+        self._latest = {}  # (corpus name, params key) -> most recently fitted model
+        self._lock = threading.Lock()
+        self.directory = Path(directory) if directory is not None else None
+        self.keep = keep
+
+    @staticmethod
+    def params_key(params):
+        return tuple(sorted(params.items()))
+
+    def _group_dir(self, params):
+        return self.directory / make_etag(current_corpus().name, self.params_key(params)).strip('"')
+
+    def path_for(self, params, fingerprint):
+        if self.directory is None or not fingerprint:
+            return None
+        version = make_etag(fingerprint).strip('"')
+        return self._group_dir(params) / f"{version}.npz"
+
+    @staticmethod
+    def _versions(group_dir: Path):
+        """
+        Saved versions in a group, newest first (in-flight `.tmp.npz` writes excluded).
+        """
+        versions = []
+        for p in group_dir.glob("*.npz"):
+            if p.name.endswith(".tmp.npz"):
+                continue
+            try:
+                versions.append((p.stat().st_mtime_ns, p))
+            except OSError:
+                continue            # pruned by another process meanwhile
+        return [p for _, p in sorted(versions, reverse=True)]
+
+    def _prune(self, current: Path):
+        """
+        Keep `current` and the newest `keep - 1` other versions in its group.
+        """
+        others = [p for p in self._versions(current.parent) if p != current]
+        for old in others[self.keep - 1:]:
+            old.unlink(missing_ok=True)
+
+    def put(self, model, persist=True):
+        key = (self.params_key(model.params), model.fingerprint)
+        self._models.put(key, model)
+        with self._lock:
+            self._latest[(current_corpus().name, key[0])] = model
+        path = self.path_for(model.params, model.fingerprint) if persist else None
+        if path is not None:
+            try:
+                model.save(path)
+                self._prune(path)
+            except OSError:
+                pass
+
+    def get(self, params, fingerprint):
+        key = (self.params_key(params), fingerprint)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        path = self.path_for(params, fingerprint)
+        if path is None or not path.exists():
+            return None
+        try:
+            model = ClusterModel.load(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        self._models.put(key, model)
+        with self._lock:
+            self._latest.setdefault((current_corpus().name, key[0]), model)
+        return model
+
+    def stats(self):
+        return self._models.stats()
+
+    def latest(self, params):
+        key = (current_corpus().name, self.params_key(params))
+        with self._lock:
+            model = self._latest.get(key)
+        if self.directory is None:
+            return model
+        # Another worker process may have fitted a newer version since.
+        versions = self._versions(self._group_dir(params))
+        if not versions:
+            return model
+        if model is not None and self.path_for(params, model.fingerprint) == versions[0]:
+            return model
+        try:
+            model = ClusterModel.load(versions[0])
+        except (OSError, ValueError, KeyError):
+            return model
+        self._models.put((key[1], model.fingerprint), model)
+        with self._lock:
+            self._latest[key] = model
+        return model
+
+
+model_store = ModelStore(directory=MODEL_STORE_DIR if MODEL_STORE_PERSIST else None)
@@ -0,0 +1,240 @@
+# backend/app/triage/offload.py
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .timing import request_timing, span, stage_seconds
+
+# ============================================================
+# CPU POOL
+# ============================================================
+# A process pool, sized by `CPU_WORKERS` (default: one per core), for work
+# that a single computation splits into independent chunks: the KMeans fits
+# of a parameter sweep, bootstrap replicate chunks and large extraction
+# batches. Callers submit to it directly and wait for every chunk, so it has
+# no queue limit of its own; the analytics pool below bounds how many such
+# computations run at once.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", "0") or 0) or (os.cpu_count() or 1)
+
+_cpu_pool = None
+_cpu_pool_lock = threading.Lock()
+
+
+def get_cpu_pool():
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is None:
+            # spawn: forking a process that already runs OpenMP/BLAS threads can deadlock.
+            _cpu_pool = ProcessPoolExecutor(
+                max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _cpu_pool
+
+
+def shutdown_cpu_pool():
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=False, cancel_futures=True)
+            _cpu_pool = None
+
+
+# ============================================================
+# REQUEST COALESCING & OFFLOAD
+# ============================================================
+# Identical concurrent requests share one computation (`SingleFlight`): the
+# first caller computes and later callers wait for its result. This avoids
+# N identical KMeans fits when a dashboard opens several tabs at once.
+#
+# With `ANALYTICS_WORKERS` > 0, analytics misses run on a process pool of
+# that many processes, so fits and serialization do not compete with request
+# handling for the GIL. Each worker keeps its own warm corpora, so the
+# registry splits the corpus memory budget evenly between this process and
+# the workers; set `MODEL_STORE_PERSIST=1` as well so warm starts follow the
+# newest fit whichever worker made it. A worker that dies takes the pool
+# with it; the pool is rebuilt and the call retried once. The default, 0,
+# computes in-process on the threadpool. Either way at most
+# `ANALYTICS_MAX_QUEUE` computations may be queued or running; beyond that,
+# requests get a 503 with a `Retry-After` estimated from recent compute times.
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "0"))
+ANALYTICS_MAX_QUEUE = int(os.getenv("ANALYTICS_MAX_QUEUE", "0") or 0) or max(4, 4 * ANALYTICS_WORKERS)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one call. Errors are
+    shared too; nothing is cached once the call returns.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}  # key -> concurrent.futures.Future
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def do(self, key, fn):
+        future, leader = self._join(key)
+        if not leader:
+            with span("coalesced"):
+                return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def do_async(self, key, fn):
+        future, leader = self._join(key)
+        if not leader:
+            with span("coalesced"):
+                # shield: a disconnecting follower must not cancel the shared call.
+                return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy; retry in {retry_after}s")
+        self.retry_after = int(retry_after)
+
+
+def _init_offload_worker():
+    # Workers are already one of several processes; nested pools would oversubscribe.
+    global CPU_WORKERS
+    CPU_WORKERS = 1
+
+
+class OffloadPool:
+    """
+    Bounded process pool for CPU-heavy computations with queue-depth
+    backpressure. `workers=0` runs calls on threads in this process.
+    """
+
+    def __init__(self, workers, max_queue):
+        self.workers = int(workers)
+        self.max_queue = int(max_queue)
+        self.pending = 0          # queued + running
+        self.rejected = 0
+        self._mean_s = None       # EWMA of call durations
+        self.restarts = 0         # pools replaced after a worker died
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_offload_worker,
+                )
+            return self._pool
+
+    def _discard(self, pool):
+        """
+        Drop `pool` after one of its workers died; the next call starts a new one.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_in_pool(self, fn, *args):
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                self._discard(pool)
+        raise Overloaded(self.retry_after())
+
+    def retry_after(self):
+        per_call = self._mean_s if self._mean_s is not None else 1.0
+        return max(1, math.ceil(per_call * self.pending / max(self.workers, 1)))
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.retry_after())
+            self.pending += 1
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                return await self._run_in_pool(fn, *args)
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.pending -= 1
+                self._mean_s = elapsed if self._mean_s is None else 0.8 * self._mean_s + 0.2 * elapsed
+
+    def warm(self, fn):
+        """
+        Start the worker processes and run `fn` about once in each.
+        """
+        if self.workers > 0:
+            pool = self._get_pool()
+            try:
+                for future in [pool.submit(fn) for _ in range(self.workers)]:
+                    future.result()
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+analytics_flight = SingleFlight("analytics")
+lab_flight = SingleFlight("lab")
+analytics_pool = OffloadPool(ANALYTICS_WORKERS, ANALYTICS_MAX_QUEUE)
+
+
+def merge_stage_timings(stages, observe):
+    """
+    Fold stage timings measured elsewhere into the current request. Timings
+    from another process are also observed into this process's histograms.
+    """
+    timing = request_timing.get()
+    for name, seconds in stages:
+        if observe:
+            stage_seconds.observe((name,), seconds)
+        if timing is not None:
+            timing.stages[name] = timing.stages.get(name, 0.0) + seconds
@@ -0,0 +1,65 @@
+# backend/app/triage/pagination.py
+import base64
+import json
+import os
+from typing import Optional
+
+from .encoding import encode_json
+
+# ============================================================
+# NOTES LAB PAGINATION
+# ============================================================
+NOTES_LAB_MAX_LIMIT = int(os.getenv("NOTES_LAB_MAX_LIMIT", "5000"))
+NOTES_LAB_FIELDS = (
+    "note_id", "client_id", "created_at", "clinician", "site", "status", "tags",
+    "snippet", "note", "child_index", "note_number", "archetype",
+    "trajectory_type", "source_file",
+)
+NDJSON_BATCH_ROWS = 256
+
+
+def encode_cursor(key) -> Optional[str]:
+    if key is None:
+        return None
+    raw = json.dumps([key[0], key[1]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        client_id, note_number = json.loads(raw)
+        return (str(client_id), int(note_number))
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def parse_fields(fields: Optional[str]):
+    if not fields:
+        return None
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in NOTES_LAB_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {unknown}. Valid fields: {list(NOTES_LAB_FIELDS)}")
+    return wanted
+
+
+def project(rows, fields):
+    if fields is None:
+        return rows
+    return [{f: r.get(f) for f in fields} for r in rows]
+
+
+def iter_ndjson(rows, meta, fields, next_cursor):
+    """
+    NDJSON body: a `{"meta": ...}` line, one line per note, then a
+    `{"next_cursor": ...}` line. Rows are encoded in small batches so
+    memory stays bounded by the batch, not the page.
+    """
+    yield encode_json({"meta": meta}) + b"\n"
+    for start in range(0, len(rows), NDJSON_BATCH_ROWS):
+        batch = project(rows[start:start + NDJSON_BATCH_ROWS], fields)
+        yield b"".join(encode_json(r) + b"\n" for r in batch)
+    yield encode_json({"next_cursor": next_cursor}) + b"\n"
@@ -0,0 +1,364 @@
+# backend/app/triage/registry.py
+import contextvars
+import json
+import os
+import stat
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from .batches import corpus_cache
+from .caches import analytics_cache, dtw_cache
+from .corpus import IncrementalCorpus
+from .search import SearchIndex
+from .timing import StageClock
+
+# ============================================================
+# INPUT FILE DISCOVERY
+# ============================================================
+APP_DIR = Path(__file__).resolve().parents[1]              # .../triaging-simulation/backend/app
+BACKEND_DIR = APP_DIR.parent                               # .../triaging-simulation/backend
+TRIAGE_ROOT = BACKEND_DIR.parent                           # .../triaging-simulation
+WORKSPACE_ROOT = TRIAGE_ROOT.parent                        # .../case-study
+
+# Files the service itself produces (persisted models, evaluation output) go
+# under `STATE_DIR`, never into a corpus directory.
+STATE_DIR = Path(os.getenv("STATE_DIR", "").strip() or BACKEND_DIR / ".state")
+
+# Discovery results are cached with the mtimes of the directories checked
+# on the way to the match. Adding, removing or renaming a batch file changes
+# its directory's mtime, so a cache hit costs one stat per directory instead
+# of a glob. A directory modified within `DISCOVERY_MTIME_SLACK_S` of the
+# scan is not trusted yet (coarse filesystem clocks) and is rescanned.
+DISCOVERY_MTIME_SLACK_S = float(os.getenv("DISCOVERY_MTIME_SLACK_S", "2"))
+
+_discovery_cache = {}  # (dir, glob, fallbacks) -> (((dir, mtime_ns), ...), paths)
+_discovery_lock = threading.Lock()
+
+
+def _dir_mtime_ns(directory: Path):
+    try:
+        st = directory.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns if stat.S_ISDIR(st.st_mode) else None
+
+
+def get_json_paths(corpus=None):
+    """
+    Discover batch-note JSON files for `corpus` (default: the request's
+    corpus). A registered corpus is read from its own directory only. The
+    default corpus searches likely locations, primarily
+    `backend/app/mock-notes`; use `MOCK_NOTES_DIR` to override directory and
+    `MOCK_NOTES_GLOB` to override filename pattern.
+    """
+    corpus = corpus if corpus is not None else current_corpus()
+    fallbacks = corpus.directory is None
+    if fallbacks:
+        env_dir = os.getenv("MOCK_NOTES_DIR", "").strip()
+        pattern = os.getenv("MOCK_NOTES_GLOB", "batch_notes_eval_*.json")
+    else:
+        env_dir, pattern = corpus.directory, corpus.pattern
+
+    key = (env_dir, pattern, fallbacks)
+    with _discovery_lock:
+        cached = _discovery_cache.get(key)
+    if cached is not None:
+        checked, paths = cached
+        if all(_dir_mtime_ns(d) == mtime for d, mtime in checked):
+            return list(paths)
+
+    candidate_dirs = []
+    if env_dir:
+        candidate_dirs.append(Path(env_dir))
+    if fallbacks:
+        candidate_dirs.extend([
+            APP_DIR / "mock-notes",
+            BACKEND_DIR / "mock-notes",
+            TRIAGE_ROOT / "mock-notes",
+            WORKSPACE_ROOT / "mock-notes",
+            WORKSPACE_ROOT / "output",
+        ])
+
+    checked = []
+    for directory in candidate_dirs:
+        mtime = _dir_mtime_ns(directory)
+        checked.append((directory, mtime))
+        if mtime is None:
+            continue
+
+        matches = sorted(directory.glob(pattern))
+        if matches:
+            paths = [p.resolve() for p in matches]
+            settled = time.time_ns() - DISCOVERY_MTIME_SLACK_S * 1e9
+            if all(m is None or m < settled for _, m in checked):
+                with _discovery_lock:
+                    _discovery_cache[key] = (tuple(checked), tuple(paths))
+            return paths
+
+    searched = [str(d.resolve()) for d in candidate_dirs]
+    raise FileNotFoundError(
+        f"No JSON files found with pattern '{pattern}'. "
+        f"Searched directories: {searched}. "
+        + ("Set MOCK_NOTES_DIR to override." if fallbacks else f"Check the '{corpus.name}' entry in CORPORA.")
+    )
+
+
+def load_all_jsons():
+    json_paths = get_json_paths()
+    data = []
+    per_file_raw = {}
+    per_file_has_deltas = Counter()
+    per_file_missing_deltas = Counter()
+    per_file_lengths = defaultdict(list)
+
+    for p, chunk in corpus_cache.load_many(json_paths):
+        per_file_raw[p.name] = len(chunk)
+
+        for child in chunk:
+            if isinstance(child, dict):
+                # Shallow copy: `chunk` is shared through `corpus_cache`.
+                child = {**child, "_source_file": p.name}
+                gpt_deltas = child.get("gpt_deltas")
+                if gpt_deltas and isinstance(gpt_deltas, list) and len(gpt_deltas) > 0:
+                    per_file_has_deltas[p.name] += 1
+                    per_file_lengths[p.name].append(len(gpt_deltas))
+                else:
+                    per_file_missing_deltas[p.name] += 1
+            data.append(child)
+
+    per_file = []
+    for p in json_paths:
+        name = p.name
+        lens = per_file_lengths[name]
+        per_file.append({
+            "file": name,
+            "path": str(p),
+            "total": int(per_file_raw.get(name, 0)),
+            "with_gpt_deltas": int(per_file_has_deltas.get(name, 0)),
+            "missing_or_empty_gpt_deltas": int(per_file_missing_deltas.get(name, 0)),
+            "min_len": int(min(lens)) if lens else None,
+            "max_len": int(max(lens)) if lens else None,
+        })
+
+    return data, per_file, json_paths
+
+
+class CorpusWatcher(threading.Thread):
+    """
+    Polls the directories of the registered corpora that are in memory and
+    applies changes to their incremental indexes ahead of the next request.
+    """
+
+    def __init__(self, registry, interval):
+        super().__init__(name="corpus-watcher", daemon=True)
+        self.registry = registry
+        self.interval = float(interval)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            for corpus in self.registry.resident():
+                try:
+                    corpus.sync()
+                except Exception:
+                    # Requests still sync on their own; try again next tick.
+                    continue
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def load_unionized_notes():
+    """
+    Loads all discovered batch-note JSON files, extracts all generator notes, unions/deduplicates them,
+    and returns rows tailored for frontend display.
+    """
+    # Keep one note per (client, note_number) across files.
+    # If the same slot appears in multiple batch files, later files win.
+    clock = StageClock()
+    corpus = current_corpus()
+    json_paths = get_json_paths(corpus)
+    clock.lap("discover")
+    notes = corpus.incremental
+    notes.sync(json_paths)
+    clock.lap("ingest")
+    rows_and_meta = notes.union()
+    clock.lap("union")
+    return rows_and_meta
+
+
+# ============================================================
+# CORPUS REGISTRY
+# ============================================================
+# One process serves several named corpora (classes, sites, evaluation
+# runs). `CORPORA` is a JSON object mapping each name to a directory or to
+# {"dir": ..., "glob": ...}; requests choose one with `?corpus=` (POST
+# bodies: "corpus"). "default" is always available and keeps the
+# `MOCK_NOTES_DIR` / `MOCK_NOTES_GLOB` discovery.
+#
+# Each corpus has its own incremental index and search index; the parsed-file,
+# analytics and DTW caches are shared and keyed by corpus. A corpus's
+# resident bytes are its note rows (estimated in-memory size), delta and
+# feature matrices, and its entries in those shared caches. All corpora
+# share `CORPUS_MEMORY_BUDGET_MB` (0 disables it): after each request, while
+# the total is over budget, the least recently used corpus that is not
+# serving a request is released and rebuilt on its next use. The most
+# recently used corpus always stays. The server process and each analytics
+# worker hold their own corpora, so each enforces an equal share of it.
+DEFAULT_CORPUS = "default"
+CORPUS_MEMORY_BUDGET_BYTES = int(float(os.getenv("CORPUS_MEMORY_BUDGET_MB", "2048")) * 1024 * 1024)
+
+_current_corpus = contextvars.ContextVar("corpus", default=None)
+
+
+def parse_corpora(value):
+    """
+    `CORPORA` JSON -> {name: (directory, glob)}.
+    """
+    if not value.strip():
+        return {}
+    raw = json.loads(value)
+    if not isinstance(raw, dict):
+        raise ValueError("CORPORA must be a JSON object of name -> directory")
+    specs = {}
+    for name, spec in raw.items():
+        if isinstance(spec, str):
+            spec = {"dir": spec}
+        if not isinstance(spec, dict) or not spec.get("dir"):
+            raise ValueError(f"CORPORA entry '{name}' needs a directory")
+        specs[str(name)] = (str(spec["dir"]), str(spec.get("glob") or "batch_notes_eval_*.json"))
+    return specs
+
+
+class Corpus:
+    """
+    A named corpus: where its batch files live, plus its in-memory indexes.
+    `directory=None` is the default corpus with `MOCK_NOTES_DIR` discovery.
+    """
+
+    def __init__(self, name, directory=None, pattern=None):
+        self.name = name
+        self.directory = directory
+        self.pattern = pattern
+        self.incremental = IncrementalCorpus()
+        self.search_index = SearchIndex(self)
+        self.active = 0             # requests currently using this corpus
+        self.released = 0
+
+    def sync(self):
+        """
+        Bring the incremental index up to date and return it.
+        """
+        notes = self.incremental
+        notes.sync(get_json_paths(self))
+        return notes
+
+    def resident_bytes(self):
+        files = self.incremental.files()
+        return (
+            self.incremental.resident_bytes
+            + corpus_cache.bytes_for(files)
+            + analytics_cache.bytes_where(lambda k: k[0] == self.name)
+            + dtw_cache.bytes_where(lambda k: k[0][0] == self.name)
+        )
+
+    def release(self):
+        """
+        Drop everything this corpus holds in memory.
+        """
+        corpus_cache.discard(self.incremental.files())
+        analytics_cache.discard_if(lambda k: k[0] == self.name)
+        dtw_cache.discard_if(lambda k: k[0][0] == self.name)
+        self.incremental = IncrementalCorpus()
+        self.search_index = SearchIndex(self)
+        self.released += 1
+
+
+class CorpusRegistry:
+    def __init__(self, specs, budget_bytes=CORPUS_MEMORY_BUDGET_BYTES, processes=1):
+        self.processes = max(1, int(processes))
+        self.total_budget_bytes = int(budget_bytes)
+        self.budget_bytes = self.total_budget_bytes // self.processes   # this process's share
+        self._lock = threading.Lock()
+        self._corpora = OrderedDict()  # name -> Corpus, least recently used first
+        self._corpora[DEFAULT_CORPUS] = Corpus(DEFAULT_CORPUS)
+        for name, (directory, pattern) in specs.items():
+            self._corpora[name] = Corpus(name, directory, pattern)
+
+    def get(self, name=None):
+        name = str(name).strip() if name else DEFAULT_CORPUS
+        corpus = self._corpora.get(name)
+        if corpus is None:
+            raise ValueError(f"Unknown corpus: {name} (available: {sorted(self._corpora)})")
+        return corpus
+
+    def corpora(self):
+        with self._lock:
+            return list(self._corpora.values())
+
+    def resident(self):
+        return [c for c in self.corpora() if c.incremental.version > 0]
+
+    @contextmanager
+    def use(self, name=None):
+        """
+        Make `name` the current corpus for the enclosed request. A corpus in
+        use is never released; the budget is enforced on the way out.
+        """
+        corpus = self.get(name)
+        with self._lock:
+            corpus.active += 1
+            self._corpora.move_to_end(corpus.name)
+        token = _current_corpus.set(corpus)
+        try:
+            yield corpus
+        finally:
+            _current_corpus.reset(token)
+            with self._lock:
+                corpus.active -= 1
+            self.enforce_budget()
+
+    def enforce_budget(self):
+        """
+        Release idle corpora, coldest first, until the total fits the budget.
+        The most recently used corpus is kept even if it alone is over.
+        Returns the names released.
+        """
+        if self.budget_bytes <= 0:
+            return []
+        released = []
+        with self._lock:
+            sizes = {name: c.resident_bytes() for name, c in self._corpora.items()}
+            total = sum(sizes.values())
+            for name, corpus in list(self._corpora.items())[:-1]:
+                if total <= self.budget_bytes:
+                    break
+                if corpus.active or not sizes[name]:
+                    continue
+                corpus.release()
+                total -= sizes[name]
+                released.append(name)
+        return released
+
+    def stats(self):
+        return {
+            c.name: {"resident_bytes": c.resident_bytes(), "active": c.active, "released": c.released}
+            for c in self.corpora()
+        }
+
+
+def current_corpus():
+    """
+    The corpus of the running request (the default corpus outside one).
+    """
+    corpus = _current_corpus.get()
+    return corpus if corpus is not None else corpus_registry.get()
+
+
+corpus_registry = CorpusRegistry(
+    parse_corpora(os.getenv("CORPORA", "")),
+    processes=1 + max(0, int(os.getenv("ANALYTICS_WORKERS", "0"))),
+)
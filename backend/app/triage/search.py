@@ -0,0 +1,373 @@
+# backend/app/triage/search.py
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from .batches import make_snippet
+
+# ============================================================
+# FULL-TEXT SEARCH
+# ============================================================
+# Inverted index over the unionized note texts with BM25 ranking. Postings are
+# append-only int32 arrays per term (about 8 bytes per distinct term per note).
+# They are compiled lazily into NumPy arrays, so a query costs a few vectorized
+# passes over the postings of its terms. The index follows
+# its corpus's `IncrementalCorpus.version`. On a change, only rows whose object changed
+# (their file was re-ingested) are re-tokenized. Replaced and removed notes
+# leave dead slots that queries mask out; once a quarter of the slots are
+# dead, the postings are compacted.
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+SEARCH_BM25_K1 = float(os.getenv("SEARCH_BM25_K1", "1.2"))
+SEARCH_BM25_B = float(os.getenv("SEARCH_BM25_B", "0.75"))
+SEARCH_FILTER_FIELDS = ("archetype", "trajectory_type", "clinician", "status")
+SEARCH_SNIPPET_CHARS = 160
+SEARCH_COMPACT_MIN_SLOTS = 4096
+SEARCH_CHAMPIONS = 128
+
+# Phoneme notation is indexed as its own token ("/k/"), so a search for "/k/"
+# does not also match every "k" in a word list.
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+# "/k/", "/k, g/", "/p, t, m/"; "Parent/Caregiver" does not match (no closing slash).
+PHONEME_RE = re.compile(r"(?<![\w/])/([a-zʃʒθðŋ]{1,2}(?:,[ \t]*[a-zʃʒθðŋ]{1,2})*)/(?![\w/])")
+PHONEME_ITEM_RE = re.compile(r"[a-zʃʒθðŋ]{1,2}")
+
+
+def search_tokens(text):
+    lowered = str(text or "").lower()
+    tokens = _WORD_RE.findall(lowered)
+    for m in PHONEME_RE.finditer(lowered):
+        tokens.extend(f"/{p}/" for p in PHONEME_ITEM_RE.findall(m.group(1)))
+    return tokens
+
+
+class SearchIndex:
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self._lock = threading.RLock()
+        self.version = -1
+        self._slot_by_id = {}       # note_id -> slot of its live document
+        self._rows = []             # slot -> row (None once removed)
+        self._postings = {}         # term -> (array('i') slots, array('i') tfs), append-only
+        self._compiled = {}         # term -> (slots int64, tfs float64); cleared on change
+        self._norm = None           # per-slot BM25 length normalization
+        self._doc_len = np.zeros(0, dtype=np.float64)
+        self._alive = np.zeros(0, dtype=bool)
+        self._codes = {f: np.zeros(0, dtype=np.int32) for f in SEARCH_FILTER_FIELDS}
+        self._vocab = {f: {} for f in SEARCH_FILTER_FIELDS}   # field -> value -> code
+        self._total_len = 0.0
+        self._n_docs = 0
+
+    def _grow(self, n):
+        old = len(self._doc_len)
+        if n <= old:
+            return
+        size = max(n, old * 2, 1024)
+        self._doc_len = np.concatenate([self._doc_len, np.zeros(size - old)])
+        self._alive = np.concatenate([self._alive, np.zeros(size - old, dtype=bool)])
+        for f in SEARCH_FILTER_FIELDS:
+            self._codes[f] = np.concatenate([self._codes[f], np.full(size - old, -1, dtype=np.int32)])
+
+    def _remove(self, slot):
+        # Postings keep the dead slot until the next compaction; queries mask it.
+        self._total_len -= self._doc_len[slot]
+        self._n_docs -= 1
+        self._doc_len[slot] = 0.0
+        self._alive[slot] = False
+        self._rows[slot] = None
+
+    def _set_filters(self, slot, row):
+        for f in SEARCH_FILTER_FIELDS:
+            vocab = self._vocab[f]
+            self._codes[f][slot] = vocab.setdefault(str(row.get(f) or ""), len(vocab))
+
+    def _add(self, row):
+        slot = len(self._rows)
+        self._grow(slot + 1)
+        self._rows.append(row)
+        counts = Counter(search_tokens(row["note"]))
+        postings = self._postings
+        for term, tf in counts.items():
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = (array("i"), array("i"))
+            posting[0].append(slot)
+            posting[1].append(tf)
+        n_tokens = float(sum(counts.values()))
+        self._doc_len[slot] = n_tokens
+        self._total_len += n_tokens
+        self._n_docs += 1
+        self._alive[slot] = True
+        self._set_filters(slot, row)
+        return slot
+
+    def _compact(self):
+        """
+        Drop dead slots from every posting and renumber live slots densely.
+        """
+        live = np.flatnonzero(self._alive[:len(self._rows)])
+        remap = np.full(len(self._rows), -1, dtype=np.int64)
+        remap[live] = np.arange(live.size)
+        postings = {}
+        for term, (slots, tfs) in self._postings.items():
+            s = np.frombuffer(slots, dtype=np.int32)
+            keep = self._alive[s]
+            if keep.any():
+                postings[term] = (
+                    array("i", remap[s[keep]].astype(np.int32).tobytes()),
+                    array("i", np.frombuffer(tfs, dtype=np.int32)[keep].tobytes()),
+                )
+        self._postings = postings
+        self._rows = [self._rows[i] for i in live.tolist()]
+        self._slot_by_id = {row["note_id"]: i for i, row in enumerate(self._rows)}
+        self._doc_len = self._doc_len[live]
+        self._alive = np.ones(live.size, dtype=bool)
+        for f in SEARCH_FILTER_FIELDS:
+            self._codes[f] = self._codes[f][live]
+
+    def refresh(self):
+        """
+        Bring the index up to date with its corpus. Returns the number of
+        re-tokenized notes.
+        """
+        notes = self.corpus.sync()
+        with self._lock:
+            if self.version == notes.version:
+                return 0
+            rows, _meta = notes.union()
+            version = notes.version
+            seen = set()
+            reindexed = 0
+            for row in rows:
+                note_id = row["note_id"]
+                seen.add(note_id)
+                slot = self._slot_by_id.get(note_id)
+                if slot is not None and self._rows[slot] is row:
+                    continue
+                if slot is not None and self._rows[slot]["note"] == row["note"]:
+                    # Same text from a newer file: only metadata may differ.
+                    self._rows[slot] = row
+                    self._set_filters(slot, row)
+                    continue
+                if slot is not None:
+                    self._remove(slot)
+                self._slot_by_id[note_id] = self._add(row)
+                reindexed += 1
+            for note_id in [n for n in self._slot_by_id if n not in seen]:
+                self._remove(self._slot_by_id.pop(note_id))
+            if len(self._rows) > SEARCH_COMPACT_MIN_SLOTS and self._n_docs < 0.75 * len(self._rows):
+                self._compact()
+            self._compiled.clear()
+            self._norm = None
+            self.version = version
+            return reindexed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "docs": int(self._n_docs),
+                "slots": len(self._rows),
+                "terms": len(self._postings),
+                "version": self.version,
+            }
+
+    def _term_weights(self, term):
+        """
+        (live slots, BM25 weight per slot, max weight, champion slots) for
+        `term`. Weights depend only on the corpus version, so they are
+        computed once per term and version. Champions are the slots with the
+        highest weights and seed the pruning threshold in `search`.
+        """
+        compiled = self._compiled.get(term)
+        if compiled is None:
+            posting = self._postings.get(term)
+            if posting is None:
+                return None
+            slots = np.frombuffer(posting[0], dtype=np.int32).astype(np.int64)
+            tfs = np.frombuffer(posting[1], dtype=np.int32).astype(np.float64)
+            keep = self._alive[slots]
+            if not keep.all():
+                slots, tfs = slots[keep], tfs[keep]
+            if slots.size == 0:
+                return None
+            if self._norm is None:
+                avgdl = self._total_len / self._n_docs
+                doc_len = self._doc_len[:len(self._rows)]
+                self._norm = SEARCH_BM25_K1 * (1.0 - SEARCH_BM25_B + SEARCH_BM25_B * doc_len / avgdl)
+            df = slots.size
+            idf = np.log1p((self._n_docs - df + 0.5) / (df + 0.5))
+            weights = idf * tfs * (SEARCH_BM25_K1 + 1.0) / (tfs + self._norm[slots])
+            if df > SEARCH_CHAMPIONS:
+                champions = slots[np.argpartition(-weights, SEARCH_CHAMPIONS)[:SEARCH_CHAMPIONS]]
+            else:
+                champions = slots
+            compiled = self._compiled[term] = (slots, weights, float(weights.max()), champions)
+        return compiled
+
+    @staticmethod
+    def _score(parts, candidates):
+        """
+        Exact scores and matched-term counts for sorted candidate slots.
+        Terms are added in query order, like the bincount path.
+        """
+        scores = np.zeros(candidates.size, dtype=np.float64)
+        hits = np.zeros(candidates.size, dtype=np.int64)
+        for slots, weights, _ub, _champions in parts:
+            pos = np.minimum(np.searchsorted(slots, candidates), slots.size - 1)
+            present = slots[pos] == candidates
+            scores += np.where(present, weights[pos], 0.0)
+            hits += present
+        return scores, hits
+
+    def _keep(self, candidates, hits, n_terms, filters, match):
+        keep = np.ones(candidates.size, dtype=bool)
+        if match == "all" and n_terms > 1:
+            keep &= hits == n_terms
+        for field, code in filters:
+            keep &= self._codes[field][candidates] == code
+        return keep
+
+    def _pruned(self, parts, filters, match, want):
+        """
+        MaxScore-style top-`want`. The best exact score among the terms'
+        champions gives a threshold `theta`. Terms whose summed max weights
+        stay below `theta` cannot lift a note over it alone, so their postings
+        are only looked up, never scanned. For the remaining terms, a note at
+        or above `theta` needs a weight of at least `theta` minus the other
+        terms' max weights. Returns None when this does not prune enough.
+        """
+        seeds = np.unique(np.concatenate([p[3] for p in parts]))
+        seed_scores, seed_hits = self._score(parts, seeds)
+        seed_scores = seed_scores[self._keep(seeds, seed_hits, len(parts), filters, match)]
+        if seed_scores.size < want:
+            return None
+        theta = np.partition(seed_scores, seed_scores.size - want)[seed_scores.size - want]
+        ub_total = sum(p[2] for p in parts)
+        non_essential = 0.0
+        selected = [seeds]
+        budget = len(self._rows) // 8
+        for slots, weights, ub, _champions in sorted(parts, key=lambda p: p[2]):
+            if non_essential + ub < theta:
+                non_essential += ub
+                continue
+            floor = theta - (ub_total - ub)
+            chosen = slots if floor <= 0 else slots[weights >= floor]
+            budget -= chosen.size
+            if budget < 0:
+                return None
+            selected.append(chosen)
+        candidates = np.unique(np.concatenate(selected))
+        scores, hits = self._score(parts, candidates)
+        keep = self._keep(candidates, hits, len(parts), filters, match)
+        return candidates[keep], scores[keep]
+
+    def _count(self, parts, filters, match):
+        n_slots = len(self._rows)
+        if match == "all" and len(parts) > 1:
+            counts = np.zeros(n_slots, dtype=np.int32)
+            for p in parts:
+                counts[p[0]] += 1
+            mask = counts == len(parts)
+        else:
+            mask = np.zeros(n_slots, dtype=bool)
+            for p in parts:
+                mask[p[0]] = True
+        for field, code in filters:
+            mask &= self._codes[field][:n_slots] == code
+        return int(np.count_nonzero(mask))
+
+    def search(self, query, filters=None, limit=20, offset=0, match="any"):
+        """
+        Return (total matches, [(row, score)]) for the BM25 ranking of `query`.
+        `match="all"` keeps only notes containing every query term.
+        """
+        terms = list(dict.fromkeys(search_tokens(query)))
+        with self._lock:
+            n_slots = len(self._rows)
+            if not terms or self._n_docs == 0:
+                return 0, []
+            parts = [self._term_weights(term) for term in terms]
+            parts = [p for p in parts if p is not None]
+            if not parts or (match == "all" and len(parts) < len(terms)):
+                return 0, []
+            codes = []
+            for field, value in (filters or {}).items():
+                code = self._vocab[field].get(value)
+                if code is None:
+                    return 0, []
+                codes.append((field, code))
+            want = offset + limit
+            n_postings = sum(p[0].size for p in parts)
+
+            if n_postings * 8 < n_slots:
+                # Rare terms: score every posting.
+                slots = np.concatenate([p[0] for p in parts])
+                candidates, inverse = np.unique(slots, return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts]))
+                hits = np.bincount(inverse)
+                keep = self._keep(candidates, hits, len(parts), codes, match)
+                candidates, scores = candidates[keep], scores[keep]
+                total = int(candidates.size)
+            elif (pruned := self._pruned(parts, codes, match, want)) is not None:
+                candidates, scores = pruned
+                total = self._count(parts, codes, match)
+            else:
+                # Common terms that do not prune: dense pass over all slots.
+                # Per-term bincounts add in query order, like `_score`.
+                dense = np.bincount(parts[0][0], weights=parts[0][1], minlength=n_slots)
+                for slots, weights, _ub, _champions in parts[1:]:
+                    dense += np.bincount(slots, weights=weights, minlength=n_slots)
+                mask = dense > 0
+                if match == "all" and len(parts) > 1:
+                    counts = np.zeros(n_slots, dtype=np.int32)
+                    for p in parts:
+                        counts[p[0]] += 1
+                    mask &= counts == len(parts)
+                for field, code in codes:
+                    mask &= self._codes[field][:n_slots] == code
+                total = int(np.count_nonzero(mask))
+                if total > want:
+                    masked = np.where(mask, dense, -1.0)
+                    kth = np.partition(masked, n_slots - want)[n_slots - want]
+                    candidates = np.flatnonzero(masked >= kth)
+                else:
+                    candidates = np.flatnonzero(mask)
+                scores = dense[candidates]
+
+            if candidates.size > want:
+                kth = np.partition(scores, candidates.size - want)[candidates.size - want]
+                top = np.flatnonzero(scores >= kth)
+                candidates, scores = candidates[top], scores[top]
+            # Ties break on note_id, i.e. (client, note number) order, so paging
+            # is stable; slots are reassigned when notes change.
+            note_ids = np.array([self._rows[s]["note_id"] for s in candidates])
+            order = np.lexsort((note_ids, -scores))[offset:want]
+            return total, [(self._rows[s], float(scores[i])) for i, s in zip(order, candidates[order])]
+
+
+def highlight_snippet(text, query, max_chars=SEARCH_SNIPPET_CHARS):
+    """
+    Window of `text` around the first query match, with [start, end) offsets
+    of every match inside the returned snippet.
+    """
+    terms = [t for t in dict.fromkeys(search_tokens(query))]
+    if not terms:
+        return make_snippet(text, max_chars), []
+    alternatives = sorted((re.escape(t) for t in terms), key=len, reverse=True)
+    pattern = re.compile(r"(?<![\w/])(?:" + "|".join(alternatives) + r")(?![\w/])", re.IGNORECASE)
+    first = pattern.search(text)
+    if first is None:
+        return make_snippet(text, max_chars), []
+    start = max(0, first.start() - max_chars // 3)
+    end = min(len(text), start + max_chars)
+    prefix = "…" if start > 0 else ""
+    window = text[start:end]
+    highlights = [
+        [m.start() + len(prefix), m.end() + len(prefix)] for m in pattern.finditer(window)
+    ]
+    snippet = prefix + window + ("…" if end < len(text) else "")
+    # Newlines are flattened one-for-one so the offsets stay valid.
+    return re.sub(r"\s", " ", snippet), highlights
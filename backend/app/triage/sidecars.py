@@ -0,0 +1,310 @@
+# backend/app/triage/sidecars.py
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .batches import (
+    corpus_cache,
+    file_fingerprint,
+    is_large_batch,
+    is_number,
+    iter_batch_children,
+    make_snippet,
+    parse_created_at,
+    safe_int,
+)
+
+# ============================================================
+# COLUMNAR SIDECARS
+# ============================================================
+# Each batch file can be compiled into a directory of .npy columns under
+# `<batch dir>/.columnar/<file name>/`: ragged float deltas (values + offsets),
+# categorical archetype / trajectory / created_at codes, and note texts as one
+# UTF-8 blob with offsets. A manifest records the source (size, mtime_ns);
+# a sidecar is only used while it matches. Columns are memory-mapped.
+#
+# Sidecars are built offline with `python -m triage compile-sidecars`.
+# `COLUMNAR_SIDECARS`: `off` (JSON only), `read` (default: use fresh
+# sidecars, never write) or `auto` (opt-in: also write a sidecar whenever a
+# batch file is parsed from JSON, i.e. on the request path).
+COLUMNAR_SIDECARS = os.getenv("COLUMNAR_SIDECARS", "read").strip().lower()
+SIDECAR_DIRNAME = ".columnar"
+SIDECAR_FORMAT_VERSION = 1
+
+
+class SidecarUnsupported(ValueError):
+    """The batch file has values the columnar schema can't represent exactly."""
+
+
+def sidecar_dir(p: Path) -> Path:
+    return p.parent / SIDECAR_DIRNAME / p.name
+
+
+def _categorical(values):
+    categories = []
+    index = {}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for i, v in enumerate(values):
+        if v is None:
+            continue
+        if not isinstance(v, str):
+            raise SidecarUnsupported(f"expected a string or null, got {type(v).__name__}")
+        if v not in index:
+            index[v] = len(categories)
+            categories.append(v)
+        codes[i] = index[v]
+    return codes, categories
+
+
+def compile_sidecar(p: Path, chunk=None) -> Path:
+    """
+    Write the columnar sidecar for batch file `p` (streaming it unless the
+    parsed `chunk` is given). Raises SidecarUnsupported when a child doesn't
+    fit the schema; such files keep loading from JSON.
+    """
+    p = Path(p)
+    fp = file_fingerprint(p)
+    if chunk is None:
+        chunk = iter_batch_children(p)
+    total = 0
+
+    child_index, child_index_missing = [], []
+    archetypes, trajectories, created = [], [], []
+    delta_offsets, delta_values = [0], []
+    note_child, note_numbers, text_offsets, texts = [], [], [0], []
+
+    for child in chunk:
+        total += 1
+        if not isinstance(child, dict):
+            continue
+        row = len(child_index)
+
+        ci = child.get("child_index")
+        if ci is not None and not (isinstance(ci, int) and not isinstance(ci, bool)):
+            raise SidecarUnsupported(f"{p.name}: child_index {ci!r} is not an integer")
+        child_index.append(ci or 0)
+        child_index_missing.append(ci is None)
+        archetypes.append(child.get("archetype"))
+
+        gpt_deltas = child.get("gpt_deltas")
+        if gpt_deltas:
+            if not isinstance(gpt_deltas, list) or not all(is_number(v) for v in gpt_deltas):
+                raise SidecarUnsupported(f"{p.name}: gpt_deltas must be a list of numbers")
+            delta_values.extend(gpt_deltas)
+        delta_offsets.append(len(delta_values))
+
+        gen = child.get("generator_result") or {}
+        gen_data = gen.get("data") if isinstance(gen, dict) else None
+        notes = gen_data.get("notes") if isinstance(gen_data, dict) else None
+        trajectories.append(gen_data.get("trajectory_type") if isinstance(gen_data, dict) else None)
+        created.append(parse_created_at(gen.get("json", "")) if isinstance(gen, dict) else "")
+        if not isinstance(notes, list):
+            continue
+
+        for idx, note_obj in enumerate(notes):
+            if not isinstance(note_obj, dict):
+                continue
+            note_text = str(note_obj.get("note_text") or "").strip()
+            if not note_text:
+                continue
+            encoded = note_text.encode("utf-8")
+            note_child.append(row)
+            note_numbers.append(safe_int(note_obj.get("note_number"), idx + 1))
+            texts.append(encoded)
+            text_offsets.append(text_offsets[-1] + len(encoded))
+
+    archetype_codes, archetype_categories = _categorical(archetypes)
+    trajectory_codes, trajectory_categories = _categorical(trajectories)
+    created_codes, created_categories = _categorical(created)
+
+    columns = {
+        "child_index": np.asarray(child_index, dtype=np.int64),
+        "child_index_missing": np.asarray(child_index_missing, dtype=bool),
+        "archetype": archetype_codes,
+        "trajectory_type": trajectory_codes,
+        "created_at": created_codes,
+        "delta_offsets": np.asarray(delta_offsets, dtype=np.int64),
+        "delta_values": np.asarray(delta_values, dtype=float),
+        "note_child": np.asarray(note_child, dtype=np.int64),
+        "note_number": np.asarray(note_numbers, dtype=np.int64),
+        "text_offsets": np.asarray(text_offsets, dtype=np.int64),
+        "text": np.frombuffer(b"".join(texts), dtype=np.uint8),
+    }
+    manifest = {
+        "format_version": SIDECAR_FORMAT_VERSION,
+        "source": {"name": p.name, "size": fp[1], "mtime_ns": fp[2]},
+        "total": total,
+        "categories": {
+            "archetype": archetype_categories,
+            "trajectory_type": trajectory_categories,
+            "created_at": created_categories,
+        },
+    }
+
+    target = sidecar_dir(p)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{p.name}.", dir=target.parent))
+    try:
+        os.chmod(tmp, 0o755)
+        for name, arr in columns.items():
+            np.save(tmp / f"{name}.npy", arr)
+        (tmp / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+class ColumnarBatch:
+    """
+    Memory-mapped columns of one compiled batch file.
+    """
+
+    def __init__(self, directory: Path, manifest):
+        self.manifest = manifest
+        self.total = int(manifest["total"])
+        self.categories = manifest["categories"]
+        self._dir = directory
+        self._columns = {}
+
+    def __getitem__(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(self._dir / f"{name}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def category(self, column, code):
+        return self.categories[column][code] if code >= 0 else None
+
+
+def load_sidecar(p: Path):
+    """
+    Return the ColumnarBatch for `p` if a sidecar exists and matches the
+    file's current (size, mtime_ns); otherwise None.
+    """
+    directory = sidecar_dir(p)
+    try:
+        manifest = json.loads((directory / "manifest.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    _, size, mtime_ns = file_fingerprint(p)
+    source = manifest.get("source") or {}
+    if (
+        manifest.get("format_version") != SIDECAR_FORMAT_VERSION
+        or source.get("size") != size
+        or source.get("mtime_ns") != mtime_ns
+    ):
+        return None
+    return ColumnarBatch(directory, manifest)
+
+
+def note_rows_from_columns(p: Path, cols: ColumnarBatch):
+    """
+    Columnar equivalent of `note_rows_from_chunk`.
+    """
+    rows = {}
+    child_index = cols["child_index"].tolist()
+    delta_offsets = cols["delta_offsets"].tolist()
+    archetype = [cols.category("archetype", c) for c in cols["archetype"].tolist()]
+    trajectory = [cols.category("trajectory_type", c) for c in cols["trajectory_type"].tolist()]
+    created = [cols.category("created_at", c) for c in cols["created_at"].tolist()]
+    note_child = cols["note_child"].tolist()
+    note_numbers = cols["note_number"].tolist()
+    offsets = cols["text_offsets"].tolist()
+    text = memoryview(cols["text"])
+
+    for i, c in enumerate(note_child):
+        child_idx = child_index[c]
+        client_num = child_idx + 1
+        client_id = f"C-{client_num:04d}"
+        note_number = note_numbers[i]
+        arch = archetype[c]
+        trajectory_type = trajectory[c]
+        note_text = str(text[offsets[i]:offsets[i + 1]], "utf-8")
+        has_eval = delta_offsets[c + 1] > delta_offsets[c]
+        note_id = f"{client_id}-N{note_number:02d}"
+
+        rows[(client_id, note_number)] = {
+            "note_id": note_id,
+            "client_id": client_id,
+            "created_at": created[c] or "unknown",
+            "clinician": f"SLP-{(client_num % 12) + 1:02d}",
+            "site": "Cambridge",
+            "status": "evaluated" if has_eval else "extracted",
+            "tags": [t for t in [arch, trajectory_type] if t],
+            "snippet": make_snippet(note_text, max_chars=150),
+            "note": note_text,
+            "child_index": child_idx,
+            "note_number": note_number,
+            "archetype": arch,
+            "trajectory_type": trajectory_type,
+            "source_file": p.name,
+        }
+
+    return rows, len(note_child)
+
+
+def delta_block_from_columns(p: Path, cols: ColumnarBatch):
+    """
+    Columnar equivalent of `delta_block_from_chunk`; the deltas matrix is
+    filled straight from the mapped values without per-child lists.
+    """
+    offsets = np.asarray(cols["delta_offsets"])
+    all_lengths = np.diff(offsets)
+    usable = np.flatnonzero(all_lengths > 0)
+    lengths = all_lengths[usable]
+    width = int(lengths.max()) if lengths.size else 0
+    deltas = np.zeros((lengths.size, width), dtype=float)
+    if lengths.size:
+        deltas[np.arange(width) < lengths[:, None]] = cols["delta_values"]
+
+    child_index = cols["child_index"].tolist()
+    missing = cols["child_index_missing"].tolist()
+    archetype = cols["archetype"].tolist()
+    meta = [
+        {
+            "child_index": None if missing[c] else child_index[c],
+            "archetype": cols.category("archetype", archetype[c]),
+            "source_file": p.name,
+        }
+        for c in usable.tolist()
+    ]
+
+    summary = {
+        "file": p.name,
+        "path": str(p),
+        "total": int(cols.total),
+        "with_gpt_deltas": int(lengths.size),
+        "missing_or_empty_gpt_deltas": int(all_lengths.size - lengths.size),
+        "min_len": int(lengths.min()) if lengths.size else None,
+        "max_len": int(lengths.max()) if lengths.size else None,
+    }
+    return (deltas, lengths, meta), summary
+
+
+def load_batch_columns(p: Path):
+    """
+    Fresh sidecar for `p` if one is available (compiling it in `auto`
+    mode), else None. In `auto` mode the parsed JSON is returned alongside
+    so callers don't parse twice: (ColumnarBatch or None, chunk or None).
+    """
+    if COLUMNAR_SIDECARS == "off":
+        return None, None
+    cols = load_sidecar(p)
+    if cols is not None or COLUMNAR_SIDECARS != "auto":
+        return cols, None
+
+    # Large files are streamed straight into the sidecar and then mapped.
+    chunk = None if is_large_batch(p) else corpus_cache.load(p)
+    try:
+        compile_sidecar(p, chunk)
+    except (OSError, SidecarUnsupported):
+        # Read-only data dir or unusual values: keep serving from JSON.
+        return None, chunk
+    return (load_sidecar(p), None) if chunk is None else (None, chunk)
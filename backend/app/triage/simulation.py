@@ -0,0 +1,194 @@
+# backend/app/triage/simulation.py
+import os
+
+import numpy as np
+
+# ============================================================
+# CLINIC CAPACITY SIMULATION
+# ============================================================
+# `POST /simulate` plays a clinic forward week by week under the per-cluster
+# audit policies of a fitted cluster model. Children arrive as a Poisson
+# stream and join one FIFO waitlist. Each child in treatment holds one
+# weekly session slot; capacity is `clinicians * slots_per_clinician`. A new
+# child's cluster is drawn from the corpus cluster sizes. Under audit Q the
+# child passes with that cluster's P(t* <= Q) and receives Q sessions;
+# otherwise they receive T_max.
+#
+# All replications advance together: the weekly loop works on (R,) state
+# vectors, and child attributes are (R x children) matrices drawn once.
+# Every policy sees the same arrivals and draws (common random numbers), so
+# differences between policies are not sampling noise.
+SIMULATE_MAX_WEEKS = int(os.getenv("SIMULATE_MAX_WEEKS", "520"))
+SIMULATE_MAX_REPLICATIONS = int(os.getenv("SIMULATE_MAX_REPLICATIONS", "10000"))
+SIMULATE_MAX_DRAWS = int(os.getenv("SIMULATE_MAX_DRAWS", "20000000"))  # replications * children
+SIMULATE_POLICIES = ("qstar", "qmean", "none")
+SIMULATE_PERCENTILES = (10, 50, 90)
+
+
+def _event_weeks(counts, width):
+    """
+    Week of each event from per-week event counts: row r of the (R, W)
+    `counts` becomes week indices in event order, padded with W to `width`.
+    """
+    n_rows, n_weeks = counts.shape
+    per_row = counts.sum(axis=1)
+    flat_weeks = np.repeat(np.tile(np.arange(n_weeks), n_rows), counts.ravel())
+    row = np.repeat(np.arange(n_rows), per_row)
+    col = np.arange(row.size) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    out = np.full((n_rows, width), n_weeks, dtype=np.int64)
+    out[row, col] = flat_weeks
+    return out
+
+
+def audit_service_weeks(policy, model, cluster, U, overrides=None):
+    """
+    Sessions (= weeks in a slot) per child under `policy`: Q where the child
+    passes the audit at Q, T_max otherwise and for clusters without a policy.
+    `overrides` ({cluster: Q}) replace the audit point of the audit policies.
+    """
+    T_max = model.T_max
+    if policy == "none":
+        Q = np.full(len(model.valid), T_max, dtype=np.int64)
+    else:
+        Q = np.asarray(model.Qstar if policy == "qstar" else model.Qmean, dtype=np.int64).copy()
+        for c, q in (overrides or {}).items():
+            Q[int(c)] = int(q)
+    Q = np.clip(Q, 1, T_max)
+    p_pass = np.where(model.valid, model.F[np.arange(len(Q)), Q - 1], 0.0)
+    passed = U < p_pass[cluster]
+    return np.where(passed, Q[cluster], T_max), Q
+
+
+def _distribution(samples, axis=0):
+    pct = np.percentile(samples, SIMULATE_PERCENTILES, axis=axis)
+    return {
+        "mean": samples.mean(axis=axis),
+        **{f"p{p}": v for p, v in zip(SIMULATE_PERCENTILES, pct)},
+    }
+
+
+def simulate_clinic(
+    model,
+    weeks=52,
+    replications=500,
+    arrivals_per_week=5.0,
+    clinicians=4,
+    slots_per_clinician=20,
+    initial_waitlist=0,
+    policies=SIMULATE_POLICIES,
+    overrides=None,
+    seed=0,
+):
+    W, R = int(weeks), int(replications)
+    capacity = int(clinicians) * int(slots_per_clinician)
+    if not 1 <= W <= SIMULATE_MAX_WEEKS:
+        raise ValueError(f"weeks must be between 1 and {SIMULATE_MAX_WEEKS}")
+    if not 1 <= R <= SIMULATE_MAX_REPLICATIONS:
+        raise ValueError(f"replications must be between 1 and {SIMULATE_MAX_REPLICATIONS}")
+    if capacity <= 0:
+        raise ValueError("clinicians and slots_per_clinician must be positive")
+    if arrivals_per_week < 0 or initial_waitlist < 0:
+        raise ValueError("arrivals_per_week and initial_waitlist must be non-negative")
+    unknown = [p for p in policies if p not in SIMULATE_POLICIES]
+    if unknown or not policies:
+        raise ValueError(f"policies must be a non-empty subset of {', '.join(SIMULATE_POLICIES)}")
+    if int(np.sum(model.sizes)) == 0:
+        raise ValueError("The cluster model has no children.")
+
+    rng = np.random.default_rng(seed)
+    A = rng.poisson(float(arrivals_per_week), size=(R, W))
+    A[:, 0] += int(initial_waitlist)
+    cum_arrivals = np.cumsum(A, axis=1)
+    n_max = int(cum_arrivals[:, -1].max())
+    if R * n_max > SIMULATE_MAX_DRAWS:
+        raise ValueError(f"Simulation too large ({R * n_max} child draws, max {SIMULATE_MAX_DRAWS}).")
+
+    # Child j of replication r (in arrival order), shared by all policies.
+    child = np.broadcast_to(np.arange(n_max), (R, n_max))
+    arrival_week = _event_weeks(A, n_max)
+    exists = child < cum_arrivals[:, -1:]
+    arrivals_by_week = np.ascontiguousarray(cum_arrivals.T)
+    sizes = np.asarray(model.sizes, dtype=float)
+    cluster = rng.choice(len(sizes), size=(R, n_max), p=sizes / sizes.sum())
+    U = rng.random((R, n_max))
+
+    rows = np.arange(R)
+    out = {}
+    for policy in policies:
+        service, Q = audit_service_weeks(policy, model, cluster, U, overrides)
+        T_max = model.T_max
+        # Week-major state, so each step touches contiguous rows.
+        release = np.zeros((W + T_max + 1, R), dtype=np.int64)
+        starts = np.zeros((W, R), dtype=np.int64)
+        waitlist = np.empty((W, R), dtype=np.int64)
+        busy_by_week = np.empty((W, R), dtype=np.int64)
+        busy = np.zeros(R, dtype=np.int64)
+        head = np.zeros(R, dtype=np.int64)  # next child in FIFO order
+        for w in range(W):
+            busy -= release[w]
+            start = np.minimum(capacity - busy, arrivals_by_week[w] - head)
+            most = int(start.max())
+            if most:
+                # Children head[r] .. head[r] + start[r] - 1 of every replication
+                # free their slot `service` weeks from now (1 <= service <= T_max).
+                offset = np.arange(most)
+                j_idx = np.minimum(head[:, None] + offset, n_max - 1)
+                mask = offset < start[:, None]
+                slot = (service[rows[:, None], j_idx] - 1) * R + rows[:, None]
+                freed = np.bincount(slot[mask], minlength=T_max * R)
+                release[w + 1:w + T_max + 1] += freed.reshape(T_max, R)
+            starts[w] = start
+            busy += start
+            head += start
+            busy_by_week[w] = busy
+            waitlist[w] = arrivals_by_week[w] - head
+
+        waitlist, busy_by_week = waitlist.T, busy_by_week.T
+        started = child < head[:, None]
+        start_week = _event_weeks(starts.T, n_max)
+        waits = (start_week - arrival_week)[started]
+        completed = started & (start_week + service <= W)
+        sessions = busy_by_week.sum(axis=1)
+        if waits.size:
+            wait_summary = {
+                "mean": float(waits.mean()),
+                **{f"p{p}": float(v) for p, v in zip((50, 90, 95), np.percentile(waits, [50, 90, 95]))},
+                "histogram": np.bincount(waits, minlength=1),
+            }
+        else:
+            wait_summary = {"mean": None, "p50": None, "p90": None, "p95": None, "histogram": []}
+        out[policy] = {
+            "Q": Q,
+            "waitlist": _distribution(waitlist),
+            "utilization": _distribution(busy_by_week / capacity),
+            "time_to_service_weeks": {
+                **wait_summary,
+                "still_waiting_fraction": float((exists & ~started).sum() / max(int(exists.sum()), 1)),
+            },
+            "totals": {
+                "arrivals": _distribution(cum_arrivals[:, -1].astype(float)),
+                "started": _distribution(head.astype(float)),
+                "completed": _distribution(completed.sum(axis=1).astype(float)),
+                "sessions_delivered": _distribution(sessions.astype(float)),
+                "final_waitlist": _distribution(waitlist[:, -1].astype(float)),
+                "mean_utilization": _distribution(busy_by_week.mean(axis=1) / capacity),
+            },
+        }
+    return {
+        "config": {
+            "weeks": W,
+            "replications": R,
+            "arrivals_per_week": float(arrivals_per_week),
+            "initial_waitlist": int(initial_waitlist),
+            "clinicians": int(clinicians),
+            "slots_per_clinician": int(slots_per_clinician),
+            "capacity_slots_per_week": capacity,
+            "T_max_sessions": model.T_max,
+            "seed": int(seed),
+            "cluster_share": sizes / sizes.sum(),
+            "model": model.params,
+        },
+        "week": np.arange(1, W + 1),
+        "percentiles": list(SIMULATE_PERCENTILES),
+        "policies": out,
+    }
@@ -0,0 +1,152 @@
+# backend/app/triage/sweep.py
+import itertools
+import os
+
+import numpy as np
+
+from . import offload
+from .clustering import fit_cluster_labels
+from .features import align_curves, evaluate_cluster_policies, stopping_points
+from .registry import corpus_registry, current_corpus, get_json_paths
+
+# ============================================================
+# PARAMETER SWEEPS
+# ============================================================
+# A sweep evaluates every point of a parameter grid but computes each shared
+# intermediate once: curves per smooth_window, t* per (window, alpha),
+# scaled X per (window, length_mode), KMeans per (window, length_mode, k)
+# and policies per (window, length_mode, k, alpha). A sweep runs on the
+# analytics pool like any other analytics miss; its independent KMeans fits
+# are spread over the CPU pool.
+SWEEP_MAX_POINTS = int(os.getenv("SWEEP_MAX_POINTS", "256"))
+
+
+def parse_grid(value, cast, default):
+    """
+    Parse a comma-separated query value ("3,4,5") into a de-duplicated list.
+    """
+    if value is None or str(value).strip() == "":
+        return [cast(default)]
+    out = []
+    for token in str(value).split(","):
+        token = token.strip()
+        if not token:
+            continue
+        v = cast(token)
+        if v not in out:
+            out.append(v)
+    if not out:
+        raise ValueError(f"Empty parameter grid: {value!r}")
+    return out
+
+
+def run_sweep(
+    n_clusters=(4,),
+    smooth_window=(3,),
+    alpha=(0.90,),
+    length_mode=("truncate",),
+):
+    grid = {
+        "n_clusters": [int(k) for k in n_clusters],
+        "smooth_window": [int(w) for w in smooth_window],
+        "alpha": [float(a) for a in alpha],
+        "length_mode": [str(m).strip().lower() for m in length_mode],
+    }
+    n_points = int(np.prod([len(v) for v in grid.values()]))
+    if n_points > SWEEP_MAX_POINTS:
+        raise ValueError(f"Sweep has {n_points} grid points (max {SWEEP_MAX_POINTS}).")
+
+    from sklearn.preprocessing import StandardScaler
+
+    corpus = current_corpus()
+    json_paths = get_json_paths(corpus)
+    notes = corpus.incremental
+    notes.sync(json_paths)
+
+    # Stage 1: curves per window, t* per (window, alpha).
+    curves_by_w = {}
+    tstars_by_wa = {}
+    for w in grid["smooth_window"]:
+        curves, lengths, _, _ = notes.features(w, grid["alpha"][0])
+        if len(lengths) < max(grid["n_clusters"]):
+            raise ValueError(
+                f"Not enough usable trajectories ({len(lengths)}) for n_clusters={max(grid['n_clusters'])}"
+            )
+        curves_by_w[w] = (curves, lengths)
+        for a in grid["alpha"]:
+            tstars_by_wa[(w, a)] = stopping_points(curves, lengths, a)
+
+    # Stage 2: aligned + scaled X per (window, length_mode).
+    scaled = {}
+    for w, mode in itertools.product(grid["smooth_window"], grid["length_mode"]):
+        X = align_curves(*curves_by_w[w], mode)
+        scaled[(w, mode)] = StandardScaler().fit_transform(X)
+
+    # Stage 3: one KMeans fit per (window, length_mode, k), across processes.
+    fit_keys = list(itertools.product(scaled, grid["n_clusters"]))
+    if len(fit_keys) > 1 and offload.CPU_WORKERS > 1:
+        pool = offload.get_cpu_pool()
+        futures = [pool.submit(fit_cluster_labels, scaled[xk], k) for xk, k in fit_keys]
+        fitted = [f.result() for f in futures]
+    else:
+        fitted = [fit_cluster_labels(scaled[xk], k) for xk, k in fit_keys]
+    labels_by_fit = {
+        (xk[0], xk[1], k): np.asarray(lbl) for (xk, k), lbl in zip(fit_keys, fitted)
+    }
+
+    # Stage 4: policies per (window, length_mode, k, alpha).
+    columns = [
+        "n_clusters", "smooth_window", "alpha", "length_mode", "T_max_sessions",
+        "cluster_sizes", "Qstar", "Qmean", "E_saved", "E_saved_mean",
+        "expected_total_saved", "expected_percent_saved",
+        "expected_total_saved_baseline", "expected_percent_saved_baseline",
+    ]
+    rows = []
+    for k, w, a, mode in itertools.product(
+        grid["n_clusters"], grid["smooth_window"], grid["alpha"], grid["length_mode"]
+    ):
+        labels = labels_by_fit[(w, mode, k)]
+        T_max = scaled[(w, mode)].shape[1] + 1
+        policies = evaluate_cluster_policies(tstars_by_wa[(w, a)], labels, k, T_max)
+        sizes = np.bincount(labels, minlength=k)[:k]
+        total_original = float(len(labels) * T_max)
+        saved = total_original - float((sizes * policies["E_delivered"]).sum())
+        saved_mean = total_original - float((sizes * policies["E_delivered_mean"]).sum())
+        valid = policies["valid"]
+        rows.append([
+            k, w, a, mode, int(T_max),
+            sizes.tolist(),
+            [int(q) if ok else None for q, ok in zip(policies["Qstar"].tolist(), valid)],
+            [int(q) if ok else None for q, ok in zip(policies["Qmean"].tolist(), valid)],
+            [float(T_max - e) if ok else None for e, ok in zip(policies["E_delivered"].tolist(), valid)],
+            [float(T_max - e) if ok else None for e, ok in zip(policies["E_delivered_mean"].tolist(), valid)],
+            saved,
+            (saved / total_original) if total_original > 0 else 0.0,
+            saved_mean,
+            (saved_mean / total_original) if total_original > 0 else 0.0,
+        ])
+
+    return {
+        "grid": grid,
+        "columns": columns,
+        "rows": rows,
+        "stages": {
+            "curves": len(curves_by_w),
+            "tstars": len(tstars_by_wa),
+            "scaled": len(scaled),
+            "kmeans_fits": len(fit_keys),
+            "grid_points": len(rows),
+        },
+        "inputs": {
+            "json_paths": [str(p) for p in json_paths],
+        },
+    }
+
+
+def compute_sweep(corpus_name, grid):
+    """
+    Pool entry point: `run_sweep` over `grid` (parsed lists per parameter)
+    on one corpus.
+    """
+    with corpus_registry.use(corpus_name):
+        return run_sweep(**grid)
@@ -0,0 +1,222 @@
+# backend/app/triage/timing.py
+import bisect
+import contextvars
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# ============================================================
+# REQUEST TIMING & METRICS
+# ============================================================
+# `span(name)` / `StageClock.lap(name)` time pipeline stages. Every timing
+# feeds the `triage_stage_seconds` histogram. Inside a request, timings are
+# also collected for that request and returned in a `Server-Timing` header.
+# `/metrics` exposes histograms, cache hit ratios and corpus sizes in the
+# Prometheus text format.
+#
+# With `PROFILE_SLOW_REQUEST_MS` > 0, every request is sampled by a
+# lightweight stack sampler. Requests slower than the threshold write a
+# folded-stack file (flamegraph.pl / speedscope input) to `PROFILE_DIR`.
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0") or 0)
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5") or 5)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "") or Path(tempfile.gettempdir()) / "triage-profiles")
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+request_timing = contextvars.ContextVar("request_timing", default=None)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram keyed by a tuple of label values.
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{n}="{_escape_label(v)}"' for n, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            running = 0
+            for bound, count in zip(self.buckets, series):
+                running += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+stage_seconds = Histogram("triage_stage_seconds", "Duration of pipeline stages.", ["stage"])
+request_seconds = Histogram(
+    "triage_request_seconds", "Duration of HTTP requests.", ["method", "route", "status"]
+)
+
+
+class RequestTiming:
+    def __init__(self):
+        self.stages = OrderedDict()   # stage -> summed seconds, in first-seen order
+        self.threads = {threading.get_ident()}
+
+
+def record_stage(name, seconds):
+    stage_seconds.observe((name,), seconds)
+    timing = request_timing.get()
+    if timing is not None:
+        timing.stages[name] = timing.stages.get(name, 0.0) + seconds
+        # Sync endpoints run on worker threads; the profiler samples those too.
+        timing.threads.add(threading.get_ident())
+
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+class StageClock:
+    """
+    Sequential stage timer for straight-line code: each `lap(name)` records
+    the time since the previous lap.
+    """
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        record_stage(name, now - self._last)
+        self._last = now
+
+
+def server_timing_header(timing: RequestTiming, total_s):
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timing.stages.items()]
+    parts.append(f"total;dur={total_s * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stacks of a request's threads every `interval` seconds into
+    folded-stack counts ("outer;inner;leaf count").
+    """
+
+    def __init__(self, timing: RequestTiming, interval):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.timing = timing
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for tid in list(self.timing.threads):
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, route, total_s):
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        path = PROFILE_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{slug}_{int(total_s * 1000)}ms.folded"
+        path.write_text("".join(f"{stack} {n}\n" for stack, n in self.samples.items()))
+        return path
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware: collects stage timings per request, adds the
+    `Server-Timing` header and records the request histogram.
+    """
+
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = request_timing.set(timing)
+        sampler = None
+        if PROFILE_SLOW_REQUEST_MS > 0:
+            sampler = StackSampler(timing, PROFILE_SAMPLE_MS / 1000.0)
+            sampler.start()
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                header = server_timing_header(timing, time.perf_counter() - start)
+                headers.append((b"server-timing", header.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timing.reset(token)
+            total = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_seconds.observe((scope.get("method", ""), route, str(status[0])), total)
+            if sampler is not None:
+                sampler.stop()
+                if total * 1000 >= PROFILE_SLOW_REQUEST_MS and sampler.samples:
+                    try:
+                        sampler.write(route, total)
+                    except OSError:
+                        pass
+
+
+def metric_lines(name, help_text, metric_type, samples):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
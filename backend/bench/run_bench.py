@@ -0,0 +1,281 @@
+"""
+Benchmark harness for the analytics and notes-lab paths.
+
+    python backend/bench/run_bench.py --scale 1k                  # compare to baseline
+    python backend/bench/run_bench.py --scale 10k --save-baseline # record a baseline
+
+Times each pipeline stage and each endpoint against a synthetic corpus from
+`synth_corpus.py`, generated on first use under `bench/corpora/<scale>`. Each
+stage reports the best and median wall time over `--repeat` runs and the
+peak RSS after it ran, for this process and separately for the largest
+child process (pool workers, live or exited). `ANALYTICS_WORKERS` defaults
+to 0 here, so analytics runs in-process unless the environment asks for
+workers. With a stored baseline (`bench/baselines/<scale>.json`), a stage
+slower than `baseline * (1 + --tolerance)` or either peak RSS above
+`baseline * (1 + --rss-tolerance)` fails the run with exit code 1.
+Baselines are machine-specific; record one before comparing.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCH_DIR.parent / "app"
+sys.path.insert(0, str(BENCH_DIR))
+
+import synth_corpus  # noqa: E402
+
+# Regressions smaller than this are timer noise, whatever the ratio.
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def _maxrss_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _live_children_hwm_mb():
+    """
+    Peak RSS of the live child processes (pool workers), from /proc on Linux.
+    """
+    peak = 0.0
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        peak = max(peak, int(line.split()[1]) / 1024)
+        except OSError:
+            continue
+    return peak
+
+
+def peak_rss_mb():
+    return _maxrss_mb(resource.RUSAGE_SELF)
+
+
+def workers_peak_rss_mb():
+    """
+    Largest peak RSS of any child process. Forked helpers count pages shared
+    with this process, so this is reported next to, not added to, our own.
+    """
+    return max(_maxrss_mb(resource.RUSAGE_CHILDREN), _live_children_hwm_mb())
+
+
+def timed(fn, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {
+        "best_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "workers_peak_rss_mb": round(workers_peak_rss_mb(), 1),
+    }
+
+
+def build_stages(client, state):
+    """
+    (name, fn, setup) in execution order. Stages share intermediates through
+    `state`, so each one times only its own step.
+    """
+    import numpy as np
+    from triage import (
+        analytics, batches, caches, clustering, corpus, encoding, extraction, features, offload, registry, search,
+    )
+
+    def reset_search():
+        current = registry.corpus_registry.get()
+        current.search_index = search.SearchIndex(current)
+
+    def load_all_jsons():
+        state["data"] = registry.load_all_jsons()[0]
+
+    def ingest_cold():
+        registry.corpus_registry.get().incremental = corpus.IncrementalCorpus()
+        registry.load_unionized_notes()
+
+    def analytics_cold():
+        # Workers hold their own corpora and models; restart them too.
+        caches.analytics_cache.clear()
+        offload.analytics_pool.shutdown()
+
+    def pack():
+        seqs = [c["gpt_deltas"] for c in state["data"] if isinstance(c.get("gpt_deltas"), list) and c["gpt_deltas"]]
+        state["deltas"], state["lengths"] = features.pack_ragged(seqs)
+
+    def traj_features():
+        state["curves"], state["tstars"] = features.trajectory_features(state["deltas"], state["lengths"], 3, 0.9)
+
+    def align():
+        from sklearn.preprocessing import StandardScaler
+
+        state["X"] = StandardScaler().fit_transform(features.align_curves(state["curves"], state["lengths"]))
+
+    def cluster():
+        state["labels"] = np.asarray(clustering.fit_cluster_labels(state["X"], 4))
+
+    def t_max():
+        return state["X"].shape[1] + 1
+
+    def policies():
+        features.evaluate_cluster_policies(state["tstars"], state["labels"], 4, t_max())
+
+    def audit_q():
+        for c in range(4):
+            features.optimal_audit_Q(state["tstars"][state["labels"] == c], t_max())
+
+    def encode(response_format):
+        def setup():
+            if response_format not in state["payloads"]:
+                state["payloads"][response_format] = analytics.run_analytics(response_format=response_format)
+
+        def call():
+            body = encoding.encode_json(state["payloads"][response_format])
+            state["payload_bytes"][response_format] = len(body)
+        return call, setup
+
+    def get(path, **params):
+        def call():
+            response = client.get(path, params=params)
+            response.raise_for_status()
+            body = response.json()
+            if isinstance(body, dict) and "error" in body:
+                raise RuntimeError(f"{path}: {body['error']}")
+        return call
+
+    def post(path, payload):
+        def call():
+            response = client.post(path, json=payload)
+            response.raise_for_status()
+        return call
+
+    return [
+        ("stage.load_all_jsons.cold", load_all_jsons, batches.corpus_cache.clear),
+        ("stage.load_all_jsons.warm", load_all_jsons, None),
+        ("stage.load_unionized_notes.cold", ingest_cold, batches.corpus_cache.clear),
+        ("stage.load_unionized_notes.warm", registry.load_unionized_notes, None),
+        ("stage.pack_ragged", pack, None),
+        ("stage.trajectory_features", traj_features, None),
+        ("stage.align_scale", align, None),
+        ("stage.fit_cluster_labels", cluster, None),
+        ("stage.evaluate_cluster_policies", policies, None),
+        ("stage.optimal_audit_Q", audit_q, None),
+        ("stage.run_analytics", analytics.run_analytics, None),
+        ("stage.encode_json.json", *encode("json")),
+        ("stage.encode_json.columnar", *encode("columnar")),
+        ("endpoint.analytics.cold", get("/notes/analytics"), analytics_cold),
+        ("endpoint.analytics.cached", get("/notes/analytics"), None),
+        ("endpoint.analytics.columnar.cold", get("/notes/analytics", format="columnar"), analytics_cold),
+        ("endpoint.analytics.sweep", get("/notes/analytics/sweep", n_clusters="3,4,5"), None),
+        ("endpoint.lab.page", get("/notes/lab", limit=100), None),
+        ("endpoint.lab.full", get("/notes/lab"), None),
+        ("endpoint.lab.client", get("/notes/lab/C-0001"), None),
+        ("endpoint.search.cold", get("/notes/search", q="fronting"), reset_search),
+        ("endpoint.search.warm", get("/notes/search", q="accuracy /k/ cueing"), None),
+        ("endpoint.extract.batch.cold", post("/notes/extract/batch", {"include_spans": False}), extraction.extraction_cache.clear),
+        ("endpoint.extract.batch.cached", post("/notes/extract/batch", {"include_spans": False}), None),
+    ]
+
+
+def compare(results, baseline, tolerance, rss_tolerance):
+    failures = []
+    for name, current in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            continue
+        limit = base["best_s"] * (1 + tolerance)
+        if current["best_s"] > limit and current["best_s"] - base["best_s"] > MIN_REGRESSION_SECONDS:
+            failures.append(f"{name}: {current['best_s']:.4f}s > {base['best_s']:.4f}s (+{tolerance:.0%})")
+    for key, label in (("peak_rss_mb", "peak RSS"), ("workers_peak_rss_mb", "workers peak RSS")):
+        base_rss, rss = baseline.get(key), results[key]
+        if base_rss and rss > base_rss * (1 + rss_tolerance):
+            failures.append(f"{label}: {rss:.0f} MB > {base_rss:.0f} MB (+{rss_tolerance:.0%})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="1k", help="one of: " + ", ".join(synth_corpus.SCALES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="benchmark an existing directory instead")
+    parser.add_argument("--baseline", help="baseline JSON (default: bench/baselines/<scale>.json)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.30)
+    parser.add_argument("--rss-tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="also write the results JSON here")
+    args = parser.parse_args()
+
+    corpus_dir = Path(args.corpus_dir) if args.corpus_dir else BENCH_DIR / "corpora" / args.scale
+    if not args.corpus_dir and not any(corpus_dir.glob("batch_notes_eval_*.json")):
+        print(f"generating {args.scale} corpus in {corpus_dir} ...", file=sys.stderr)
+        synth_corpus.generate(corpus_dir, synth_corpus.SCALES[args.scale], seed=args.seed)
+
+    # Configure the app before importing it; sidecars, the watcher and
+    # worker processes would otherwise change what is being measured.
+    os.environ["MOCK_NOTES_DIR"] = str(corpus_dir)
+    os.environ.setdefault("COLUMNAR_SIDECARS", "off")
+    os.environ.setdefault("MOCK_NOTES_WATCH_SECONDS", "0")
+    os.environ.setdefault("ANALYTICS_WORKERS", "0")
+    sys.path.insert(0, str(APP_DIR))
+    import main as app_main
+    from fastapi.testclient import TestClient
+
+    results = {
+        "scale": args.scale,
+        "corpus_dir": str(corpus_dir),
+        "corpus_mb": round(sum(p.stat().st_size for p in corpus_dir.glob("batch_notes_eval_*.json")) / 1e6, 1),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "repeat": args.repeat,
+        "analytics_workers": int(os.environ["ANALYTICS_WORKERS"]),
+        "stages": {},
+    }
+    state = {"payloads": {}, "payload_bytes": {}}
+    with TestClient(app_main.app) as client:
+        for name, fn, setup in build_stages(client, state):
+            results["stages"][name] = stats = timed(fn, args.repeat, setup)
+            print(f"{name:<36} best {stats['best_s'] * 1000:10.2f} ms   "
+                  f"median {stats['median_s'] * 1000:10.2f} ms   rss {stats['peak_rss_mb']:8.1f} MB   "
+                  f"workers {stats['workers_peak_rss_mb']:8.1f} MB")
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    results["workers_peak_rss_mb"] = round(workers_peak_rss_mb(), 1)
+    results["analytics_payload_bytes"] = state["payload_bytes"]
+    print("analytics payload bytes: " + ", ".join(f"{k} {v}" for k, v in state["payload_bytes"].items()))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline) if args.baseline else BENCH_DIR / "baselines" / f"{args.scale}.json"
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline saved to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; run with --save-baseline first")
+        return 0
+
+    failures = compare(results, json.loads(baseline_path.read_text()), args.tolerance, args.rss_tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print("ok" if not failures else f"{len(failures)} regression(s) against {baseline_path}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
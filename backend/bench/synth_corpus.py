@@ -0,0 +1,220 @@
+"""
+Seeded synthetic corpus generator for benchmarks.
+
+Writes `batch_notes_eval_*.json` files with the same schema as
+`backend/app/mock-notes`, at any number of children:
+
+    python backend/bench/synth_corpus.py --children 10000 --out backend/bench/corpora/10k
+
+- Children are spread over `--files` batch files. Every file after the first
+  also re-emits an `--overlap` fraction of earlier children with regenerated
+  text, which produces duplicate (client, note_number) slots for the union.
+- `n_notes` varies per child, so `gpt_deltas` are ragged. A small share of
+  children has a failed generator result or missing/truncated `gpt_deltas`,
+  as in the real batches.
+- Files are written one child at a time, so 100k children do not need the
+  whole corpus in memory.
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+ARCHETYPES = {
+    # archetype -> (per-session decay of the expected delta, noise)
+    "fast_mid": (0.55, 0.6),
+    "medium_late": (0.75, 0.7),
+    "slow_plateau": (0.9, 0.8),
+}
+
+PHONEMES = ["k", "g", "s", "f", "sh", "ch", "l", "r", "th", "st", "sp", "p", "t", "m"]
+PARENT_HEADERS = ["Parent/Caregiver Report:", "Parent report:", "Parent/caregiver report:"]
+BEHAVIOUR_HEADERS = ["Behaviour/Engagement:", "Behaviour/engagement:", "Behavior/engagement:"]
+GOAL_HEADERS = [
+    "Therapy Goals & Observations:", "Goals / session focus:", "Goals and observations:",
+    "Goals / therapy activities:",
+]
+PLAN_HEADERS = ["Plan/Recommendations:", "Plan / recommendations:", "Plan/recommendations:"]
+GOAL_FORMATS = ["Goal {n}: {title}", "{n}. {title}", "{n}) {title}"]
+
+PARENT_LINES = [
+    "Parent reported that child is “hard to understand” for unfamiliar listeners.",
+    "Parent noticed /{a}/ is often replaced with /{b}/ at home (e.g., “{w1}” for “{w2}”).",
+    "No changes in health or hearing per parent; family continues home practice.",
+    "Mother shared that practice cards are used most evenings before bed.",
+    "Parent reports clearer endings on familiar words, though child “forgets” when excited.",
+]
+BEHAVIOUR_LINES = [
+    "Child separated easily and settled into the routine quickly.",
+    "Transitioned to the therapy room with some hesitation but engaged once settled.",
+    "Participated well in play-based drills; occasional silliness but easily redirected.",
+    "Attention was best with hands-on toys and picture books.",
+]
+ACCURACY_BY_DELTA = [
+    "accuracy remained low; child reverted to /{b}/ most of the time",
+    "accuracy was inconsistent and required moderate cueing",
+    "accuracy is slowly increasing with light verbal reminders",
+    "child showed high accuracy with minimal cueing",
+]
+OBSERVATION_LINES = [
+    "With direct modeling and visual cues, {acc}.",
+    "Probed /{a}/ in simple words (e.g., “{w2}”); {acc}.",
+    "Baseline probing showed fronting of /{a}/ to /{b}/ in some positions.",
+    "In structured play, {acc}.",
+]
+PLAN_LINES = [
+    "Continue to target /{a}/ at the word level before moving to phrases.",
+    "Home practice: parent to model /{a}/ words for 1–2 minutes daily.",
+    "Next session: recheck /{a}/ in isolation and CV syllables.",
+]
+DISCHARGE_LINES = [
+    "Discuss reduced session frequency with family if gains are maintained.",
+    "Child is approaching age-appropriate production; plan for discharge review.",
+]
+WORDS = ["cat", "key", "cup", "sun", "fish", "shoe", "lamp", "ring", "thumb", "star", "spoon", "pig"]
+
+
+def _decaying_trajectory(rng, archetype, length):
+    decay, noise = ARCHETYPES[archetype]
+    level = rng.uniform(2.0, 3.0)
+    out = []
+    for _ in range(length):
+        out.append(int(min(3, max(0, round(level + rng.gauss(0.0, noise))))))
+        level *= decay
+    return out
+
+
+def _note_text(rng, session, delta, headers, targets):
+    a = targets[0]
+    fill = {
+        "a": a,
+        "b": rng.choice(["t", "d", "w", "h"]),
+        "w1": rng.choice(WORDS),
+        "w2": rng.choice(WORDS),
+    }
+    fill["acc"] = ACCURACY_BY_DELTA[delta].format(**fill)
+    parent_h, behaviour_h, goal_h, plan_h, goal_fmt = headers
+
+    lines = [f"Session {session}", "", parent_h]
+    lines += ["- " + rng.choice(PARENT_LINES).format(**fill) for _ in range(2)]
+    lines += ["", behaviour_h]
+    lines += ["- " + line for line in rng.sample(BEHAVIOUR_LINES, 2)]
+    lines += ["", goal_h]
+    for n, target in enumerate(targets, start=1):
+        fill["a"] = target
+        lines.append(goal_fmt.format(n=n, title=f"Initial /{target}/ in words and short phrases"))
+        lines += ["- " + rng.choice(OBSERVATION_LINES).format(**fill) for _ in range(rng.randint(2, 3))]
+        lines.append("")
+    fill["a"] = a
+    lines.append(plan_h)
+    lines += ["- " + line.format(**fill) for line in rng.sample(PLAN_LINES, 2)]
+    if delta == 0 and rng.random() < 0.3:
+        lines.append("- " + rng.choice(DISCHARGE_LINES))
+    return "\n".join(lines)
+
+
+def make_child(rng, child_index, created, notes_range=(8, 14)):
+    """
+    One batch-file child. Ragged by construction: `n_notes` is drawn per child.
+    """
+    archetype = rng.choice(list(ARCHETYPES))
+    n_notes = rng.randint(*notes_range)
+    trajectory = _decaying_trajectory(rng, archetype, n_notes - 1)
+    stamp = created.strftime("%Y%m%d_%H%M%S")
+
+    if rng.random() < 0.02:
+        return {
+            "child_index": child_index,
+            "archetype": archetype,
+            "n_notes": n_notes,
+            "trajectory_vector": trajectory,
+            "generator_result": {
+                "status": "error",
+                "raw": f"output/notes_raw_{stamp}.txt",
+                "preview": "[\n  {\n    \"note_number\": 1,",
+                "trajectory_vector": str(trajectory),
+            },
+            "gpt_deltas": [],
+            "diff_per_step": None,
+            "mae": None,
+        }
+
+    headers = (
+        rng.choice(PARENT_HEADERS), rng.choice(BEHAVIOUR_HEADERS), rng.choice(GOAL_HEADERS),
+        rng.choice(PLAN_HEADERS), rng.choice(GOAL_FORMATS),
+    )
+    targets = rng.sample(PHONEMES, rng.randint(2, 4))
+    notes = [
+        {
+            "note_number": i + 1,
+            "note_text": _note_text(rng, i + 1, trajectory[i - 1] if i else 3, headers, targets),
+        }
+        for i in range(n_notes)
+    ]
+    gpt_deltas = [int(min(3, max(0, d + rng.choice([-1, 0, 0, 0, 1])))) for d in trajectory]
+    roll = rng.random()
+    if roll < 0.02:
+        gpt_deltas = []
+    elif roll < 0.05:
+        gpt_deltas = gpt_deltas[: rng.randint(1, len(gpt_deltas))]
+    diff = [abs(g - t) for g, t in zip(gpt_deltas, trajectory)]
+    return {
+        "child_index": child_index,
+        "archetype": archetype,
+        "n_notes": n_notes,
+        "trajectory_vector": trajectory,
+        "generator_result": {
+            "status": "ok",
+            "data": {"trajectory_type": archetype, "trajectory_vector": trajectory, "notes": notes},
+            "raw": f"output/notes_raw_{stamp}.txt",
+            "json": f"output/notes_{stamp}.json",
+        },
+        "gpt_deltas": gpt_deltas,
+        "diff_per_step": diff if gpt_deltas else None,
+        "mae": (sum(diff) / len(diff)) if diff else None,
+    }
+
+
+def generate(out_dir, children, files=3, overlap=0.2, seed=0, start=datetime(2026, 1, 1)):
+    """
+    Write the corpus and return the list of written paths.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    per_file = -(-children // files)
+    paths = []
+    for f in range(files):
+        fresh = range(f * per_file, min(children, (f + 1) * per_file))
+        rerun = sorted(rng.sample(range(f * per_file), int(overlap * f * per_file))) if f else []
+        created = start + timedelta(days=f)
+        path = out_dir / f"batch_notes_eval_{created:%Y%m%d}_{f:06d}.json"
+        with path.open("w", encoding="utf-8") as fh:
+            fh.write("[")
+            for i, child_index in enumerate(list(rerun) + list(fresh)):
+                child = make_child(rng, child_index, created + timedelta(seconds=i))
+                fh.write(("," if i else "") + "\n" + json.dumps(child, ensure_ascii=False))
+            fh.write("\n]\n")
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--children", default="1k", help="child count or one of: " + ", ".join(SCALES))
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+    children = SCALES.get(args.children) or int(args.children)
+    for path in generate(args.out, children, args.files, args.overlap, args.seed):
+        print(f"{path} ({path.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
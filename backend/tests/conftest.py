@@ -0,0 +1,60 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# The app is run from backend/app (`uvicorn main:app`), so import it the same way.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+
+@pytest.fixture
+def write_batch(tmp_path):
+    """
+    `write_batch(stamp, {child_index: [note texts]})` writes
+    `batch_notes_eval_<stamp>.json` into `write_batch.directory` and returns
+    its path. Each child gets `gpt_deltas` for its notes.
+    """
+    directory = tmp_path / "notes"
+    directory.mkdir()
+
+    def write(stamp, children, archetype="steady", trajectory_type="linear"):
+        path = directory / f"batch_notes_eval_{stamp}.json"
+        path.write_text(json.dumps([
+            {
+                "child_index": child_index,
+                "archetype": archetype,
+                "n_notes": len(texts),
+                "generator_result": {
+                    "status": "ok",
+                    "data": {
+                        "trajectory_type": trajectory_type,
+                        "notes": [{"note_number": i + 1, "note_text": t} for i, t in enumerate(texts)],
+                    },
+                    "json": f"output/notes_{stamp}.json",
+                },
+                "gpt_deltas": [(child_index + i) % 3 for i in range(len(texts) - 1)],
+            }
+            for child_index, texts in children.items()
+        ]))
+        return path
+
+    write.directory = directory
+    return write
+
+
+@pytest.fixture
+def api(monkeypatch, write_batch):
+    """
+    Test client for the app with the default corpus read from
+    `write_batch.directory`.
+    """
+    from fastapi.testclient import TestClient
+
+    import main
+    from triage.registry import corpus_registry
+
+    monkeypatch.setenv("MOCK_NOTES_DIR", str(write_batch.directory))
+    corpus_registry.get().release()
+    yield TestClient(main.app)
+    corpus_registry.get().release()
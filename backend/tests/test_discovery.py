@@ -0,0 +1,97 @@
+"""
+Discovery is cached per directory mtime, and /ready reports warm-up.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from triage import background, registry
+from triage.registry import Corpus, get_json_paths
+
+
+def _age(directory, seconds=60):
+    """
+    Backdate `directory`'s mtime so discovery trusts it.
+    """
+    past = directory.stat().st_mtime_ns - seconds * 10**9
+    os.utime(directory, ns=(past, past))
+
+
+def _count_globs(monkeypatch):
+    calls = []
+    glob = Path.glob
+
+    def counting(self, pattern):
+        calls.append(self)
+        return glob(self, pattern)
+
+    monkeypatch.setattr(Path, "glob", counting)
+    return calls
+
+
+def test_cache_hits_until_the_directory_changes(write_batch, monkeypatch):
+    first = write_batch("20260101_000000", {0: ["a"]})
+    corpus = Corpus("disc", str(write_batch.directory), "batch_notes_eval_*.json")
+    _age(write_batch.directory)
+    globs = _count_globs(monkeypatch)
+
+    assert get_json_paths(corpus) == [first.resolve()]
+    assert get_json_paths(corpus) == [first.resolve()]
+    assert len(globs) == 1
+
+    second = write_batch("20260102_000000", {1: ["b"]})
+    _age(write_batch.directory, seconds=30)
+    assert get_json_paths(corpus) == [first.resolve(), second.resolve()]
+    assert len(globs) == 2
+
+    second.unlink()
+    _age(write_batch.directory, seconds=10)
+    assert get_json_paths(corpus) == [first.resolve()]
+    assert len(globs) == 3
+
+
+def test_recently_modified_directory_is_not_cached(write_batch, monkeypatch):
+    write_batch("20260101_000000", {0: ["a"]})
+    corpus = Corpus("disc", str(write_batch.directory), "batch_notes_eval_*.json")
+    monkeypatch.setattr(registry, "DISCOVERY_MTIME_SLACK_S", 3600)
+    globs = _count_globs(monkeypatch)
+    get_json_paths(corpus)
+    get_json_paths(corpus)
+    assert len(globs) == 2
+
+
+class _ScriptedWarmUp(background.WarmUp):
+    def __init__(self, release):
+        super().__init__()
+        self.release = release
+
+    def plan(self):
+        def fail():
+            raise RuntimeError("no corpus")
+
+        return (("wait", lambda: self.release.wait(5)), ("corpus", fail))
+
+
+def test_ready_follows_warm_up(api, monkeypatch):
+    monkeypatch.setattr(background, "warm_up", None)
+    assert api.get("/ready").json() == {"ready": True, "warmup": "disabled"}
+
+    release = threading.Event()
+    warm_up = _ScriptedWarmUp(release)
+    monkeypatch.setattr(background, "warm_up", warm_up)
+    warm_up.start()
+    deadline = time.monotonic() + 5
+    while warm_up.current != "wait" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    busy = api.get("/ready")
+    assert busy.status_code == 503
+    assert busy.json()["ready"] is False and busy.json()["current_step"] == "wait"
+
+    release.set()
+    warm_up.join(5)
+    done = api.get("/ready")
+    # A failed step is reported but does not block readiness.
+    assert done.status_code == 200 and done.json()["ready"] is True
+    assert done.json()["steps"]["corpus"]["error"] == "no corpus"
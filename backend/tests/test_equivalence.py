@@ -0,0 +1,170 @@
+"""
+Seeded regression tests: each vectorized path against the scalar code it
+replaced.
+"""
+
+import json
+
+import numpy as np
+import pytest
+from numpy.testing import assert_array_equal
+
+from triage import batches, clustering, features
+
+
+def test_evaluate_cluster_policies_matches_per_cluster_functions():
+    rng = np.random.default_rng(3)
+    k, T_max = 5, 12
+    labels = rng.integers(0, k - 1, size=400)          # cluster k-1 stays empty
+    tstars = rng.integers(2, T_max + 1, size=400).astype(float)
+    tstars[rng.random(400) < 0.05] = np.nan
+    tstars[labels == 2] = np.nan                        # no finite t* at all
+
+    got = features.evaluate_cluster_policies(tstars, labels, k, T_max)
+
+    for c in range(k):
+        D = tstars[labels == c]
+        Q_star, Qs, frontier, F = features.optimal_audit_Q(D, T_max)
+        if Q_star is None:
+            assert not got["valid"][c]
+            assert got["E_delivered"][c] == T_max
+            continue
+        # The pre-ECDF definition: one scan of the cluster per Q.
+        finite = D[~np.isnan(D)]
+        assert_array_equal(F, [(finite <= Q).mean() for Q in Qs])
+        assert got["valid"][c]
+        assert got["Qstar"][c] == Q_star
+        assert_array_equal(got["Qs"], Qs)
+        np.testing.assert_allclose(got["F"][c], F, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(got["frontier"][c], frontier, rtol=1e-12)
+        Q_mean = features.q_mean_policy(D, "round", T_max)
+        assert got["Qmean"][c] == Q_mean
+        np.testing.assert_allclose(
+            got["E_delivered"][c], features.expected_delivered_given_Q(D, Q_star, T_max), rtol=1e-12
+        )
+        np.testing.assert_allclose(
+            got["E_delivered_mean"][c], features.expected_delivered_given_Q(D, Q_mean, T_max), rtol=1e-12
+        )
+
+
+def _baseline_features(seq, smooth_window, alpha):
+    # The per-child loop `run_analytics` used before the batched pipeline.
+    cumulative = np.cumsum(features.moving_average(seq, window=smooth_window))
+    return cumulative.astype(float), float(features.stopping_point_fraction(cumulative, alpha=alpha) + 2)
+
+
+def test_trajectory_features_matches_per_child_loop():
+    rng = np.random.default_rng(4)
+    seqs = [rng.integers(0, 4, size=rng.integers(1, 15)).tolist() for _ in range(300)]
+    seqs += [[0, 0, 0], [3], [1, 1]]
+    deltas, lengths = features.pack_ragged(seqs)
+
+    for window in (1, 2, 3, 5):
+        for alpha in (0.5, 0.9, 1.0):
+            curves, tstars = features.trajectory_features(deltas, lengths, window, alpha)
+            for i, seq in enumerate(seqs):
+                curve, tstar = _baseline_features(seq, window, alpha)
+                assert_array_equal(curves[i, :len(seq)], curve)
+                assert np.isnan(curves[i, len(seq):]).all()
+                assert tstars[i] == tstar
+
+
+STREAM_CHILDREN = [
+    {"child_index": 0, "gpt_deltas": [3, 2, -0.0025, 1e-3, 0], "mae": None, "ok": True},
+    {
+        "note": 'quote " and backslash \\ and brackets ] } [ { inside',
+        "generator_result": {"data": {"notes": [{"t": 'a"b\\'}, [], {}]}, "raw": "x,y]"},
+        "unicode": "caf\u00e9 \u2192 \U0001f600 \n\t",
+    },
+    [],
+    {},
+    "bare string",
+    -12.5,
+    None,
+    [[1, [2, [3, {"deep": ["]"]}]]]],
+]
+
+
+@pytest.mark.parametrize("read_chars", [1, 3, 7, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_batch_children_matches_json_load(tmp_path, monkeypatch, read_chars, indent):
+    # Tiny reads put every value across a buffer edge somewhere.
+    monkeypatch.setattr(batches, "STREAM_READ_CHARS", read_chars)
+    p = tmp_path / "batch.json"
+    p.write_text(json.dumps(STREAM_CHILDREN, indent=indent, ensure_ascii=read_chars % 2 == 0), encoding="utf-8")
+
+    assert list(batches.iter_batch_children(p)) == json.loads(p.read_text(encoding="utf-8"))
+
+    skipped = list(batches.iter_batch_children(p, skip_keys=("generator_result",)))
+    expected = [
+        {k: v for k, v in c.items() if k != "generator_result"} if isinstance(c, dict) else c
+        for c in json.loads(p.read_text(encoding="utf-8"))
+    ]
+    assert skipped == expected
+
+
+def test_iter_batch_children_rejects_non_list(tmp_path):
+    p = tmp_path / "batch.json"
+    p.write_text('{"a": 1}', encoding="utf-8")
+    with pytest.raises(ValueError, match="did not load to a list"):
+        list(batches.iter_batch_children(p))
+
+
+def _lttb_reference(y, threshold):
+    # Scalar Largest-Triangle-Three-Buckets (Steinarsson 2013), x = index.
+    n = len(y)
+
+    def edge(i):
+        # floor(i * every) + 1, with every = (n - 2) / (threshold - 2), exactly.
+        return i * (n - 2) // (threshold - 2) + 1
+
+    out = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = edge(i + 1)
+        avg_end = min(edge(i + 2), n)
+        avg_x = sum(range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1.0
+        for j in range(edge(i), edge(i + 1)):
+            area = abs((a - avg_x) * (y[j] - y[a]) - (a - j) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+@pytest.mark.parametrize("m,threshold", [(10, 3), (61, 60), (200, 60), (997, 37)])
+def test_lttb_indices_matches_scalar_reference(m, threshold):
+    rng = np.random.default_rng(m)
+    Y = np.cumsum(rng.normal(size=(8, m)), axis=1)
+    got = features.lttb_indices(Y, threshold)
+    for row, y in zip(got, Y):
+        assert row.tolist() == _lttb_reference(y.tolist(), threshold)
+
+
+def _dtw_reference(a, b, window):
+    # Textbook banded DTW: D[i, j] = cost + min(up, left, diagonal).
+    lo, hi = clustering.dtw_band(len(a), len(b), window)
+    D = np.full((len(a) + 1, len(b) + 1), np.inf)
+    D[0, 0] = 0.0
+    for i in range(len(a)):
+        for j in range(lo[i], hi[i] + 1):
+            D[i + 1, j + 1] = (a[i] - b[j]) ** 2 + min(D[i, j + 1], D[i + 1, j], D[i, j])
+    return np.sqrt(D[-1, -1])
+
+
+@pytest.mark.parametrize("m,n", [(1, 1), (1, 6), (5, 5), (7, 12), (12, 7), (30, 23)])
+@pytest.mark.parametrize("window", [0.0, 0.1, 1.0])
+def test_dtw_batch_matches_naive_dp(m, n, window):
+    rng = np.random.default_rng(m * 100 + n)
+    A = np.cumsum(rng.integers(0, 4, size=(6, m)), axis=1).astype(float)
+    B = np.cumsum(rng.integers(0, 4, size=(6, n)), axis=1).astype(float)
+    expected = [_dtw_reference(a, b, window) for a, b in zip(A, B)]
+    np.testing.assert_allclose(clustering.dtw_batch(A, B, window), expected, rtol=1e-12)
+    # A single row broadcasts against every row of the other side.
+    np.testing.assert_allclose(
+        clustering.dtw_batch(A[:1], B, window), [_dtw_reference(A[0], b, window) for b in B], rtol=1e-12
+    )
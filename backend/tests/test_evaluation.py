@@ -0,0 +1,87 @@
+"""
+Evaluation jobs write a new batch file next to, never over, existing ones,
+and the job table only forgets finished jobs.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from triage import evaluation
+from triage.evaluation import EvaluationJob, run_evaluation_job, start_job, write_batch_file
+from triage.registry import Corpus
+
+
+def _source(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    path = src / "batch_notes_eval_20260101_000000.json"
+    path.write_text(json.dumps([{
+        "child_index": 1,
+        "archetype": "fast",
+        "trajectory_vector": [1, 2],
+        "gpt_deltas": [1, 1],
+        "generator_result": {"data": {"notes": [
+            {"note_number": n, "note_text": f"note {n}"} for n in (1, 2, 3)
+        ]}},
+    }]))
+    return Corpus("test", str(src), "batch_notes_eval_*.json"), path
+
+
+def _job(corpus, note_ids):
+    index = corpus.sync()
+    notes = {n: index.note(n) for n in note_ids}
+    return EvaluationJob("job0001", "p", notes, "stub", 0.0, 2, "stub", corpus)
+
+
+def test_completed_job_writes_new_batch_file(tmp_path):
+    corpus, source = _source(tmp_path)
+    before = source.read_bytes()
+    job = _job(corpus, ["C-0002-N01", "C-0002-N02", "C-0002-N03"])
+    asyncio.run(run_evaluation_job(job, directory=tmp_path / "state", output_dir=tmp_path / "out"))
+
+    assert job.status == "completed" and source.read_bytes() == before
+    [written] = (tmp_path / "out").glob("batch_notes_eval_*.json")
+    assert job.output_file == str(written)
+    [child] = json.loads(written.read_text())
+    deltas = [o["output"]["delta"] for o in child["evaluation"]["outputs"]][1:]
+    assert child["gpt_deltas"] == deltas and child["trajectory_vector"] == [1, 2]
+    assert child["mae"] == sum(abs(d - t) for d, t in zip(deltas, [1, 2])) / 2
+
+    output = Corpus("out", str(tmp_path / "out"), "batch_notes_eval_*.json")
+    assert output.sync().note("C-0002-N03")["note"] == "note 3"
+
+
+def test_partial_job_omits_deltas(tmp_path):
+    corpus, _ = _source(tmp_path)
+    job = _job(corpus, ["C-0002-N02", "C-0002-N03"])
+    asyncio.run(run_evaluation_job(job, directory=tmp_path / "state", output_dir=tmp_path / "out"))
+    [child] = json.loads(open(job.output_file).read())
+    assert "gpt_deltas" not in child and "mae" not in child
+
+
+def test_write_batch_file_never_overwrites(tmp_path):
+    first = write_batch_file(tmp_path, [{"child_index": 0}], "aaaaaaaa")
+    second = write_batch_file(tmp_path, [{"child_index": 1}], "bbbbbbbb")
+    assert first != second
+    assert json.loads(first.read_text()) == [{"child_index": 0}]
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([first.name, second.name])
+
+
+def test_start_job_evicts_oldest_finished_jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(evaluation, "EVAL_MAX_JOBS", 2)
+    jobs = {
+        "running": SimpleNamespace(status="running"),
+        "done-1": SimpleNamespace(status="completed"),
+        "done-2": SimpleNamespace(status="failed"),
+    }
+    monkeypatch.setattr(evaluation, "evaluation_jobs", evaluation.OrderedDict(jobs))
+    corpus, _ = _source(tmp_path)
+    job = EvaluationJob("new", "p", {}, "stub", 0.0, 1, "stub", corpus)
+
+    async def start():
+        start_job(job)
+        await job.task
+
+    asyncio.run(start())
+    assert list(evaluation.evaluation_jobs) == ["running", "new"]
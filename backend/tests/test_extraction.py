@@ -0,0 +1,68 @@
+"""
+Structured extraction: fields come with character spans into the original
+text, and results are cached by content hash.
+"""
+
+from pathlib import Path
+
+from triage import batches
+from triage.extraction import extract_corpus, extract_note, extraction_cache
+
+NOTE = """Session 7
+Parent report:
+- Mum says /s/ is better at home.
+
+Goals / session focus:
+1. /s/ in initial position
+- 80% accuracy with minimal cues.
+2. /k/ and /g/ at word level
+- Accuracy remained variable.
+
+Plan:
+- Missed last week; consider reduced frequency."""
+
+
+def test_fields():
+    got = extract_note(NOTE)["extracted_json"]
+    assert got["session"] == 7
+    assert got["parent_report"] == ["Mum says /s/ is better at home."]
+    assert [(g["number"], g["targets"]) for g in got["goals"]] == [(1, ["s"]), (2, ["k", "g"])]
+    assert got["goals"][0]["observations"] == ["80% accuracy with minimal cues."]
+    assert got["targets"] == ["s", "k", "g"]
+    assert [(a["level"], a["percent"]) for a in got["accuracy"]] == [(None, 80), ("inconsistent", None)]
+    assert got["cueing"] == ["minimal"]
+    assert got["discharge_signal"] == "watch"
+    assert got["attendance_flags"] == ["missed"]
+    assert got["plan"] == ["Missed last week; consider reduced frequency."]
+
+
+def test_spans_index_the_original_text():
+    mock = Path(__file__).resolve().parents[1] / "app" / "mock-notes"
+    chunk = batches.corpus_cache.load(sorted(mock.glob("batch_notes_eval_*.json"))[0])
+    texts = [NOTE, "  \n" + NOTE.replace("\n", "\r\n")] + [
+        n["note_text"] for child in chunk[:5] for n in child["generator_result"]["data"]["notes"]
+    ]
+    for text in texts:
+        spans = extract_note(text)["spans"]
+        assert spans
+        for span in spans:
+            assert text[span["start"]:span["end"]] == span["text"]
+        assert [(s["start"], -s["end"]) for s in spans] == sorted((s["start"], -s["end"]) for s in spans)
+
+
+def test_corpus_extraction_is_cached_by_content(api, write_batch):
+    extraction_cache.clear()
+    write_batch("20260101_000000", {0: [NOTE, "Session 2\nAbsent today."], 1: [NOTE]})
+
+    first = api.post("/notes/extract/batch", json={}).json()
+    assert first["stats"] == {"notes": 3, "extracted": 2, "cached": 0}
+    again = api.post("/notes/extract/batch", json={"include_spans": False}).json()
+    assert again["stats"] == {"notes": 3, "extracted": 0, "cached": 3}
+    assert "spans" not in again["results"][0]
+
+    by_id, unknown, _ = extract_corpus(["C-0002-N01", "C-0009-N01"])
+    assert unknown == ["C-0009-N01"]
+    assert by_id["C-0002-N01"] == extract_note(NOTE)
+
+    one = api.post("/notes/extract", json={"note_id": "C-0001-N02"}).json()
+    assert one["extracted_json"]["attendance_flags"] == ["absent"]
@@ -0,0 +1,54 @@
+"""
+ModelStore persistence: nothing touches disk unless a directory is
+configured, and each (corpus, params) group keeps its newest versions only.
+"""
+
+import os
+
+import numpy as np
+
+from triage.models import ClusterModel, ModelStore
+
+PARAMS = {"n_clusters": 2, "smooth_window": 3, "alpha": 0.9, "length_mode": "truncate", "clustering": "kmeans"}
+
+
+def _model(version):
+    fingerprint = ((f"/data/batch_notes_eval_{version}.json", 100 + version, version),)
+    arrays = {name: np.zeros(2) for name in ClusterModel.ARRAYS}
+    arrays["centroids"] = np.zeros((2, 3))
+    return ClusterModel(PARAMS, fingerprint, **arrays)
+
+
+def test_memory_only_store_has_no_paths():
+    store = ModelStore()
+    model = _model(1)
+    store.put(model)
+    assert store.get(PARAMS, model.fingerprint) is model
+    assert store.path_for(PARAMS, model.fingerprint) is None
+
+
+def test_persisted_store_prunes_old_versions(tmp_path):
+    store = ModelStore(directory=tmp_path, keep=2)
+    models = [_model(v) for v in range(4)]
+    for version, model in enumerate(models):
+        store.put(model)
+        # Filesystem mtimes are coarse; make the write order explicit.
+        os.utime(store.path_for(PARAMS, model.fingerprint), ns=(version * 10**9, version * 10**9))
+    kept = sorted(tmp_path.rglob("*.npz"))
+    assert kept == sorted(store.path_for(PARAMS, m.fingerprint) for m in models[-2:])
+
+    restarted = ModelStore(directory=tmp_path, keep=2)
+    loaded = restarted.get(PARAMS, models[-1].fingerprint)
+    assert loaded is not None and loaded.fingerprint == models[-1].fingerprint
+    assert restarted.get(PARAMS, models[0].fingerprint) is None
+
+
+def test_latest_follows_the_newest_persisted_fit(tmp_path):
+    # Two analytics workers sharing one model directory.
+    first, second = ModelStore(directory=tmp_path), ModelStore(directory=tmp_path)
+    older, newer = _model(1), _model(2)
+    first.put(older)
+    os.utime(first.path_for(PARAMS, older.fingerprint), ns=(10**9, 10**9))
+    second.put(newer)
+    assert first.latest(PARAMS).fingerprint == newer.fingerprint
+    assert second.latest(PARAMS) is newer
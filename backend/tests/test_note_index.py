@@ -0,0 +1,34 @@
+"""
+Client and note lookups serve from the union index and follow the newest
+file for each (client, note_number).
+"""
+
+
+def test_client_notes_in_note_order(api, write_batch):
+    write_batch("20260101_000000", {0: ["a1", "a2", "a3"], 1: ["b1"]})
+    body = api.get("/notes/lab/C-0001").json()
+    assert body["client_id"] == "C-0001"
+    assert [r["note_number"] for r in body["notes"]] == [1, 2, 3]
+    assert [r["note"] for r in body["notes"]] == ["a1", "a2", "a3"]
+
+    projected = api.get("/notes/lab/C-0002", params={"fields": "note_id"}).json()
+    assert projected["notes"] == [{"note_id": "C-0002-N01"}]
+
+
+def test_note_lookup_follows_newest_file(api, write_batch):
+    write_batch("20260101_000000", {0: ["old one", "old two"]})
+    assert api.get("/notes/C-0001-N02").json()["note"]["note"] == "old two"
+
+    write_batch("20260102_000000", {0: ["new one", "new two", "new three"]})
+    note = api.get("/notes/C-0001-N02").json()["note"]
+    assert note["note"] == "new two"
+    assert note["source_file"] == "batch_notes_eval_20260102_000000.json"
+    assert len(api.get("/notes/lab/C-0001").json()["notes"]) == 3
+
+
+def test_unknown_ids(api, write_batch):
+    write_batch("20260101_000000", {0: ["only"]})
+    assert api.get("/notes/lab/C-0099").json() == {"error": "Unknown client_id: C-0099"}
+    assert api.get("/notes/C-0001-N09").json() == {"error": "Unknown note_id: C-0001-N09"}
+    # Fixed /notes/* routes are not captured by the note_id route.
+    assert "notes" in api.get("/notes/lab").json()
@@ -0,0 +1,96 @@
+"""
+Request coalescing and backpressure: identical concurrent calls share one
+computation, and a full analytics queue answers 503 with Retry-After.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from triage import offload
+from triage.offload import OffloadPool, Overloaded, SingleFlight
+
+
+def test_async_calls_share_one_computation():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"answer": 42}
+
+        tasks = [asyncio.create_task(flight.do_async("k", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        # Nothing is cached once the call returns.
+        again = await flight.do_async("k", compute)
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == [{"answer": 42}] * 5 and results[0] is results[4]
+    assert again == {"answer": 42}
+    assert len(calls) == 2 and flight.leaders == 2 and flight.shared == 4
+
+
+def test_threads_share_errors_and_distinct_keys_do_not_wait():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    outcomes = []
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("k", fail)
+        except ValueError as e:
+            outcomes.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while flight.shared < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert flight.do("other", lambda: "independent") == "independent"
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert outcomes == ["boom"] * 4 and flight.leaders == 2
+
+
+def test_pool_rejects_beyond_max_queue():
+    pool = OffloadPool(workers=0, max_queue=2)
+    release = threading.Event()
+
+    async def main():
+        running = [asyncio.create_task(pool.run(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(Overloaded) as excinfo:
+            await pool.run(lambda: None)
+        release.set()
+        await asyncio.gather(*running)
+        return excinfo.value
+
+    error = asyncio.run(main())
+    assert error.retry_after >= 1 and pool.rejected == 1 and pool.pending == 0
+
+
+def test_full_queue_answers_503(api, write_batch, monkeypatch):
+    write_batch("20260101_000000", {c: ["a", "b", "c", "d"] for c in range(8)})
+    monkeypatch.setattr(offload.analytics_pool, "max_queue", 0)
+    monkeypatch.setattr(offload.analytics_pool, "_mean_s", 2.5)
+    monkeypatch.setattr(offload.analytics_pool, "pending", 3)
+
+    response = api.get("/notes/analytics", params={"n_clusters": 2})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "8"
+    assert "busy" in response.json()["error"]
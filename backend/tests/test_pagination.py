@@ -0,0 +1,73 @@
+"""
+/notes/lab pages the union by (client_id, note_number) keyset cursors,
+projects fields and streams NDJSON with the same rows as the JSON body.
+"""
+
+import json
+
+import pytest
+
+from triage.pagination import decode_cursor, encode_cursor, parse_fields
+
+
+def _clients(n_clients, n_notes):
+    return {c: [f"client {c} note {i}" for i in range(1, n_notes + 1)] for c in range(n_clients)}
+
+
+def test_cursor_pages_cover_the_union_once(api, write_batch):
+    write_batch("20260101_000000", _clients(3, 4))
+    everything = api.get("/notes/lab").json()["notes"]
+    assert len(everything) == 12
+
+    seen, cursor = [], None
+    while True:
+        body = api.get("/notes/lab", params={"limit": 5, **({"cursor": cursor} if cursor else {})}).json()
+        seen += body["notes"]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert [r["note_id"] for r in seen] == [r["note_id"] for r in everything]
+
+
+def test_cursor_is_a_key_not_an_offset(api, write_batch):
+    write_batch("20260101_000000", _clients(3, 2))
+    first = api.get("/notes/lab", params={"limit": 2}).json()
+    assert decode_cursor(first["next_cursor"]) == ("C-0001", 2)
+    # A client that sorts before the cursor must not shift the next page.
+    write_batch("20260102_000000", {-1: ["early note"]})
+    second = api.get("/notes/lab", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [r["note_id"] for r in second["notes"]] == ["C-0002-N01", "C-0002-N02"]
+
+
+def test_cursor_round_trip_and_errors(api, write_batch):
+    assert decode_cursor(encode_cursor(("C-0012", 7))) == ("C-0012", 7)
+    assert encode_cursor(None) is None
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    write_batch("20260101_000000", _clients(1, 1))
+    assert "error" in api.get("/notes/lab", params={"cursor": "not-a-cursor"}).json()
+    assert "error" in api.get("/notes/lab", params={"limit": 0}).json()
+
+
+def test_field_projection(api, write_batch):
+    write_batch("20260101_000000", _clients(2, 2))
+    body = api.get("/notes/lab", params={"fields": "note_id,snippet"}).json()
+    assert [sorted(r) for r in body["notes"]] == [["note_id", "snippet"]] * 4
+    assert "error" in api.get("/notes/lab", params={"fields": "note_id,secret"}).json()
+    assert parse_fields(None) is None
+
+
+def test_ndjson_matches_json(api, write_batch):
+    write_batch("20260101_000000", _clients(3, 3))
+    params = {"limit": 4, "fields": "note_id,client_id"}
+    body = api.get("/notes/lab", params=params).json()
+    response = api.get("/notes/lab", params={**params, "format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0] == {"meta": body["meta"]}
+    assert lines[1:-1] == body["notes"]
+    assert lines[-1] == {"next_cursor": body["next_cursor"]}
+
+    accept = api.get("/notes/lab", params=params, headers={"Accept": "application/x-ndjson"})
+    assert accept.text == response.text
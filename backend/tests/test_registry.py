@@ -0,0 +1,81 @@
+"""
+Corpus registry: corpora share a memory budget and the least recently used
+idle corpus is released first.
+"""
+
+import json
+
+import pytest
+
+from triage.registry import CorpusRegistry, parse_corpora
+
+
+@pytest.fixture
+def registry(tmp_path):
+    specs = {}
+    for name in ("a", "b", "c"):
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / "batch_notes_eval_20260101_000000.json").write_text(json.dumps([
+            {"child_index": c, "gpt_deltas": [1, 0, 2], "generator_result": {"data": {"notes": [
+                {"note_number": n, "note_text": f"{name} client {c} note {n} " * 20} for n in range(1, 5)
+            ]}}}
+            for c in range(30)
+        ]))
+        specs[name] = (str(directory), "batch_notes_eval_*.json")
+    return CorpusRegistry(specs, budget_bytes=0)
+
+
+def _touch(registry, name):
+    with registry.use(name) as corpus:
+        corpus.sync()
+
+
+def _resident(registry):
+    return sorted(c.name for c in registry.resident())
+
+
+def test_least_recently_used_idle_corpus_is_released(registry):
+    for name in ("a", "b", "c"):
+        _touch(registry, name)
+    size = max(c.resident_bytes() for c in registry.corpora())
+    registry.budget_bytes = int(2.5 * size)
+
+    assert registry.enforce_budget() == ["a"]
+    assert _resident(registry) == ["b", "c"] and registry.get("a").released == 1
+
+    _touch(registry, "a")          # rebuilt on use; now "b" is the coldest
+    assert _resident(registry) == ["a", "c"] and registry.get("b").released == 1
+    _touch(registry, "c")
+    assert _resident(registry) == ["a", "c"]
+
+
+def test_corpus_in_use_is_never_released(registry):
+    with registry.use("a") as a:
+        a.sync()
+        _touch(registry, "b")
+        registry.budget_bytes = 1
+        _touch(registry, "c")
+        # "a" is serving a request; "b" is idle and colder than "c".
+        assert _resident(registry) == ["a", "c"]
+    # Once idle, "a" goes too: recency is by request start, and the most
+    # recent corpus stays even though it alone is over budget.
+    assert _resident(registry) == ["c"]
+
+
+def test_budget_is_split_between_processes():
+    registry = CorpusRegistry({}, budget_bytes=1000, processes=4)
+    assert (registry.total_budget_bytes, registry.budget_bytes) == (1000, 250)
+    assert CorpusRegistry({}, budget_bytes=0).enforce_budget() == []
+
+
+def test_parse_corpora_and_unknown_names():
+    assert parse_corpora('{"x": "/data/x", "y": {"dir": "/data/y", "glob": "*.json"}}') == {
+        "x": ("/data/x", "batch_notes_eval_*.json"),
+        "y": ("/data/y", "*.json"),
+    }
+    assert parse_corpora("  ") == {}
+    with pytest.raises(ValueError):
+        parse_corpora('{"x": {}}')
+    with pytest.raises(ValueError):
+        CorpusRegistry({}).get("nope")
@@ -0,0 +1,113 @@
+"""
+BM25 search: every query path ranks like a brute-force scorer, filters and
+`match=all` narrow the matches, and highlights point at the query terms.
+"""
+
+import json
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from triage.registry import Corpus
+from triage.search import SEARCH_BM25_B, SEARCH_BM25_K1, highlight_snippet, search_tokens
+
+WORDS = [f"w{i}" for i in range(60)]
+
+
+@pytest.fixture(scope="module")
+def zipf_corpus(tmp_path_factory):
+    """
+    2000 notes over a Zipf-weighted vocabulary, so queries mix rare terms
+    with terms in most notes.
+    """
+    rng = np.random.default_rng(14)
+    weights = 1.0 / np.arange(1, len(WORDS) + 1)
+    weights /= weights.sum()
+    children = [
+        {"child_index": c, "generator_result": {"data": {"notes": [
+            {"note_number": n, "note_text": " ".join(rng.choice(WORDS, size=rng.integers(5, 40), p=weights))}
+            for n in range(1, 11)
+        ]}}}
+        for c in range(200)
+    ]
+    directory = tmp_path_factory.mktemp("zipf")
+    (directory / "batch_notes_eval_20260101_000000.json").write_text(json.dumps(children))
+    corpus = Corpus("zipf", str(directory), "batch_notes_eval_*.json")
+    corpus.search_index.refresh()
+    return corpus
+
+
+def _reference(rows, query, match="any"):
+    """
+    (note_id, score) for every match, best first, ties by note_id.
+    """
+    docs = [Counter(search_tokens(r["note"])) for r in rows]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    terms = list(dict.fromkeys(search_tokens(query)))
+    df = {t: sum(1 for d in docs if t in d) for t in terms}
+    out = []
+    for row, doc in zip(rows, docs):
+        present = [t for t in terms if t in doc]
+        if not present or (match == "all" and len(present) < len(terms)):
+            continue
+        norm = SEARCH_BM25_K1 * (1.0 - SEARCH_BM25_B + SEARCH_BM25_B * sum(doc.values()) / avgdl)
+        score = 0.0
+        for t in present:
+            idf = math.log1p((len(docs) - df[t] + 0.5) / (df[t] + 0.5))
+            score += idf * doc[t] * (SEARCH_BM25_K1 + 1.0) / (doc[t] + norm)
+        out.append((row["note_id"], score))
+    return sorted(out, key=lambda x: (-x[1], x[0]))
+
+
+@pytest.mark.parametrize("query", ["w59", "w40 w55", "w0", "w0 w1 w2", "w3 w57", "w1 w20 w45 w59"])
+@pytest.mark.parametrize("match", ["any", "all"])
+def test_ranking_matches_brute_force(zipf_corpus, query, match):
+    index = zipf_corpus.search_index
+    rows, _ = zipf_corpus.incremental.union()
+    expected = _reference(rows, query, match)
+
+    for limit, offset in ((10, 0), (25, 5), (5, 400)):
+        total, hits = index.search(query, limit=limit, offset=offset, match=match)
+        assert total == len(expected)
+        want = expected[offset:offset + limit]
+        assert [r["note_id"] for r, _ in hits] == [n for n, _ in want]
+        assert [s for _, s in hits] == pytest.approx([s for _, s in want], rel=1e-9)
+
+
+def test_filters_and_updates(write_batch):
+    write_batch("20260101_000000", {0: ["cat sat", "dog ran"]}, archetype="fast")
+    write_batch("20260102_000000", {1: ["cat ran far"]}, archetype="slow")
+    corpus = Corpus("test", str(write_batch.directory), "batch_notes_eval_*.json")
+    index = corpus.search_index
+    index.refresh()
+
+    total, hits = index.search("cat", filters={"archetype": "slow"})
+    assert total == 1 and hits[0][0]["note_id"] == "C-0002-N01"
+    assert index.search("cat", filters={"archetype": "unknown"}) == (0, [])
+    assert index.search("cat ran", match="all")[0] == 1
+    assert index.search("cat zebra", match="all") == (0, [])
+
+    # A newer file replaces C-0001-N01; only the new text is searchable.
+    write_batch("20260103_000000", {0: ["zebra sat", "dog ran"]}, archetype="fast")
+    assert index.refresh() == 1
+    assert [r["note_id"] for r, _ in index.search("cat")[1]] == ["C-0002-N01"]
+    assert [r["note_id"] for r, _ in index.search("zebra")[1]] == ["C-0001-N01"]
+    assert index.stats()["docs"] == 3
+
+
+def test_phonemes_are_their_own_tokens():
+    assert search_tokens("Practiced /k, g/ in key and cat") == [
+        "practiced", "k", "g", "in", "key", "and", "cat", "/k/", "/g/",
+    ]
+
+
+def test_highlight_offsets_point_at_terms():
+    text = "Session 3.\nWorked on /k/ in CV words; Kite and key were accurate.\n" + "filler " * 40 + "more /k/ work"
+    snippet, highlights = highlight_snippet(text, "/k/ key", max_chars=80)
+    assert len(snippet) <= 82 and "\n" not in snippet
+    assert [snippet[a:b].lower() for a, b in highlights] == ["/k/", "key"]
+
+    snippet, highlights = highlight_snippet("nothing to see", "zebra")
+    assert snippet == "nothing to see" and highlights == []